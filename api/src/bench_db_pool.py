@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark for the hot API queries: a new connection per request (how
+the psycopg2 endpoints worked) against the shared asyncpg pool with cached
+prepared statements.
+
+Usage (inside the api container): python -m app.bench_db_pool [--requests 200] [--concurrency 8]
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Awaitable, Callable, Dict, List
+
+import asyncpg
+
+from app.routes.database import DATABASE_URL, DB_STATEMENT_CACHE_SIZE
+from app.routes.search import EXACT_SEARCH_QUERY, PREFIX_SEARCH_QUERY
+from app.routes.code import FUNCTION_CODE_QUERY
+from app.routes.stacktrace import FRAMES_QUERY
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def sample_arguments(conn: asyncpg.Connection) -> Dict[str, tuple]:
+    """Real keys from the database so every query returns rows"""
+    function = await conn.fetchrow("""
+    SELECT f.id, f.function_name, fl.filepath
+    FROM functions f
+    JOIN files fl ON f.file_id = fl.id
+    JOIN code_chunks cc ON cc.function_id = f.id AND cc.chunk_type = 'main'
+    ORDER BY f.id
+    LIMIT 1
+    """)
+    if not function:
+        raise SystemExit("❌ No parsed functions in the database - nothing to benchmark")
+    return {
+        'search (exact)': (EXACT_SEARCH_QUERY, (function['function_name'], 20)),
+        'search (fuzzy)': (PREFIX_SEARCH_QUERY, ('validat:*', 20, 'block', None, None)),
+        'code': (FUNCTION_CODE_QUERY, (function['id'],)),
+        'analyze frame': (FRAMES_QUERY, ([function['filepath']], [function['function_name']])),
+    }
+
+
+async def run_load(execute: Callable[[], Awaitable[None]], requests: int, concurrency: int) -> List[float]:
+    """Latency in ms of each request, with `concurrency` requests in flight"""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await execute()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+async def main(args):
+    pool = await asyncpg.create_pool(DATABASE_URL, min_size=args.concurrency, max_size=args.concurrency,
+                                     statement_cache_size=DB_STATEMENT_CACHE_SIZE)
+    try:
+        async with pool.acquire() as conn:
+            queries = await sample_arguments(conn)
+
+        print(f"📊 {args.requests} requests per query, concurrency {args.concurrency}")
+        print(f"{'query':<16} {'mode':<20} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+        for name, (query, params) in queries.items():
+
+            async def per_request():
+                conn = await asyncpg.connect(DATABASE_URL, statement_cache_size=0)
+                try:
+                    await conn.fetch(query, *params)
+                finally:
+                    await conn.close()
+
+            async def pooled():
+                async with pool.acquire() as conn:
+                    await conn.fetch(query, *params)
+
+            # Warm up the pool so the statement cache is populated
+            await run_load(pooled, args.concurrency, args.concurrency)
+
+            for mode, execute in (('connect per request', per_request), ('pooled + prepared', pooled)):
+                start = time.perf_counter()
+                latencies = await run_load(execute, args.requests, args.concurrency)
+                elapsed = time.perf_counter() - start
+                print(f"{name:<16} {mode:<20} {statistics.median(latencies):>8.2f} "
+                      f"{percentile(latencies, 99):>8.2f} {args.requests / elapsed:>8.1f}")
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Connect-per-request vs pooled latency for the hot API queries")
+    parser.add_argument('--requests', type=int, default=200, help="requests per query and mode")
+    parser.add_argument('--concurrency', type=int, default=8, help="requests in flight")
+    asyncio.run(main(parser.parse_args()))
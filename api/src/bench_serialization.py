@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for large result sets: a Pydantic SearchResult per
+row (the /search path), a dict per row (the /functions path) and the
+column-oriented JSON and MessagePack responses built straight from the
+records. Rows are fetched once; only the response building is timed.
+
+Usage (inside the api container): python -m app.bench_serialization [--rows 10000] [--repeat 20]
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+
+from app.routes.database import DATABASE_URL
+from app.routes.models import SearchResult
+from app.routes.search import SEARCH_COLUMNS, SEARCH_RESULT_COLUMNS
+from app.routes.columnar import columns, encode_columns
+from app.bench_db_pool import percentile
+
+SAMPLE_QUERY = f"""
+SELECT {SEARCH_COLUMNS}
+FROM code_chunks cc
+JOIN functions f ON cc.function_id = f.id
+JOIN files ON f.file_id = files.id
+WHERE cc.summary IS NOT NULL
+ORDER BY cc.id
+LIMIT $1
+"""
+
+
+def render_json(content) -> bytes:
+    # What FastAPI's JSONResponse does with the encoded content
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def per_model(rows: List[asyncpg.Record]) -> bytes:
+    return render_json(jsonable_encoder([SearchResult(**dict(row), type="chunk") for row in rows]))
+
+
+def per_dict(rows: List[asyncpg.Record]) -> bytes:
+    return render_json(jsonable_encoder([dict(row) for row in rows]))
+
+
+def columnar_json(rows: List[asyncpg.Record]) -> bytes:
+    return encode_columns(columns(rows, SEARCH_RESULT_COLUMNS), "columns")
+
+
+def columnar_msgpack(rows: List[asyncpg.Record]) -> bytes:
+    return encode_columns(columns(rows, SEARCH_RESULT_COLUMNS), "msgpack")
+
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        rows = await conn.fetch(SAMPLE_QUERY, args.rows)
+    finally:
+        await conn.close()
+    if not rows:
+        raise SystemExit("❌ No summarized chunks in the database - nothing to benchmark")
+
+    modes: List[tuple] = [('pydantic', per_model), ('dict', per_dict), ('columns', columnar_json)]
+    try:
+        import msgpack  # noqa: F401
+        modes.append(('msgpack', columnar_msgpack))
+    except ImportError:
+        print("⚠️  msgpack not installed - skipping MessagePack")
+
+    print(f"📊 {len(rows)} rows, {args.repeat} runs per mode")
+    print(f"{'mode':<10} {'p50 ms':>8} {'p99 ms':>8} {'µs/row':>8} {'KiB':>8}")
+    for mode, serialize in modes:
+        serialize(rows)  # warm up
+        latencies, size = [], 0
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            size = len(serialize(rows))
+            latencies.append((time.perf_counter() - start) * 1000)
+        median = statistics.median(latencies)
+        print(f"{mode:<10} {median:>8.2f} {percentile(latencies, 99):>8.2f} "
+              f"{median * 1000 / len(rows):>8.2f} {size / 1024:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-row vs columnar response serialization time")
+    parser.add_argument('--rows', type=int, default=10000, help="rows serialized per run")
+    parser.add_argument('--repeat', type=int, default=20, help="runs per mode")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Stacktrace resolution benchmark: one prepared query per frame (how /analyze
+and /summarize used to work) against the single unnest-based FRAMES_QUERY,
+on synthetic traces built from real functions plus a share of unknown frames.
+
+Usage (inside the api container): python -m app.bench_stacktrace [--frames 100] [--traces 50]
+"""
+
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from typing import List, Tuple
+
+import asyncpg
+
+from app.routes.database import DATABASE_URL
+from app.routes.stacktrace import FRAMES_QUERY
+from app.bench_db_pool import percentile
+
+# The former per-frame query, kept here as the baseline
+PER_FRAME_QUERY = """
+    SELECT
+        f.function_name,
+        f.id,
+        f.visibility,
+        f.is_static,
+        f.cyclomatic_complexity,
+        f.parameter_count,
+        f.lines_of_code,
+        COUNT(c.id) as chunk_count,
+        ARRAY_AGG(DISTINCT c.chunk_type) FILTER (WHERE c.chunk_type IS NOT NULL) as chunk_types,
+        MAX(c.nesting_level) as max_nesting
+    FROM functions f
+    JOIN files fl ON f.file_id = fl.id
+    LEFT JOIN code_chunks c ON f.id = c.function_id
+    WHERE fl.filepath = $1 AND f.function_name = $2
+    GROUP BY f.id
+"""
+
+
+async def sample_traces(conn: asyncpg.Connection, frames: int, traces: int, missing: float,
+                        seed: int) -> List[List[Tuple[str, str]]]:
+    rows = await conn.fetch("""
+    SELECT fl.filepath, f.function_name
+    FROM functions f
+    JOIN files fl ON f.file_id = fl.id
+    ORDER BY md5(f.id::text)
+    LIMIT 5000
+    """)
+    if not rows:
+        raise SystemExit("❌ No parsed functions in the database - nothing to benchmark")
+    rng = random.Random(seed)
+    known = [(row['filepath'], row['function_name']) for row in rows]
+    return [
+        [(f"src/Missing{i}.php", "notThere") if rng.random() < missing else rng.choice(known)
+         for i in range(frames)]
+        for _ in range(traces)
+    ]
+
+
+async def per_frame(conn: asyncpg.Connection, trace: List[Tuple[str, str]]) -> int:
+    statement = await conn.prepare(PER_FRAME_QUERY)
+    found = 0
+    for filepath, function in trace:
+        if await statement.fetchrow(filepath, function):
+            found += 1
+    return found
+
+
+async def set_based(conn: asyncpg.Connection, trace: List[Tuple[str, str]]) -> int:
+    filepaths, functions = zip(*trace)
+    rows = await conn.fetch(FRAMES_QUERY, list(filepaths), list(functions))
+    return sum(1 for row in rows if row['id'] is not None)
+
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        traces = await sample_traces(conn, args.frames, args.traces, args.missing, args.seed)
+        print(f"📊 {args.traces} traces of {args.frames} frames ({args.missing:.0%} unknown)")
+        print(f"{'mode':<14} {'p50 ms':>8} {'p99 ms':>8} {'resolved':>9}")
+
+        for mode, resolve in (('per frame', per_frame), ('set-based', set_based)):
+            # Warm up plans and caches
+            await resolve(conn, traces[0])
+            latencies, resolved = [], 0
+            for trace in traces:
+                start = time.perf_counter()
+                resolved += await resolve(conn, trace)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"{mode:<14} {statistics.median(latencies):>8.2f} {percentile(latencies, 99):>8.2f} {resolved:>9}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-frame vs set-based stacktrace resolution latency")
+    parser.add_argument('--frames', type=int, default=100, help="frames per trace")
+    parser.add_argument('--traces', type=int, default=50, help="traces per mode")
+    parser.add_argument('--missing', type=float, default=0.1, help="share of frames that match no function")
+    parser.add_argument('--seed', type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
@@ -1,14 +1,26 @@
 
 from .health import router as health_router
-# from .stats import router as stats_router
-# from .functions import router as functions_router
-# from .search import router as search_router
-# from .stacktrace import router as stacktrace_router
+from .stats import router as stats_router
+from .functions import router as functions_router
+from .search import router as search_router
+from .stacktrace import router as stacktrace_router
+from .code import router as code_router
+from .chunks import router as chunks_router
+from .summaries import router as summaries_router
+from .assessments import router as assessments_router
+from .autocomplete import router as autocomplete_router
+from .ingest import router as ingest_router
 
 routers = [
     health_router,
-    # stats_router,
-    # functions_router,
-    # search_router,
-    # stacktrace_router,
+    stats_router,
+    functions_router,
+    search_router,
+    stacktrace_router,
+    code_router,
+    chunks_router,
+    summaries_router,
+    assessments_router,
+    autocomplete_router,
+    ingest_router,
 ]
@@ -1,58 +1,164 @@
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request, Response
+
+from .cache import cached
+from .columnar import columns, columns_response, wants_columns
+from .database import get_pool
+from .pagination import Keyset, keyset_filter, ndjson_response, page, wants_ndjson
 
 router = APIRouter(prefix="", tags=["assesments"])
 
+RISK_LEVELS = ("high", "medium", "low")
+
+MIGRATION_RISK = """
+    CASE
+        WHEN f.cyclomatic_complexity > 10 OR f.lines_of_code > 100 THEN 'high'
+        WHEN f.cyclomatic_complexity > 5 OR f.lines_of_code > 50 THEN 'medium'
+        ELSE 'low'
+    END
+"""
+
+# Same expressions as idx_functions_complexity_keyset
+ASSESSMENT_KEYSET = Keyset(("COALESCE(f.cyclomatic_complexity, 0)", "COALESCE(f.lines_of_code, 0)", "f.id"),
+                           ("int", "int", "int"))
+
+ASSESSMENT_QUERY = f"""
+    SELECT
+        f.function_name,
+        f.cyclomatic_complexity,
+        f.lines_of_code,
+        f.parameter_count,
+        s.chunk_count,
+        s.max_nesting,
+        {MIGRATION_RISK} as migration_risk,
+        {ASSESSMENT_KEYSET.select()}
+    FROM functions f
+    CROSS JOIN LATERAL (
+        SELECT COUNT(c.id) as chunk_count, MAX(c.nesting_level) as max_nesting
+        FROM code_chunks c
+        WHERE c.function_id = f.id
+    ) s
+    WHERE ($1::text IS NULL OR {MIGRATION_RISK} = $1) AND {{after}}
+    ORDER BY {ASSESSMENT_KEYSET.order_by()}
+    {{limit}}
+"""
+
+RISK_COUNTS_QUERY = f"""
+    SELECT {MIGRATION_RISK} as migration_risk, COUNT(*) as count
+    FROM functions f
+    GROUP BY 1
+"""
+
+
+def assessment_item(row) -> dict:
+    return {
+        "name": row["function_name"],
+        "complexity": row["cyclomatic_complexity"],
+        "lines": row["lines_of_code"],
+        "parameters": row["parameter_count"],
+        "chunks": row["chunk_count"],
+        "max_nesting": row["max_nesting"],
+        "migration_risk": row["migration_risk"],
+    }
+
+
+# Record key -> name in the columnar response, same names as assessment_item
+ASSESSMENT_COLUMNS = {
+    "function_name": "name",
+    "cyclomatic_complexity": "complexity",
+    "lines_of_code": "lines",
+    "parameter_count": "parameters",
+    "chunk_count": "chunks",
+    "max_nesting": "max_nesting",
+    "migration_risk": "migration_risk",
+}
+
+
+def assessment_query(risk: Optional[str], cursor: Optional[str], args: list, limit: Optional[int] = None) -> str:
+    args.append(risk)
+    after = keyset_filter(ASSESSMENT_KEYSET, cursor, args)
+    limit_clause = ""
+    if limit is not None:
+        args.append(limit)
+        limit_clause = f"LIMIT ${len(args)}"
+    return ASSESSMENT_QUERY.format(after=after, limit=limit_clause)
+
 
 # Migration assessment endpoint
 @router.get("/migration/assessment")
-def migration_assessment():
-    """Generate migration complexity assessment"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            f.function_name,
-            f.cyclomatic_complexity,
-            f.lines_of_code,
-            f.parameter_count,
-            COUNT(c.id) as chunk_count,
-            MAX(c.nesting_level) as max_nesting,
-            CASE 
-                WHEN f.cyclomatic_complexity > 10 OR f.lines_of_code > 100 THEN 'high'
-                WHEN f.cyclomatic_complexity > 5 OR f.lines_of_code > 50 THEN 'medium'
-                ELSE 'low'
-            END as migration_risk
-        FROM functions f
-        LEFT JOIN code_chunks c ON f.id = c.function_id
-        GROUP BY f.id, f.function_name, f.cyclomatic_complexity, f.lines_of_code, f.parameter_count
-        ORDER BY f.cyclomatic_complexity DESC, f.lines_of_code DESC
-    """)
-
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    # Group by risk level
-    risk_groups = {"high": [], "medium": [], "low": []}
-    
-    for row in results:
-        risk_level = row[6]
-        function_data = {
-            "name": row[0],
-            "complexity": row[1],
-            "lines": row[2], 
-            "parameters": row[3],
-            "chunks": row[4],
-            "max_nesting": row[5]
+@cached()
+async def migration_assessment(limit: int = Query(100, ge=1, le=1000)):
+    """Generate migration complexity assessment
+
+    Counts cover every function; each risk group lists its first `limit`
+    functions, continued via /migration/assessment/functions with the
+    group's cursor.
+    """
+    async with get_pool().acquire() as conn:
+        counts = {row["migration_risk"]: row["count"] for row in await conn.fetch(RISK_COUNTS_QUERY)}
+
+        risk_groups, next_cursors = {}, {}
+        for risk_level in RISK_LEVELS:
+            args = []
+            rows = await conn.fetch(assessment_query(risk_level, None, args, limit + 1), *args)
+            group = page(ASSESSMENT_KEYSET, rows, limit, assessment_item)
+            risk_groups[risk_level] = group["items"]
+            next_cursors[risk_level] = group["next_cursor"]
+
+        return {
+            "migration_assessment": risk_groups,
+            "next_cursors": next_cursors,
+            "summary": {
+                "high_risk_count": counts.get("high", 0),
+                "medium_risk_count": counts.get("medium", 0),
+                "low_risk_count": counts.get("low", 0)
+            }
         }
-        risk_groups[risk_level].append(function_data)
-    
+
+
+@cached()
+async def assessment_page(risk: Optional[str], limit: int, cursor: Optional[str]):
+    args = []
+    query = assessment_query(risk, cursor, args, limit + 1)
+    async with get_pool().acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    return page(ASSESSMENT_KEYSET, rows, limit, assessment_item)
+
+
+@cached()
+async def assessment_columns(risk: Optional[str], limit: int, cursor: Optional[str]):
+    args = []
+    query = assessment_query(risk, cursor, args, limit + 1)
+    async with get_pool().acquire() as conn:
+        rows = await conn.fetch(query, *args)
     return {
-        "migration_assessment": risk_groups,
-        "summary": {
-            "high_risk_count": len(risk_groups["high"]),
-            "medium_risk_count": len(risk_groups["medium"]), 
-            "low_risk_count": len(risk_groups["low"])
-        }
+        "page": columns(rows[:limit], ASSESSMENT_COLUMNS),
+        "next_cursor": ASSESSMENT_KEYSET.cursor(rows[limit - 1]) if len(rows) > limit else None,
     }
+
+
+@router.get("/migration/assessment/functions")
+async def migration_assessment_functions(
+    request: Request,
+    response: Response,
+    risk: Optional[str] = Query(None, pattern="^(high|medium|low)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson|columns|msgpack)$")
+):
+    """Assessed functions, most complex first, keyset-paginated, streamed as NDJSON or as column arrays"""
+    if wants_ndjson(request, format):
+        args = []
+        return ndjson_response(assessment_query(risk, cursor, args), args, assessment_item)
+
+    kind = wants_columns(request, format)
+    if kind:
+        result = await assessment_columns(risk=risk, limit=limit, cursor=cursor)
+        headers = {"X-Next-Cursor": result["next_cursor"]} if result["next_cursor"] else None
+        return columns_response(result["page"], kind, headers)
+
+    result = await assessment_page(risk=risk, limit=limit, cursor=cursor)
+    if result["next_cursor"]:
+        response.headers["X-Next-Cursor"] = result["next_cursor"]
+    return result
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+
+from .models import AutocompleteResult
+from .symbols import KIND_ORDER, symbol_index
+
+router = APIRouter(prefix="", tags=["autocomplete"])
+
+
+@router.get("/autocomplete", response_model=List[AutocompleteResult])
+async def autocomplete(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    kinds: Optional[str] = Query(None, description="comma separated subset of function,class,file"),
+    fuzzy: bool = True,
+):
+    """Prefix matches on function, class and file names, topped up with typo-tolerant matches"""
+    snapshot = symbol_index.snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Symbol index is still loading")
+
+    wanted = None
+    if kinds:
+        wanted = {k.strip() for k in kinds.split(",") if k.strip()}
+        unknown = wanted - set(KIND_ORDER)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown kinds: {', '.join(sorted(unknown))}")
+
+    matches = snapshot.prefix(q, limit, wanted)
+    if fuzzy and len(matches) < limit and len(q) >= 3:
+        matches += snapshot.fuzzy(q, limit - len(matches), wanted, exclude={symbol for symbol, _ in matches})
+
+    return [AutocompleteResult(kind=symbol.kind, name=symbol.name, detail=symbol.detail, filepath=symbol.filepath,
+                               function_id=symbol.function_id, score=score)
+            for symbol, score in matches]
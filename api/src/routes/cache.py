@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import asyncpg
+from fastapi.encoders import jsonable_encoder
+
+from .database import DATABASE_URL
+
+# Backstop only - entries are dropped as soon as parser or enricher writes land
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+# Optional shared tier for several API workers, e.g. redis://redis:6379/0
+REDIS_URL = os.getenv("REDIS_URL", "")
+CACHE_CHANNEL = "cache_invalidate"
+REDIS_HASH = "codeanalysis:responses"
+
+
+class ResponseCache:
+    """TTL/LRU cache for aggregate responses with single-flight computation
+
+    Writes to files, functions and code_chunks NOTIFY on CACHE_CHANNEL (see
+    init_v2.sql); the listener clears both tiers. Results computed across an
+    invalidation are returned but not stored, and a lost listener connection
+    clears everything before it resumes.
+    """
+
+    def __init__(self):
+        self.local: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.generation = 0
+        self.redis = None
+        self.stats = {"hits": 0, "redis_hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0}
+        self._listener: Optional[asyncio.Task] = None
+        self._redis_delete_pending = False
+
+    async def _redis_get(self, key: str) -> Optional[Any]:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.hget(REDIS_HASH, key)
+        except Exception as e:
+            print(f"⚠️  Redis cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        expires_at, value = json.loads(raw)
+        return value if expires_at > time.time() else None
+
+    async def _redis_set(self, key: str, value: Any, expires_at: float):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hset(REDIS_HASH, key, json.dumps([expires_at, value]))
+        except Exception as e:
+            print(f"⚠️  Redis cache write failed: {e}")
+
+    def _store_local(self, key: str, value: Any, expires_at: float):
+        self.local[key] = (expires_at, value)
+        self.local.move_to_end(key)
+        while len(self.local) > CACHE_MAX_ENTRIES:
+            self.local.popitem(last=False)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], ttl: float = CACHE_TTL) -> Any:
+        entry = self.local.get(key)
+        if entry is not None and entry[0] > time.time():
+            self.local.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+        # Identical requests arriving while one is computed share its result
+        pending = self.inflight.get(key)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        generation = self.generation
+        try:
+            value = await self._redis_get(key)
+            if value is not None:
+                self.stats["redis_hits"] += 1
+                expires_at = time.time() + ttl
+            else:
+                self.stats["misses"] += 1
+                value = jsonable_encoder(await compute())
+                expires_at = time.time() + ttl
+                if generation == self.generation:
+                    await self._redis_set(key, value, expires_at)
+            if generation == self.generation:
+                self._store_local(key, value, expires_at)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody may be waiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+    def invalidate(self):
+        self.generation += 1
+        self.stats["invalidations"] += 1
+        self.local.clear()
+        # Enrichment notifies per statement; one pending Redis delete covers a burst
+        if self.redis is not None and not self._redis_delete_pending:
+            self._redis_delete_pending = True
+            asyncio.get_running_loop().create_task(self._clear_redis())
+
+    async def _clear_redis(self):
+        try:
+            await self.redis.delete(REDIS_HASH)
+        except Exception as e:
+            print(f"⚠️  Redis cache invalidation failed: {e}")
+        finally:
+            self._redis_delete_pending = False
+
+    async def _listen(self):
+        """Hold a dedicated LISTEN connection, reconnecting (and clearing) when it drops"""
+        while True:
+            try:
+                conn = await asyncpg.connect(DATABASE_URL)
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"⚠️  Cache invalidation listener cannot connect: {e}")
+                await asyncio.sleep(5)
+                continue
+            try:
+                await conn.add_listener(CACHE_CHANNEL, self._on_notify)
+                # Writes may have happened while nobody was listening
+                self.invalidate()
+                while True:
+                    await asyncio.sleep(5)
+                    # Keepalive - a silently dropped connection only shows on I/O
+                    await conn.execute("SELECT 1")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f"⚠️  Cache invalidation listener lost its connection: {e}")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.invalidate()
+
+    async def start(self):
+        if REDIS_URL:
+            import redis.asyncio as aioredis
+            self.redis = aioredis.from_url(REDIS_URL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+
+response_cache = ResponseCache()
+
+
+def cached(ttl: float = CACHE_TTL):
+    """Cache an endpoint's response keyed by its name and query parameters
+
+    The endpoint should acquire its connection from the pool itself, so cache
+    hits do not hold a pooled connection.
+    """
+    def decorator(endpoint):
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            key = f"{endpoint.__module__}.{endpoint.__name__}:{json.dumps(kwargs, sort_keys=True, default=str)}"
+            return await response_cache.get_or_compute(key, lambda: endpoint(*args, **kwargs), ttl)
+        return wrapper
+    return decorator
@@ -1,60 +1,156 @@
-from fastapi import APIRouter
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncpg
+
+from .cache import cached
+from .database import get_async_db, get_pool
+from .models import SimilarChunkResult
+from .search import ANN_SETTINGS_QUERY, SEARCH_COLUMNS, SEMANTIC_EF_SEARCH, SEMANTIC_PROBES
 
 router = APIRouter(prefix="", tags=["chunks"])
 
+# Nearest chunks to a stored chunk embedding, through the HNSW/IVFFlat index;
+# $4 excludes the chunk's own function (NULL keeps it)
+SIMILAR_CHUNKS_QUERY = f"""
+WITH nearest AS MATERIALIZED (
+    SELECT {SEARCH_COLUMNS},
+        cc.chunk_type,
+        cc.embedding <=> $1::vector as distance
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    WHERE cc.embedding IS NOT NULL
+    AND cc.summary IS NOT NULL
+    AND cc.id <> $3
+    AND ($4::int IS NULL OR cc.function_id <> $4)
+    ORDER BY cc.embedding <=> $1::vector
+    LIMIT $2
+)
+SELECT * FROM nearest ORDER BY distance
+"""
+
 # Chunk analysis endpoints
 @router.get("/chunks/analysis")
-def chunk_analysis():
+@cached()
+async def chunk_analysis():
     """Analyze chunk types and nesting patterns"""
-    conn = get_db()
-    cursor = conn.cursor()
+    async with get_pool().acquire() as conn:
+        # Chunk type distribution
+        type_rows = await conn.fetch("""
+            SELECT 
+                chunk_type, 
+                COUNT(*) as count,
+                AVG(nesting_level) as avg_nesting,
+                MAX(nesting_level) as max_nesting
+            FROM code_chunks 
+            GROUP BY chunk_type 
+            ORDER BY count DESC
+        """)
     
-    # Chunk type distribution
-    cursor.execute("""
-        SELECT 
-            chunk_type, 
-            COUNT(*) as count,
-            AVG(nesting_level) as avg_nesting,
-            MAX(nesting_level) as max_nesting
-        FROM code_chunks 
-        GROUP BY chunk_type 
-        ORDER BY count DESC
-    """)
+        chunk_types = [
+            {
+                "type": row["chunk_type"],
+                "count": row["count"], 
+                "avg_nesting": round(float(row["avg_nesting"] or 0), 2),
+                "max_nesting": row["max_nesting"]
+            }
+            for row in type_rows
+        ]
     
-    chunk_types = [
-        {
-            "type": row[0],
-            "count": row[1], 
-            "avg_nesting": round(float(row[2]), 2),
-            "max_nesting": row[3]
-        }
-        for row in cursor.fetchall()
-    ]
+        # Nesting level distribution
+        nesting_rows = await conn.fetch("""
+            SELECT 
+                nesting_level,
+                COUNT(*) as count,
+                ARRAY_AGG(DISTINCT chunk_type) as chunk_types
+            FROM code_chunks 
+            GROUP BY nesting_level 
+            ORDER BY nesting_level
+        """)
     
-    # Nesting level distribution
-    cursor.execute("""
-        SELECT 
-            nesting_level,
-            COUNT(*) as count,
-            ARRAY_AGG(DISTINCT chunk_type) as chunk_types
-        FROM code_chunks 
-        GROUP BY nesting_level 
-        ORDER BY nesting_level
-    """)
+        nesting_levels = [
+            {
+                "level": row["nesting_level"],
+                "count": row["count"],
+                "chunk_types": row["chunk_types"]
+            }
+            for row in nesting_rows
+        ]
     
-    nesting_levels = [
-        {
-            "level": row[0],
-            "count": row[1],
-            "chunk_types": row[2]
+        return {
+            "chunk_types": chunk_types,
+            "nesting_levels": nesting_levels
         }
-        for row in cursor.fetchall()
-    ]
-    
-    cursor.close()
-    conn.close()
-    
-    return {
-        "chunk_types": chunk_types,
-        "nesting_levels": nesting_levels
-    }
+
+
+@router.get("/chunks/{chunk_id}/similar", response_model=List[SimilarChunkResult])
+async def similar_chunks(
+    chunk_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    same_function: bool = Query(False, description="include chunks of the chunk's own function"),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000, description="HNSW recall/latency override"),
+    conn: asyncpg.Connection = Depends(get_async_db)
+):
+    """Chunks whose embeddings are closest to this chunk's - where else is code like this?"""
+    source = await conn.fetchrow(
+        "SELECT function_id, embedding::text as embedding FROM code_chunks WHERE id = $1", chunk_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    if source["embedding"] is None:
+        raise HTTPException(status_code=404, detail="Chunk has no embedding yet")
+
+    async with conn.transaction():
+        await conn.execute(ANN_SETTINGS_QUERY, str(max(ef_search or SEMANTIC_EF_SEARCH, limit)), str(SEMANTIC_PROBES))
+        rows = await conn.fetch(SIMILAR_CHUNKS_QUERY, source["embedding"], limit, chunk_id,
+                                None if same_function else source["function_id"])
+    return [SimilarChunkResult(**dict(row), type="chunk") for row in rows]
+
+
+@router.get("/chunks/duplicates")
+async def duplicate_clusters(
+    limit: int = Query(50, ge=1, le=1000),
+    min_functions: int = Query(2, ge=2),
+    conn: asyncpg.Connection = Depends(get_async_db)
+):
+    """Near-duplicate clusters found by python-enricher/src/duplicates.py, most duplicated lines first"""
+    rows = await conn.fetch("""
+        SELECT id, size, function_count, total_lines, avg_similarity, threshold, created_at
+        FROM duplicate_clusters
+        WHERE function_count >= $2
+        ORDER BY id
+        LIMIT $1
+    """, limit, min_functions)
+    return [dict(row) for row in rows]
+
+
+@router.get("/chunks/duplicates/{cluster_id}")
+async def duplicate_cluster(cluster_id: int, conn: asyncpg.Connection = Depends(get_async_db)):
+    """Chunks of one duplicate cluster with their functions and files"""
+    cluster = await conn.fetchrow("""
+        SELECT id, size, function_count, total_lines, avg_similarity, threshold, created_at
+        FROM duplicate_clusters
+        WHERE id = $1
+    """, cluster_id)
+    if not cluster:
+        raise HTTPException(status_code=404, detail="Unknown duplicate cluster")
+    members = await conn.fetch("""
+        SELECT
+            cc.id as chunk_id,
+            cc.chunk_type,
+            cc.start_line,
+            cc.end_line,
+            cc.summary,
+            m.best_similarity,
+            f.id as function_id,
+            f.function_name,
+            f.class_name,
+            files.filepath
+        FROM duplicate_cluster_members m
+        JOIN code_chunks cc ON cc.id = m.chunk_id
+        JOIN functions f ON cc.function_id = f.id
+        JOIN files ON f.file_id = files.id
+        WHERE m.cluster_id = $1
+        ORDER BY files.filepath, cc.start_line
+    """, cluster_id)
+    return {**dict(cluster), "members": [dict(row) for row in members]}
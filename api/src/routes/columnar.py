@@ -0,0 +1,61 @@
+import datetime
+import decimal
+import json
+from typing import Any, Dict, Optional, Sequence
+
+import asyncpg
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+COLUMNS_MEDIA_TYPE = "application/vnd.semanticstack.columns+json"
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+def wants_columns(request: Request, format: Optional[str] = None) -> Optional[str]:
+    """"columns" or "msgpack" when the client asked for a column-oriented response"""
+    accept = request.headers.get("accept", "")
+    if format == "msgpack" or MSGPACK_MEDIA_TYPE in accept:
+        return "msgpack"
+    if format == "columns" or COLUMNS_MEDIA_TYPE in accept:
+        return "columns"
+    return None
+
+
+def columns(rows: Sequence[asyncpg.Record], names: Dict[str, str]) -> Dict[str, Any]:
+    """Column arrays of rows, {record key: response name}, in one pass per column
+
+    Values are taken from the records as they are, without building a model
+    or dict per row: {"count": 2, "columns": {"id": [1, 2], "summary": [...]}}.
+    """
+    if not rows:
+        return {"count": 0, "columns": {name: [] for name in names.values()}}
+    keys = list(rows[0].keys())
+    transposed = list(zip(*rows))
+    return {
+        "count": len(rows),
+        "columns": {name: list(transposed[keys.index(key)]) for key, name in names.items()},
+    }
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_columns(payload: Dict[str, Any], kind: str) -> bytes:
+    if kind == "msgpack":
+        try:
+            import msgpack
+        except ImportError:
+            raise HTTPException(status_code=406, detail="MessagePack is not available on this server")
+        return msgpack.packb(payload, default=_encode)
+    return json.dumps(payload, default=_encode, separators=(",", ":")).encode()
+
+
+def columns_response(payload: Dict[str, Any], kind: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serialize a columns() payload as compact JSON or MessagePack"""
+    media_type = MSGPACK_MEDIA_TYPE if kind == "msgpack" else COLUMNS_MEDIA_TYPE
+    return Response(encode_columns(payload, kind), media_type=media_type, headers=headers)
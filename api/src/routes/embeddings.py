@@ -0,0 +1,61 @@
+import os
+from collections import OrderedDict
+from typing import List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+# Must be the model the enricher embedded the chunks with
+EMBEDDING_ENDPOINT = os.getenv("EMBEDDING_ENDPOINT", "http://host.docker.internal:1234/v1/embeddings")
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-all-minilm-l12-v2")
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "10"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+_client: Optional[httpx.AsyncClient] = None
+_cache: "OrderedDict[str, str]" = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0}
+
+
+def to_pgvector(embedding: List[float]) -> str:
+    return "[" + ",".join(str(x) for x in embedding) + "]"
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _request_embedding(text: str) -> List[float]:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=EMBEDDING_TIMEOUT)
+    try:
+        response = await _client.post(EMBEDDING_ENDPOINT, json={"model": EMBEDDING_MODEL_NAME, "input": text})
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"Embedding service unavailable: {e}")
+    if response.status_code != 200:
+        raise HTTPException(status_code=503, detail=f"Embedding service returned {response.status_code}")
+    embedding = response.json()["data"][0]["embedding"]
+    if not embedding or not any(embedding):
+        raise HTTPException(status_code=503, detail="Embedding service returned an empty vector")
+    return embedding
+
+
+async def embed_query(text: str) -> str:
+    """Query embedding as a pgvector literal, served from an LRU cache when possible"""
+    key = " ".join(text.split())
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache.move_to_end(key)
+        cache_stats["hits"] += 1
+        return cached
+
+    cache_stats["misses"] += 1
+    vector = to_pgvector(await _request_embedding(key))
+    if QUERY_EMBEDDING_CACHE_SIZE > 0:
+        _cache[key] = vector
+        if len(_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return vector
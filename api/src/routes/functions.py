@@ -1 +1,144 @@
+from typing import Optional
 
+from fastapi import APIRouter, Query, Request, Response
+
+from .cache import cached
+from .columnar import columns, columns_response, wants_columns
+from .database import get_pool
+from .pagination import Keyset, keyset_filter, ndjson_response, page, wants_ndjson
+
+router = APIRouter(prefix="", tags=["functions"])
+
+# Keyset per sort order; idx_functions_*_keyset index the same expressions
+FUNCTION_SORTS = {
+    "complexity": Keyset(("COALESCE(f.cyclomatic_complexity, 0)", "COALESCE(f.lines_of_code, 0)", "f.id"),
+                         ("int", "int", "int")),
+    "lines": Keyset(("COALESCE(f.lines_of_code, 0)", "f.id"), ("int", "int")),
+    # Computed per function, so this order still aggregates every function
+    "chunks": Keyset(("s.chunk_count", "f.id"), ("bigint", "int")),
+    "name": Keyset(("f.function_name", "f.id"), ("text", "int"), descending=False),
+}
+
+FUNCTION_LIST_QUERY = """
+    SELECT
+        f.function_name,
+        fl.filepath,
+        f.visibility,
+        f.is_static,
+        f.cyclomatic_complexity,
+        f.parameter_count,
+        f.lines_of_code,
+        s.chunk_count,
+        s.chunk_types,
+        s.max_nesting,
+        {keys}
+    FROM functions f
+    JOIN files fl ON f.file_id = fl.id
+    CROSS JOIN LATERAL (
+        SELECT
+            COUNT(c.id) as chunk_count,
+            ARRAY_AGG(DISTINCT c.chunk_type) FILTER (WHERE c.chunk_type IS NOT NULL) as chunk_types,
+            MAX(c.nesting_level) as max_nesting
+        FROM code_chunks c
+        WHERE c.function_id = f.id
+    ) s
+    WHERE {after}
+    ORDER BY {order_by}
+    {limit}
+"""
+
+
+def function_item(row) -> dict:
+    return {
+        "function_name": row["function_name"],
+        "filepath": row["filepath"],
+        "visibility": row["visibility"],
+        "is_static": row["is_static"],
+        "avg_complexity": row["cyclomatic_complexity"],  # Map cyclomatic_complexity to avg_complexity
+        "parameter_count": row["parameter_count"],
+        "lines_of_code": row["lines_of_code"],
+        "chunk_count": row["chunk_count"],
+        "chunk_types": row["chunk_types"] or [],
+        "max_nesting_level": row["max_nesting"] or 0
+    }
+
+
+# Record key -> name in the columnar response, same names as function_item
+FUNCTION_COLUMNS = {
+    "function_name": "function_name",
+    "filepath": "filepath",
+    "visibility": "visibility",
+    "is_static": "is_static",
+    "cyclomatic_complexity": "avg_complexity",
+    "parameter_count": "parameter_count",
+    "lines_of_code": "lines_of_code",
+    "chunk_count": "chunk_count",
+    "chunk_types": "chunk_types",
+    "max_nesting": "max_nesting_level",
+}
+
+
+def function_list_query(sort_by: str, cursor: Optional[str], args: list, limit: Optional[int] = None) -> str:
+    keyset = FUNCTION_SORTS.get(sort_by, FUNCTION_SORTS["complexity"])
+    after = keyset_filter(keyset, cursor, args)
+    limit_clause = ""
+    if limit is not None:
+        args.append(limit)
+        limit_clause = f"LIMIT ${len(args)}"
+    return FUNCTION_LIST_QUERY.format(keys=keyset.select(), after=after,
+                                      order_by=keyset.order_by(), limit=limit_clause)
+
+
+@cached()
+async def function_page(limit: int, sort_by: str, cursor: Optional[str]):
+    args = []
+    query = function_list_query(sort_by, cursor, args, limit + 1)
+    async with get_pool().acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    return page(FUNCTION_SORTS.get(sort_by, FUNCTION_SORTS["complexity"]), rows, limit, function_item)
+
+
+@cached()
+async def function_columns(limit: int, sort_by: str, cursor: Optional[str]):
+    args = []
+    query = function_list_query(sort_by, cursor, args, limit + 1)
+    async with get_pool().acquire() as conn:
+        rows = await conn.fetch(query, *args)
+    keyset = FUNCTION_SORTS.get(sort_by, FUNCTION_SORTS["complexity"])
+    return {
+        "page": columns(rows[:limit], FUNCTION_COLUMNS),
+        "next_cursor": keyset.cursor(rows[limit - 1]) if len(rows) > limit else None,
+    }
+
+
+# Function endpoints
+@router.get("/functions")
+async def list_functions(
+    request: Request,
+    response: Response,
+    limit: int = Query(20, ge=1, le=1000),
+    sort_by: str = "complexity",
+    cursor: Optional[str] = None,
+    format: Optional[str] = Query(None, pattern="^(json|ndjson|columns|msgpack)$")
+):
+    """List functions with enhanced metrics
+
+    Pages are keyset-paginated: pass the X-Next-Cursor header of a response as
+    `cursor` for the next page. With `format=ndjson` (or Accept:
+    application/x-ndjson) every function from the cursor on is streamed;
+    `format=columns|msgpack` returns the page as column arrays.
+    """
+    if wants_ndjson(request, format):
+        args = []
+        return ndjson_response(function_list_query(sort_by, cursor, args), args, function_item)
+
+    kind = wants_columns(request, format)
+    if kind:
+        result = await function_columns(limit=limit, sort_by=sort_by, cursor=cursor)
+        headers = {"X-Next-Cursor": result["next_cursor"]} if result["next_cursor"] else None
+        return columns_response(result["page"], kind, headers)
+
+    result = await function_page(limit=limit, sort_by=sort_by, cursor=cursor)
+    if result["next_cursor"]:
+        response.headers["X-Next-Cursor"] = result["next_cursor"]
+    return result["items"]
@@ -0,0 +1,224 @@
+import codecs
+import os
+import time
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Tuple
+
+from fastapi import APIRouter, Depends, Query, Request
+import asyncpg
+
+from .database import get_async_db, get_pool
+from .traces import TraceFrame, TraceSegmenter, resolve_locations, trace_fingerprint
+
+router = APIRouter(prefix="", tags=["traces"])
+
+# Located frames resolved and upserted per batch; bounds memory per request
+TRACE_INGEST_BATCH = int(os.getenv("TRACE_INGEST_BATCH", "2000"))
+# Traces per batch, for input whose traces have no located frames (filepath::function)
+TRACE_INGEST_BATCH_TRACES = int(os.getenv("TRACE_INGEST_BATCH_TRACES", "1000"))
+TRACE_INGEST_MAX_FRAMES = int(os.getenv("TRACE_INGEST_MAX_FRAMES", "500"))
+# Longer lines (minified JSON dumps, binary junk) are cut here
+TRACE_INGEST_MAX_LINE = int(os.getenv("TRACE_INGEST_MAX_LINE", "65536"))
+
+FRAME_HITS_UPSERT = """
+    INSERT INTO trace_frame_hits (function_id, chunk_index, hits, innermost_hits)
+    SELECT * FROM unnest($1::int[], $2::int[], $3::bigint[], $4::bigint[])
+    ON CONFLICT (function_id, chunk_index) DO UPDATE SET
+        hits = trace_frame_hits.hits + EXCLUDED.hits,
+        innermost_hits = trace_frame_hits.innermost_hits + EXCLUDED.innermost_hits,
+        last_seen = NOW()
+"""
+
+FINGERPRINT_HITS_UPSERT = """
+    INSERT INTO trace_fingerprints (fingerprint, normalized, hits)
+    SELECT * FROM unnest($1::text[], $2::text[], $3::bigint[])
+    ON CONFLICT (fingerprint) DO UPDATE SET
+        hits = trace_fingerprints.hits + EXCLUDED.hits,
+        last_seen = NOW()
+"""
+
+HOT_FUNCTION_ORDER = {
+    "hits": "h.hits",
+    "innermost": "h.innermost_hits",
+    # Frequent failures in complex, business-critical code first
+    "risk": "h.hits * (1 + COALESCE(c.max_impact, 0)) * (1 + COALESCE(c.avg_complexity, 0))",
+}
+
+HOT_FUNCTIONS_QUERY = """
+    SELECT
+        f.id as function_id,
+        f.function_name,
+        f.class_name,
+        fl.filepath,
+        f.cyclomatic_complexity,
+        h.hits,
+        h.innermost_hits,
+        h.last_seen,
+        ROUND(c.avg_complexity::numeric, 3) as avg_complexity,
+        ROUND(c.max_impact::numeric, 3) as max_impact
+    FROM (
+        SELECT function_id, SUM(hits) as hits, SUM(innermost_hits) as innermost_hits, MAX(last_seen) as last_seen
+        FROM trace_frame_hits
+        GROUP BY function_id
+    ) h
+    JOIN functions f ON f.id = h.function_id
+    JOIN files fl ON fl.id = f.file_id
+    CROSS JOIN LATERAL (
+        SELECT AVG(complexity_score) as avg_complexity, MAX(business_impact_score) as max_impact
+        FROM code_chunks
+        WHERE function_id = f.id
+    ) c
+    ORDER BY {order} DESC, f.id
+    LIMIT $1
+"""
+
+HOT_CHUNKS_QUERY = """
+    SELECT
+        h.chunk_index,
+        h.hits,
+        h.innermost_hits,
+        h.last_seen,
+        cc.id as chunk_id,
+        cc.chunk_type,
+        cc.start_line,
+        cc.end_line,
+        cc.summary,
+        cc.complexity_score,
+        cc.business_impact_score
+    FROM trace_frame_hits h
+    LEFT JOIN code_chunks cc ON cc.function_id = h.function_id AND cc.chunk_index = h.chunk_index
+    WHERE h.function_id = $1
+    ORDER BY h.hits DESC, h.chunk_index
+"""
+
+
+async def read_lines(request: Request) -> AsyncIterator[str]:
+    """Lines of the request body as it arrives; never more than one line buffered"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    truncated = False
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if not truncated:
+                yield line[:TRACE_INGEST_MAX_LINE]
+            truncated = False
+        if len(pending) > TRACE_INGEST_MAX_LINE:
+            if not truncated:
+                yield pending[:TRACE_INGEST_MAX_LINE]
+            pending, truncated = "", True
+    pending += decoder.decode(b"", final=True)
+    if pending and not truncated:
+        yield pending[:TRACE_INGEST_MAX_LINE]
+
+
+class IngestBatch:
+    """Traces of one batch, with frame locations deduplicated for resolution"""
+
+    def __init__(self):
+        self.locations: Dict[Tuple[str, int], int] = {}
+        self.traces: List[List[int]] = []
+        self.fingerprints: Counter = Counter()
+        self.normalized: Dict[str, str] = {}
+        self.frames = 0
+
+    def add(self, frames: List[TraceFrame]):
+        fingerprint, normalized = trace_fingerprint(frames)
+        self.fingerprints[fingerprint] += 1
+        self.normalized.setdefault(fingerprint, normalized)
+        trace = []
+        for frame in frames:
+            if frame.line is None:
+                continue
+            trace.append(self.locations.setdefault((frame.filepath, frame.line), len(self.locations)))
+        self.traces.append(trace)
+        self.frames += len(trace)
+
+    async def flush(self, conn: asyncpg.Connection, totals: Counter):
+        rows = await resolve_locations(conn, [TraceFrame(path, line) for path, line in self.locations])
+        keys = [(row["function_id"], row["chunk_index"] if row["chunk_index"] is not None else -1)
+                if row["function_id"] is not None else None for row in rows]
+
+        hits, innermost = Counter(), Counter()
+        for trace in self.traces:
+            resolved = [keys[i] for i in trace if keys[i] is not None]
+            hits.update(resolved)
+            if resolved:
+                innermost[resolved[0]] += 1
+            totals["resolved_frames"] += len(resolved)
+            totals["unresolved_frames"] += len(trace) - len(resolved)
+
+        # Sorted, so concurrent ingests lock rows in the same order
+        ordered = sorted(hits)
+        fingerprints = sorted(self.fingerprints)
+        async with conn.transaction():
+            if ordered:
+                await conn.execute(FRAME_HITS_UPSERT,
+                                   [key[0] for key in ordered], [key[1] for key in ordered],
+                                   [hits[key] for key in ordered], [innermost[key] for key in ordered])
+            await conn.execute(FINGERPRINT_HITS_UPSERT, fingerprints,
+                               [self.normalized[fp] for fp in fingerprints],
+                               [self.fingerprints[fp] for fp in fingerprints])
+        totals["batches"] += 1
+
+
+@router.post("/traces/ingest")
+async def ingest_traces(request: Request):
+    """Stream a log file (plain text or NDJSON Monolog records) into frame hit counts
+
+    The body is parsed line by line as it arrives and counted in batches of
+    TRACE_INGEST_BATCH frames or TRACE_INGEST_BATCH_TRACES traces, so memory
+    does not depend on the input size.
+    Usage: curl --data-binary @php_errors.log localhost:8000/traces/ingest
+    """
+    started = time.time()
+    totals: Counter = Counter()
+    segmenter = TraceSegmenter(TRACE_INGEST_MAX_FRAMES)
+    batch = IngestBatch()
+
+    async def flush():
+        nonlocal batch
+        if batch.traces:
+            async with get_pool().acquire() as conn:
+                await batch.flush(conn, totals)
+        batch = IngestBatch()
+
+    async for line in read_lines(request):
+        totals["lines"] += 1
+        for frames in segmenter.feed(line):
+            batch.add(frames)
+            totals["traces"] += 1
+        if batch.frames >= TRACE_INGEST_BATCH or len(batch.traces) >= TRACE_INGEST_BATCH_TRACES:
+            await flush()
+    for frames in segmenter.close():
+        batch.add(frames)
+        totals["traces"] += 1
+    await flush()
+
+    return {
+        "lines": totals["lines"],
+        "traces": totals["traces"],
+        "resolved_frames": totals["resolved_frames"],
+        "unresolved_frames": totals["unresolved_frames"],
+        "batches": totals["batches"],
+        "seconds": round(time.time() - started, 2),
+    }
+
+
+@router.get("/traces/hot")
+async def hottest_failing_functions(
+    limit: int = Query(20, ge=1, le=500),
+    sort_by: str = Query("hits", pattern="^(hits|innermost|risk)$"),
+    conn: asyncpg.Connection = Depends(get_async_db)
+):
+    """Functions appearing most often in ingested traces, with complexity and business impact"""
+    rows = await conn.fetch(HOT_FUNCTIONS_QUERY.format(order=HOT_FUNCTION_ORDER[sort_by]), limit)
+    return [dict(row) for row in rows]
+
+
+@router.get("/traces/hot/{function_id}")
+async def hot_function_chunks(function_id: int, conn: asyncpg.Connection = Depends(get_async_db)):
+    """Per-chunk frame hits of one function (chunk_index -1: outside every chunk)"""
+    rows = await conn.fetch(HOT_CHUNKS_QUERY, function_id)
+    return [dict(row) for row in rows]
@@ -30,6 +30,13 @@ class StacktraceRequest(BaseModel):
     stacktrace: str
 
 
+class TraceFrameResult(SearchResult):
+    """/analyze output; frame fields are set for traces with file/line locations"""
+    frame_line: Optional[int] = None
+    frame: Optional[str] = None
+    chunk_type: Optional[str] = None
+
+
 class ProgressStats(BaseModel):
     total_chunks: int
     enriched_chunks: int
@@ -37,3 +44,26 @@ class ProgressStats(BaseModel):
     avg_complexity: Optional[float] = None
     avg_impact: Optional[float] = None
 
+
+class SemanticSearchResult(SearchResult):
+    distance: float
+
+
+class SimilarChunkResult(SemanticSearchResult):
+    chunk_type: Optional[str] = None
+
+
+class HybridSearchResult(SearchResult):
+    score: float
+    text_rank: Optional[int] = None
+    vector_rank: Optional[int] = None
+    distance: Optional[float] = None
+
+
+class AutocompleteResult(BaseModel):
+    kind: str
+    name: str
+    detail: str
+    filepath: str
+    function_id: Optional[int] = None
+    score: float
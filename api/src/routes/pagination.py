@@ -0,0 +1,98 @@
+import base64
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+import asyncpg
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from .database import get_pool
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Rows fetched per round trip from the server-side cursor
+NDJSON_PREFETCH = int(os.getenv("NDJSON_PREFETCH", "500"))
+
+
+@dataclass(frozen=True)
+class Keyset:
+    """Sort key for keyset pagination; the last column must make the order unique
+
+    Key columns are selected as k0, k1, ... so the cursor of a page can be taken
+    from its last row, and the next page starts with a row comparison that an
+    index on the same expressions can answer.
+    """
+    columns: Tuple[str, ...]
+    types: Tuple[str, ...]
+    descending: bool = True
+
+    def select(self) -> str:
+        return ", ".join(f"{column} as k{i}" for i, column in enumerate(self.columns))
+
+    def order_by(self) -> str:
+        direction = "DESC" if self.descending else "ASC"
+        return ", ".join(f"{column} {direction}" for column in self.columns)
+
+    def after(self, first_param: int) -> str:
+        """Condition for rows after the cursor, using parameters from $first_param on"""
+        params = ", ".join(f"${first_param + i}::{t}" for i, t in enumerate(self.types))
+        return f"({', '.join(self.columns)}) {'<' if self.descending else '>'} ({params})"
+
+    def cursor(self, row: asyncpg.Record) -> str:
+        values = [row[f"k{i}"] for i in range(len(self.columns))]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> List[Any]:
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            raise HTTPException(status_code=400, detail="Cursor does not match this listing")
+        for value, sql_type in zip(values, self.types):
+            expected = str if sql_type == "text" else int
+            # bool is an int subclass, but not a valid key value
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        return values
+
+
+def keyset_filter(keyset: Keyset, cursor: Optional[str], args: List[Any]) -> str:
+    """SQL condition for the page after cursor ("TRUE" without one); appends its parameters to args"""
+    if not cursor:
+        return "TRUE"
+    condition = keyset.after(len(args) + 1)
+    args.extend(keyset.decode(cursor))
+    return condition
+
+
+def page(keyset: Keyset, rows: Sequence[asyncpg.Record], limit: int,
+         transform: Callable[[asyncpg.Record], Dict]) -> Dict:
+    """Items of a page fetched with LIMIT limit + 1, and the cursor of the next page if there is one"""
+    items = [transform(row) for row in rows[:limit]]
+    next_cursor = keyset.cursor(rows[limit - 1]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def wants_ndjson(request: Request, format: Optional[str] = None) -> bool:
+    return format == "ndjson" or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def _ndjson_rows(query: str, args: Sequence[Any],
+                       transform: Callable[[asyncpg.Record], Dict]) -> AsyncIterator[str]:
+    # Acquired here, not in the endpoint: the body is written after the endpoint returns
+    async with get_pool().acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(query, *args, prefetch=NDJSON_PREFETCH):
+                yield json.dumps(jsonable_encoder(transform(row))) + "\n"
+
+
+def ndjson_response(query: str, args: Sequence[Any], transform: Callable[[asyncpg.Record], Dict]) -> StreamingResponse:
+    """Stream every row of query as one JSON object per line from a server-side cursor
+
+    Rows are read NDJSON_PREFETCH at a time, so memory stays constant however
+    large the result is.
+    """
+    return StreamingResponse(_ndjson_rows(query, args, transform), media_type=NDJSON_MEDIA_TYPE)
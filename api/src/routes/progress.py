@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Deque, Dict, Optional, Set, Tuple
+
+import asyncpg
+
+from .database import DATABASE_URL
+from .stats_rollup import CURRENT_STATS_QUERY, RECENT_ENRICHED_QUERY, average
+
+PROGRESS_CHANNEL = "enrichment_progress"
+# At most one stats read per interval, however many writes notify
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "1"))
+# Re-read without notifications too, so the rate decays once enrichment stops
+PROGRESS_IDLE_REFRESH = float(os.getenv("PROGRESS_IDLE_REFRESH", "15"))
+PROGRESS_RATE_WINDOW = float(os.getenv("PROGRESS_RATE_WINDOW", "300"))
+# SSE comment lines keep proxies from closing quiet streams
+PROGRESS_HEARTBEAT = float(os.getenv("PROGRESS_HEARTBEAT", "20"))
+
+
+class ProgressBroadcaster:
+    """One LISTEN connection and one stats read per change, fanned out to every SSE client
+
+    Each subscriber gets a single-slot queue holding the newest snapshot; slow
+    clients skip intermediate updates instead of buffering them.
+    """
+
+    def __init__(self):
+        self.latest: Optional[Dict] = None
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.samples: Deque[Tuple[float, int]] = deque()
+        self._changed = asyncio.Event()
+        self._tasks: list = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def _publish(self, snapshot: Dict):
+        self.latest = snapshot
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(snapshot)
+
+    def _rate(self, now: float, enriched: int) -> float:
+        """Chunks per minute over PROGRESS_RATE_WINDOW"""
+        self.samples.append((now, enriched))
+        while len(self.samples) > 2 and self.samples[1][0] <= now - PROGRESS_RATE_WINDOW:
+            self.samples.popleft()
+        start, start_enriched = self.samples[0]
+        if now - start <= 0:
+            return 0.0
+        return max(0.0, (enriched - start_enriched) / (now - start) * 60)
+
+    async def _snapshot(self, conn: asyncpg.Connection) -> Dict:
+        row = await conn.fetchrow(CURRENT_STATS_QUERY)
+        now = time.time()
+        if not self.samples:
+            # Seed the window so the first clients see a rate, not zero
+            recent = await conn.fetchval(RECENT_ENRICHED_QUERY, timedelta(seconds=PROGRESS_RATE_WINDOW))
+            self.samples.append((now - PROGRESS_RATE_WINDOW, row["enriched_chunks"] - recent))
+        rate = self._rate(now, row["enriched_chunks"])
+        pending = row["chunks"] - row["enriched_chunks"]
+        return {
+            "total_chunks": row["chunks"],
+            "enriched_chunks": row["enriched_chunks"],
+            "pending_chunks": pending,
+            "dead_lettered_chunks": row["dead_lettered_chunks"],
+            "avg_complexity": average(row["complexity_sum"], row["complexity_count"], 2),
+            "avg_impact": average(row["impact_sum"], row["impact_count"], 2),
+            "chunks_per_minute": round(rate, 2),
+            "eta_seconds": round(pending / rate * 60) if pending and rate else None,
+            "updated_at": now,
+        }
+
+    async def _refresh_loop(self, pool: asyncpg.Pool):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=PROGRESS_IDLE_REFRESH)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            try:
+                async with pool.acquire() as conn:
+                    snapshot = await self._snapshot(conn)
+            except (asyncpg.PostgresError, OSError) as e:
+                print(f"⚠️  Progress refresh failed: {e}")
+            else:
+                if self.latest is None or any(snapshot[k] != self.latest[k] for k in snapshot if k != "updated_at"):
+                    self._publish(snapshot)
+            await asyncio.sleep(PROGRESS_MIN_INTERVAL)
+
+    async def _listen(self):
+        """Dedicated LISTEN connection; same reconnect/keepalive scheme as the response cache"""
+        while True:
+            try:
+                conn = await asyncpg.connect(DATABASE_URL)
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f"⚠️  Progress listener cannot connect: {e}")
+                await asyncio.sleep(5)
+                continue
+            try:
+                await conn.add_listener(PROGRESS_CHANNEL, self._on_notify)
+                self._changed.set()
+                while True:
+                    await asyncio.sleep(5)
+                    await conn.execute("SELECT 1")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                print(f"⚠️  Progress listener lost its connection: {e}")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self._changed.set()
+
+    async def stream(self):
+        """Server-sent events for one client: the current snapshot, then every change"""
+        queue = self.subscribe()
+        try:
+            while True:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=PROGRESS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: progress\ndata: {json.dumps(snapshot)}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    async def start(self, pool: asyncpg.Pool):
+        self._tasks = [asyncio.create_task(self._listen()),
+                       asyncio.create_task(self._refresh_loop(pool))]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+
+progress_broadcaster = ProgressBroadcaster()
@@ -1,257 +1,225 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Tuple
-from .functions import get_db, get_async_db
-from .models import SearchResult, ProgressStats
-from fastapi import FastAPI, HTTPException, Query, Body, APIRouter
-from app.routes.models import SearchResult, ProgressStats, StacktraceRequest
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import Dict, List, Optional
+import asyncio
+import asyncpg
+import os
+import re
+
+from .columnar import columns, columns_response, wants_columns
+from .database import get_async_db, get_pool
+from .embeddings import embed_query
+from .models import HybridSearchResult, SearchResult, SemanticSearchResult
+
+# HNSW candidate list size; raised to the requested limit if smaller
+SEMANTIC_EF_SEARCH = int(os.getenv("SEMANTIC_EF_SEARCH", "64"))
+# IVFFlat lists probed per query
+SEMANTIC_PROBES = int(os.getenv("SEMANTIC_PROBES", "10"))
+# Reciprocal rank fusion constant: score = sum of 1 / (RRF_K + rank)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+ANN_SETTINGS_QUERY = """
+SELECT set_config('hnsw.ef_search', $1, true),
+       set_config('hnsw.iterative_scan', 'relaxed_order', true),
+       set_config('ivfflat.probes', $2, true),
+       set_config('ivfflat.iterative_scan', 'relaxed_order', true)
+"""
 
 router = APIRouter(prefix="", tags=["search"])
 
+SEARCH_COLUMNS = """
+    cc.id,
+    cc.summary,
+    cc.complexity_score,
+    cc.business_impact_score,
+    cc.start_line,
+    cc.end_line,
+    f.function_name,
+    f.id as function_id,
+    f.class_name,
+    files.filepath
+"""
+
+# SEARCH_COLUMNS by name, for column-oriented responses
+SEARCH_RESULT_COLUMNS = {name: name for name in (
+    "id", "summary", "complexity_score", "business_impact_score", "start_line", "end_line",
+    "function_name", "function_id", "class_name", "filepath",
+)}
+
+# Whole words, stemmed or as written
+WORDS_TSQUERY = "websearch_to_tsquery('english', $1) || websearch_to_tsquery('simple', $1)"
+# Every word as a prefix, for search-as-you-type
+PREFIX_TSQUERY = "to_tsquery('simple', $1)"
+
+# Chunks matching on summary/code identifiers or on their function/class name,
+# both served by the GIN indexes on search_vector
+TEXT_SEARCH_QUERY = """
+WITH query AS (SELECT {tsquery} as q),
+matches AS (
+    SELECT cc.id, ts_rank_cd(cc.search_vector, query.q) as rank
+    FROM code_chunks cc, query
+    WHERE cc.search_vector @@ query.q
+    UNION ALL
+    SELECT cc.id, ts_rank_cd(f.search_vector, query.q) as rank
+    FROM functions f
+    CROSS JOIN query
+    JOIN code_chunks cc ON cc.function_id = f.id
+    WHERE f.search_vector @@ query.q
+),
+ranked AS (
+    SELECT id, SUM(rank) as rank FROM matches GROUP BY id
+)
+SELECT {columns},
+    ranked.rank
+FROM ranked
+JOIN code_chunks cc ON cc.id = ranked.id
+JOIN functions f ON cc.function_id = f.id
+JOIN files ON f.file_id = files.id
+WHERE cc.enriched_at IS NOT NULL
+AND cc.summary IS NOT NULL
+AND ($3::text IS NULL OR cc.chunk_type = $3)
+AND ($4::text IS NULL OR starts_with(files.filepath, $4))
+AND ($5::real IS NULL OR cc.business_impact_score >= $5)
+ORDER BY ranked.rank DESC, cc.business_impact_score DESC NULLS LAST
+LIMIT $2
+"""
+
+WORDS_SEARCH_QUERY = TEXT_SEARCH_QUERY.format(tsquery=WORDS_TSQUERY, columns=SEARCH_COLUMNS)
+PREFIX_SEARCH_QUERY = TEXT_SEARCH_QUERY.format(tsquery=PREFIX_TSQUERY, columns=SEARCH_COLUMNS)
+
+EXACT_SEARCH_QUERY = f"""
+SELECT {SEARCH_COLUMNS}
+FROM code_chunks cc
+JOIN functions f ON cc.function_id = f.id
+JOIN files ON f.file_id = files.id
+WHERE f.function_name = $1
+AND cc.enriched_at IS NOT NULL
+AND cc.summary IS NOT NULL
+AND cc.chunk_type != 'block'
+ORDER BY cc.start_line ASC NULLS LAST
+LIMIT $2
+"""
+
+# Filters are applied while walking the HNSW graph (iterative scan), so selective
+# filters still fill the limit; relaxed order is re-sorted by the outer query
+SEMANTIC_SEARCH_QUERY = f"""
+WITH nearest AS MATERIALIZED (
+    SELECT {SEARCH_COLUMNS},
+        cc.embedding <=> $1::vector as distance
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    WHERE cc.embedding IS NOT NULL
+    AND cc.summary IS NOT NULL
+    AND ($3::text IS NULL OR cc.chunk_type = $3)
+    AND ($4::text IS NULL OR starts_with(files.filepath, $4))
+    AND ($5::real IS NULL OR cc.business_impact_score >= $5)
+    ORDER BY cc.embedding <=> $1::vector
+    LIMIT $2
+)
+SELECT * FROM nearest ORDER BY distance
+"""
+
+
+def prefix_tsquery(q: str) -> Optional[str]:
+    """'user valid' -> 'user:* & valid:*'; None if the input has no words"""
+    words = re.findall(r"\w+", q)
+    return " & ".join(f"{word}:*" for word in words) if words else None
+
+
+async def nearest_chunks(conn: asyncpg.Connection, vector: str, limit: int, chunk_type: Optional[str],
+                         file_prefix: Optional[str], min_business_impact: Optional[float],
+                         ef_search: Optional[int] = None, probes: Optional[int] = None) -> List[asyncpg.Record]:
+    async with conn.transaction():
+        await conn.execute(ANN_SETTINGS_QUERY, str(max(ef_search or SEMANTIC_EF_SEARCH, limit)),
+                           str(probes or SEMANTIC_PROBES))
+        return await conn.fetch(SEMANTIC_SEARCH_QUERY, vector, limit, chunk_type, file_prefix, min_business_impact)
+
+
+def reciprocal_rank_fusion(text_rows: List[asyncpg.Record], vector_rows: List[asyncpg.Record],
+                           limit: int) -> List[HybridSearchResult]:
+    """Merge two ranked candidate lists by sum of 1 / (RRF_K + rank)"""
+    fused: Dict[int, Dict] = {}
+    for source, rows in (("text_rank", text_rows), ("vector_rank", vector_rows)):
+        for rank, row in enumerate(rows, start=1):
+            result = fused.setdefault(row["id"], {**{k: v for k, v in row.items() if k != "rank"}, "score": 0.0})
+            result[source] = rank
+            result["score"] += 1.0 / (RRF_K + rank)
+    ranked = sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:limit]
+    return [HybridSearchResult(**result, type="chunk") for result in ranked]
+
+
 # Search endpoints
 @router.get("/search", response_model=List[SearchResult])
 async def search_code(
+    request: Request,
     q: str = Query(..., min_length=2),
     limit: int = Query(20, le=100),
-    fuzzy: bool = False
+    fuzzy: bool = False,
+    format: Optional[str] = Query(None, pattern="^(json|columns|msgpack)$"),
+    conn: asyncpg.Connection = Depends(get_async_db)
 ):
-    """Search code summaries"""
-    conn = await get_async_db()
-    try:
-        if fuzzy:
-            query = """
-            SELECT 
-                cc.id,
-                cc.summary,
-                cc.complexity_score,
-                cc.business_impact_score,
-                cc.start_line,
-                cc.end_line,
-                f.function_name,
-                f.id as function_id,
-                f.class_name,
-                files.filepath
-            FROM code_chunks cc
-            JOIN functions f ON cc.function_id = f.id
-            JOIN files ON f.file_id = files.id
-            WHERE cc.summary ILIKE $1 
-            AND cc.enriched_at IS NOT NULL
-            AND cc.summary IS NOT NULL
-            AND cc.chunk_type = 'block'
-            ORDER BY cc.business_impact_score DESC NULLS LAST
-            LIMIT $2
-            """
-            rows = await conn.fetch(query, f'%{q}%', limit)
-        else:
-            query = """
-            SELECT 
-                cc.id,
-                cc.summary,
-                cc.complexity_score,
-                cc.business_impact_score,
-                cc.start_line,
-                cc.end_line,
-                f.function_name,
-                f.id as function_id,
-                f.class_name,
-                files.filepath
-            FROM code_chunks cc
-            JOIN functions f ON cc.function_id = f.id
-            JOIN files ON f.file_id = files.id
-            WHERE f.function_name = $1
-            AND cc.enriched_at IS NOT NULL
-            AND cc.summary IS NOT NULL
-            AND cc.chunk_type != 'block'
-            ORDER BY cc.start_line ASC NULLS LAST
-            LIMIT $2
-            """
-            rows = await conn.fetch(query, q, limit)
-
-        return [SearchResult(**dict(row)) for row in rows]
-    finally:
-        await conn.close()
-
-
-
-# Function endpoints
-@router.get("/functions")
-def list_functions(limit: int = 20, sort_by: str = "complexity"):
-    """List functions with enhanced metrics"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    sort_column = {
-        "complexity": "f.cyclomatic_complexity DESC",
-        "lines": "f.lines_of_code DESC", 
-        "chunks": "chunk_count DESC",
-        "name": "f.function_name ASC"
-    }.get(sort_by, "f.cyclomatic_complexity DESC")
-    
-    cursor.execute(f"""
-        SELECT 
-            f.function_name,
-            fl.filepath,
-            f.visibility,
-            f.is_static,
-            f.cyclomatic_complexity,
-            f.parameter_count,
-            f.lines_of_code,
-            COUNT(c.id) as chunk_count,
-            ARRAY_AGG(DISTINCT c.chunk_type) FILTER (WHERE c.chunk_type IS NOT NULL) as chunk_types,
-            MAX(c.nesting_level) as max_nesting
-        FROM functions f 
-        JOIN files fl ON f.file_id = fl.id
-        LEFT JOIN code_chunks c ON f.id = c.function_id 
-        GROUP BY f.id, f.function_name, fl.filepath, f.visibility, f.is_static, 
-                 f.cyclomatic_complexity, f.parameter_count, f.lines_of_code
-        ORDER BY {sort_column}
-        LIMIT %s
-    """, (limit,))
-    
-    results = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    
-    return [
-        {
-            "function_name": row[0],
-            "filepath": row[1],
-            "visibility": row[2],
-            "is_static": row[3],
-            "avg_complexity": row[4],  # Map cyclomatic_complexity to avg_complexity
-            "parameter_count": row[5],
-            "lines_of_code": row[6],
-            "chunk_count": row[7],
-            "chunk_types": row[8] or [],
-            "max_nesting_level": row[9] or 0
-        }
-        for row in results
-    ]
-
-
-
-
-@router.post("/analyze", response_model=List[SearchResult])
-async def analyze_stacktrace(req: StacktraceRequest = Body(...)):
-    """Analyze stacktrace & return uniform SearchResult-style output."""
-    lines = req.stacktrace.strip().splitlines()
-    results: List[SearchResult] = []
-
-    raw_conn = get_db()
-    async_conn = await get_async_db()
-    cursor = raw_conn.cursor()
-
-    try:
-        extracted_names = []
-
-        for line in lines:
-            if "::" not in line:
-                results.append(SearchResult(
-                    id=-1,
-                    summary=f"❌ Invalid format: {line}",
-                    filepath=None,
-                    function_name=None,
-                    function_id=None,
-                    class_name=None,
-                    start_line=None,
-                    end_line=None,
-                    complexity_score=None,
-                    business_impact_score=None,
-                    type="error"
-                ))
-                continue
-
-            filepath, function = line.split("::", 1)
-            extracted_names.append(function)
-
-            cursor.execute("""
-                SELECT 
-                    f.function_name,
-                    f.id,
-                    f.visibility,
-                    f.is_static,
-                    f.cyclomatic_complexity,
-                    f.parameter_count,
-                    f.lines_of_code,
-                    COUNT(c.id) as chunk_count,
-                    ARRAY_AGG(DISTINCT c.chunk_type) FILTER (WHERE c.chunk_type IS NOT NULL) as chunk_types,
-                    MAX(c.nesting_level) as max_nesting
-                FROM functions f 
-                JOIN files fl ON f.file_id = fl.id
-                LEFT JOIN code_chunks c ON f.id = c.function_id 
-                WHERE fl.filepath = %s AND f.function_name = %s
-                GROUP BY f.id
-            """, (filepath, function))
-
-            row = cursor.fetchone()
-            if row:
-                name, function_id, visibility, is_static, complexity, params, loc, chunks, types, max_nest = row
-                static_text = "static " if is_static else ""
-                vis_text = f"{visibility} " if visibility else ""
-                complexity_text = f"complexity:{complexity}" if complexity is not None else "complexity:?"
-                print(row)
-                results.append(SearchResult(
-                    id=-1,
-                    summary=f"✅ {vis_text}{static_text}{name} ({chunks} chunks, {complexity_text}, max nesting:{max_nest or 0})",
-                    filepath=filepath,
-                    function_name=name,
-                    function_id=function_id,
-                    class_name=None,
-                    start_line=None,
-                    end_line=None,
-                    complexity_score=complexity,
-                    business_impact_score=None,
-                    type="function_summary"
-                ))
-            else:
-                results.append(SearchResult(
-                    id=-1,
-                    summary=f"❌ No function found: {line}",
-                    filepath=filepath,
-                    function_name=function,
-                    function_id=None,
-                    class_name=None,
-                    start_line=None,
-                    end_line=None,
-                    complexity_score=None,
-                    business_impact_score=None,
-                    type="missing"
-                ))
-
-        # Fetch enriched related chunks
-        if extracted_names:
-            placeholders = ','.join(f"${i+1}" for i in range(len(extracted_names)))
-            search_query = f"""
-            SELECT 
-                cc.id,
-                cc.summary,
-                cc.complexity_score,
-                cc.business_impact_score,
-                cc.start_line,
-                cc.end_line,
-                f.function_name,
-                f.id as function_id,
-                f.class_name,
-                files.filepath
-            FROM code_chunks cc
-            JOIN functions f ON cc.function_id = f.id
-            JOIN files ON f.file_id = files.id
-            WHERE f.function_name IN ({placeholders})
-            AND cc.enriched_at IS NOT NULL
-            AND cc.summary IS NOT NULL
-            ORDER BY cc.business_impact_score DESC NULLS LAST
-            LIMIT 50
-            """
-            rows = await async_conn.fetch(search_query, *extracted_names)
-            for row in rows:
-                result = dict(row)
-                result["type"] = "chunk"
-                results.append(SearchResult(**result))
-
-        return results
+    """Search code summaries; `format=columns|msgpack` returns column arrays"""
+    if fuzzy:
+        tsquery = prefix_tsquery(q)
+        if tsquery is None:
+            return []
+        rows = await conn.fetch(PREFIX_SEARCH_QUERY, tsquery, limit, 'block', None, None)
+    else:
+        rows = await conn.fetch(EXACT_SEARCH_QUERY, q, limit)
+
+    kind = wants_columns(request, format)
+    if kind:
+        return columns_response(columns(rows, SEARCH_RESULT_COLUMNS), kind)
+    return [SearchResult(**dict(row), type="chunk") for row in rows]
+
+
+@router.get("/search/semantic", response_model=List[SemanticSearchResult])
+async def semantic_search(
+    request: Request,
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    chunk_type: Optional[str] = None,
+    file_prefix: Optional[str] = None,
+    min_business_impact: Optional[float] = Query(None, ge=0, le=1),
+    ef_search: Optional[int] = Query(None, ge=1, le=1000, description="HNSW recall/latency override"),
+    probes: Optional[int] = Query(None, ge=1, le=1000, description="IVFFlat recall/latency override"),
+    format: Optional[str] = Query(None, pattern="^(json|columns|msgpack)$"),
+    conn: asyncpg.Connection = Depends(get_async_db)
+):
+    """Top-k chunks by cosine distance between the query and the chunk embeddings"""
+    vector = await embed_query(q)
+    rows = await nearest_chunks(conn, vector, limit, chunk_type, file_prefix, min_business_impact, ef_search, probes)
+    kind = wants_columns(request, format)
+    if kind:
+        return columns_response(columns(rows, {**SEARCH_RESULT_COLUMNS, "distance": "distance"}), kind)
+    return [SemanticSearchResult(**dict(row), type="chunk") for row in rows]
 
-    finally:
-        cursor.close()
-        raw_conn.close()
-        await async_conn.close()
 
+@router.get("/search/hybrid", response_model=List[HybridSearchResult])
+async def hybrid_search(
+    q: str = Query(..., min_length=2),
+    limit: int = Query(20, ge=1, le=100),
+    candidates: int = Query(50, ge=1, le=200, description="candidates taken from each retriever"),
+    chunk_type: Optional[str] = None,
+    file_prefix: Optional[str] = None,
+    min_business_impact: Optional[float] = Query(None, ge=0, le=1),
+):
+    """Full-text and vector candidates retrieved concurrently, merged with reciprocal rank fusion"""
+    pool = get_pool()
+    filters = (chunk_type, file_prefix, min_business_impact)
+
+    async def text_candidates():
+        async with pool.acquire() as conn:
+            return await conn.fetch(WORDS_SEARCH_QUERY, q, candidates, *filters)
+
+    async def vector_candidates():
+        try:
+            vector = await embed_query(q)
+        except HTTPException:
+            # Embedding service down - keyword results alone are still useful
+            return []
+        async with pool.acquire() as conn:
+            return await nearest_chunks(conn, vector, candidates, *filters)
+
+    text_rows, vector_rows = await asyncio.gather(text_candidates(), vector_candidates())
+    return reciprocal_rank_fusion(text_rows, vector_rows, limit)
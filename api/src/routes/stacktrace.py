@@ -0,0 +1,351 @@
+import json
+import os
+from datetime import timedelta
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from typing import List, Tuple, Union
+import asyncpg
+
+from .database import get_async_db
+from .models import SearchResult, StacktraceRequest, TraceFrameResult
+from .traces import TraceFrame, parse_trace, resolve_locations, trace_fingerprint, trace_result_key
+
+router = APIRouter(prefix="", tags=["stacktrace"])
+
+# Cached analyses older than this are recomputed even without invalidation
+TRACE_CACHE_TTL = float(os.getenv("TRACE_CACHE_TTL", "86400"))
+
+# Counts the occurrence of the trace
+TRACE_SEEN_QUERY = """
+    INSERT INTO trace_fingerprints (fingerprint, normalized)
+    VALUES ($1, $2)
+    ON CONFLICT (fingerprint) DO UPDATE SET
+        hits = trace_fingerprints.hits + 1,
+        last_seen = NOW()
+"""
+
+# Version and still valid result of the trace at these lines; the row is created
+# first, so an invalidation before the result is stored bumps its version
+TRACE_RESULT_QUERY = """
+    WITH created AS (
+        INSERT INTO trace_results (result_key, fingerprint)
+        VALUES ($1, $2)
+        ON CONFLICT (result_key) DO NOTHING
+        RETURNING version, NULL::jsonb as result
+    )
+    SELECT version, result FROM created
+    UNION ALL
+    SELECT version, CASE WHEN computed_at > NOW() - $3::interval THEN result END
+    FROM trace_results
+    WHERE result_key = $1
+    LIMIT 1
+"""
+
+# Only stored if no invalidation happened since TRACE_RESULT_QUERY read the version
+TRACE_STORE_QUERY = """
+    WITH stored AS (
+        UPDATE trace_results SET
+            result = $2::jsonb,
+            function_ids = $3::int[],
+            unresolved = $4,
+            computed_at = NOW()
+        WHERE result_key = $1 AND version = $5
+        RETURNING fingerprint
+    )
+    UPDATE trace_fingerprints SET computations = computations + 1
+    WHERE fingerprint IN (SELECT fingerprint FROM stored)
+"""
+
+# All frames in one statement: unnest keeps the input order via ORDINALITY, and
+# unknown files or functions come back as rows with a NULL id
+FRAMES_QUERY = """
+    SELECT 
+        fr.position,
+        fr.filepath,
+        fr.function_name as frame_function,
+        f.function_name,
+        f.id,
+        f.visibility,
+        f.is_static,
+        f.cyclomatic_complexity,
+        f.parameter_count,
+        f.lines_of_code,
+        s.chunk_count,
+        s.chunk_types,
+        s.max_nesting
+    FROM unnest($1::text[], $2::text[]) WITH ORDINALITY AS fr(filepath, function_name, position)
+    LEFT JOIN files fl ON fl.filepath = fr.filepath
+    LEFT JOIN functions f ON f.file_id = fl.id AND f.function_name = fr.function_name
+    LEFT JOIN LATERAL (
+        SELECT 
+            COUNT(c.id) as chunk_count,
+            ARRAY_AGG(DISTINCT c.chunk_type) FILTER (WHERE c.chunk_type IS NOT NULL) as chunk_types,
+            MAX(c.nesting_level) as max_nesting
+        FROM code_chunks c
+        WHERE c.function_id = f.id
+    ) s ON TRUE
+    ORDER BY fr.position
+"""
+
+RELATED_CHUNKS_QUERY = """
+    SELECT 
+        cc.id,
+        cc.summary,
+        cc.complexity_score,
+        cc.business_impact_score,
+        cc.start_line,
+        cc.end_line,
+        f.function_name,
+        f.id as function_id,
+        f.class_name,
+        files.filepath
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    WHERE f.function_name = ANY($1::text[])
+    AND cc.enriched_at IS NOT NULL
+    AND cc.summary IS NOT NULL
+    ORDER BY cc.business_impact_score DESC NULLS LAST
+    LIMIT 50
+"""
+
+
+def parse_frames(stacktrace: str) -> List[Union[Tuple[str, str], str]]:
+    """`filepath::function` lines as (filepath, function); malformed lines stay strings"""
+    return [tuple(line.split("::", 1)) if "::" in line else line
+            for line in stacktrace.strip().splitlines()]
+
+
+async def resolve_frames(conn: asyncpg.Connection, frames: List[Tuple[str, str]]) -> List[asyncpg.Record]:
+    """One row per frame, in order, from a single round trip"""
+    if not frames:
+        return []
+    filepaths, functions = zip(*frames)
+    return await conn.fetch(FRAMES_QUERY, list(filepaths), list(functions))
+
+
+def describe_frame(row: asyncpg.Record) -> str:
+    complexity = row["cyclomatic_complexity"]
+    static_text = "static " if row["is_static"] else ""
+    vis_text = f"{row['visibility']} " if row["visibility"] else ""
+    complexity_text = f"complexity:{complexity}" if complexity is not None else "complexity:?"
+    return (f"✅ {vis_text}{static_text}{row['function_name']} ({row['chunk_count']} chunks, "
+            f"{complexity_text}, max nesting:{row['max_nesting'] or 0})")
+
+
+async def analyze_located_frames(conn: asyncpg.Connection, frames: List[TraceFrame]) -> List[TraceFrameResult]:
+    """Each frame mapped to the innermost chunk at its line, then those chunks"""
+    results: List[TraceFrameResult] = []
+    chunks: List[TraceFrameResult] = []
+    seen_chunks = set()
+
+    for frame, row in zip(frames, await resolve_locations(conn, frames)):
+        if row["function_id"] is None:
+            reason = (f"line {frame.line} is outside any parsed function" if row["filepath"]
+                      else "file not found (check TRACE_PATH_PREFIXES)")
+            results.append(TraceFrameResult(
+                id=-1,
+                summary=f"❌ {frame.filepath}:{frame.line}: {reason}",
+                filepath=row["filepath"] or frame.filepath,
+                function_name=frame.function,
+                type="missing",
+                frame_line=frame.line,
+                frame=frame.raw
+            ))
+            continue
+
+        name = f"{row['class_name']}::{row['function_name']}" if row["class_name"] else row["function_name"]
+        block = f" → {row['chunk_type']} (lines {row['start_line']}-{row['end_line']})" if row["chunk_id"] else ""
+        results.append(TraceFrameResult(
+            id=-1,
+            summary=f"✅ {name} line {frame.line}{block}",
+            filepath=row["filepath"],
+            function_name=row["function_name"],
+            function_id=row["function_id"],
+            class_name=row["class_name"],
+            start_line=row["start_line"],
+            end_line=row["end_line"],
+            complexity_score=row["cyclomatic_complexity"],
+            type="function_summary",
+            frame_line=frame.line,
+            frame=frame.raw,
+            chunk_type=row["chunk_type"]
+        ))
+
+        if row["chunk_id"] is not None and row["chunk_id"] not in seen_chunks:
+            seen_chunks.add(row["chunk_id"])
+            chunks.append(TraceFrameResult(
+                id=row["chunk_id"],
+                summary=row["summary"] or f"({row['chunk_type']} block not enriched yet)",
+                filepath=row["filepath"],
+                function_name=row["function_name"],
+                function_id=row["function_id"],
+                class_name=row["class_name"],
+                start_line=row["start_line"],
+                end_line=row["end_line"],
+                complexity_score=row["complexity_score"],
+                business_impact_score=row["business_impact_score"],
+                type="chunk",
+                frame_line=frame.line,
+                chunk_type=row["chunk_type"]
+            ))
+
+    return results + chunks
+
+
+async def analyze_named_frames(conn: asyncpg.Connection, stacktrace: str) -> List[SearchResult]:
+    """`filepath::function` lines matched by name, then enriched chunks of those function names"""
+    lines = parse_frames(stacktrace)
+    frames = [line for line in lines if isinstance(line, tuple)]
+    resolved = iter(await resolve_frames(conn, frames))
+    results: List[SearchResult] = []
+
+    for line in lines:
+        if not isinstance(line, tuple):
+            results.append(SearchResult(
+                id=-1,
+                summary=f"❌ Invalid format: {line}",
+                filepath=None,
+                function_name=None,
+                function_id=None,
+                class_name=None,
+                start_line=None,
+                end_line=None,
+                complexity_score=None,
+                business_impact_score=None,
+                type="error"
+            ))
+            continue
+
+        row = next(resolved)
+        if row["id"] is not None:
+            results.append(SearchResult(
+                id=-1,
+                summary=describe_frame(row),
+                filepath=row["filepath"],
+                function_name=row["function_name"],
+                function_id=row["id"],
+                class_name=None,
+                start_line=None,
+                end_line=None,
+                complexity_score=row["cyclomatic_complexity"],
+                business_impact_score=None,
+                type="function_summary"
+            ))
+        else:
+            results.append(SearchResult(
+                id=-1,
+                summary=f"❌ No function found: {'::'.join(line)}",
+                filepath=row["filepath"],
+                function_name=row["frame_function"],
+                function_id=None,
+                class_name=None,
+                start_line=None,
+                end_line=None,
+                complexity_score=None,
+                business_impact_score=None,
+                type="missing"
+            ))
+
+    # Fetch enriched related chunks
+    if frames:
+        rows = await conn.fetch(RELATED_CHUNKS_QUERY, [function for _, function in frames])
+        for row in rows:
+            result = dict(row)
+            result["type"] = "chunk"
+            results.append(SearchResult(**result))
+
+    return results
+
+
+async def analyze_trace(conn: asyncpg.Connection, stacktrace: str,
+                        frames: List[TraceFrame]) -> Tuple[List[SearchResult], bool]:
+    """Results for a trace and whether they may change when new functions are parsed"""
+    located = [frame for frame in frames if frame.line is not None]
+    if located:
+        results = await analyze_located_frames(conn, located)
+        return results, any(result.type == "missing" for result in results)
+    # Related chunks are matched by function name across all files
+    return await analyze_named_frames(conn, stacktrace), True
+
+
+@router.post("/analyze", response_model=List[TraceFrameResult])
+async def analyze_stacktrace(response: Response, req: StacktraceRequest = Body(...),
+                             conn: asyncpg.Connection = Depends(get_async_db)):
+    """Analyze stacktrace & return uniform SearchResult-style output.
+
+    PHP native, Xdebug and Monolog traces resolve each file/line to the
+    innermost chunk; `filepath::function` lines match functions by name.
+    Occurrences are counted per trace fingerprint (lines ignored); results
+    are cached per trace and lines until a referenced function is re-parsed
+    or re-enriched.
+    """
+    frames = parse_trace(req.stacktrace)
+    if not frames:
+        results, _ = await analyze_trace(conn, req.stacktrace, frames)
+        return results
+
+    fingerprint, normalized = trace_fingerprint(frames)
+    result_key = trace_result_key(frames)
+    response.headers["X-Trace-Fingerprint"] = fingerprint
+    await conn.execute(TRACE_SEEN_QUERY, fingerprint, normalized)
+    cached = await conn.fetchrow(TRACE_RESULT_QUERY, result_key, fingerprint, timedelta(seconds=TRACE_CACHE_TTL))
+    if cached is not None and cached["result"] is not None:
+        response.headers["X-Trace-Cache"] = "hit"
+        results = json.loads(cached["result"])
+        # Same locations; only the frame text (arguments) may differ
+        for result, frame in zip(results, [frame for frame in frames if frame.line is not None]):
+            result["frame"] = frame.raw
+        return results
+
+    response.headers["X-Trace-Cache"] = "miss"
+    results, unresolved = await analyze_trace(conn, req.stacktrace, frames)
+    # No row when a concurrent request created it after this statement's snapshot
+    if cached is not None:
+        function_ids = sorted({result.function_id for result in results if result.function_id is not None})
+        await conn.execute(TRACE_STORE_QUERY, result_key, json.dumps(jsonable_encoder(results)),
+                           function_ids, unresolved, cached["version"])
+    return results
+
+
+@router.get("/traces/fingerprints")
+async def list_trace_fingerprints(limit: int = Query(50, ge=1, le=1000),
+                                  conn: asyncpg.Connection = Depends(get_async_db)):
+    """Most frequent traces with occurrence and cache statistics"""
+    rows = await conn.fetch("""
+        SELECT tf.fingerprint, tf.normalized, tf.hits, tf.computations, tf.first_seen, tf.last_seen,
+               r.variants, r.cached
+        FROM trace_fingerprints tf
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) as variants, COUNT(result) as cached
+            FROM trace_results
+            WHERE fingerprint = tf.fingerprint
+        ) r
+        ORDER BY tf.hits DESC
+        LIMIT $1
+    """, limit)
+    return [dict(row) for row in rows]
+
+
+@router.get("/traces/fingerprints/{fingerprint}")
+async def get_trace_fingerprint(fingerprint: str, conn: asyncpg.Connection = Depends(get_async_db)):
+    """One fingerprint with its cached analyses, one per set of frame lines (null once invalidated)"""
+    row = await conn.fetchrow("""
+        SELECT fingerprint, normalized, hits, computations, first_seen, last_seen
+        FROM trace_fingerprints
+        WHERE fingerprint = $1
+    """, fingerprint)
+    if not row:
+        raise HTTPException(status_code=404, detail="Unknown trace fingerprint")
+    results = await conn.fetch("""
+        SELECT result_key, computed_at, function_ids, unresolved, result
+        FROM trace_results
+        WHERE fingerprint = $1
+        ORDER BY computed_at DESC NULLS LAST
+    """, fingerprint)
+    trace = dict(row)
+    trace["results"] = [
+        {**dict(result), "result": json.loads(result["result"]) if result["result"] is not None else None}
+        for result in results
+    ]
+    return trace
@@ -1,99 +1,111 @@
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any, Tuple
-from .functions import get_db, get_async_db
+from datetime import timedelta
 
-router = APIRouter(prefix="", tags=["stats"])
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+import asyncpg
+
+from .cache import cached, response_cache
+from .database import get_async_db, get_pool
+from .models import ProgressStats
+from .progress import progress_broadcaster
+from .stats_rollup import (
+    CURRENT_STATS_QUERY, HOURLY_ENRICHMENT_QUERY, MAX_NESTING_QUERY, RECENT_ENRICHED_QUERY,
+    average, stats_rollup,
+)
 
+router = APIRouter(prefix="", tags=["stats"])
 
-class ProgressStats(BaseModel):
-    total_chunks: int
-    enriched_chunks: int
-    pending_chunks: int
-    avg_complexity: Optional[float] = None
-    avg_impact: Optional[float] = None
 
-# Stats endpoints
+# Stats endpoints - totals come from the trigger-maintained rollups (see stats_rollup.py)
 @router.get("/stats")
-def get_stats():
+@cached()
+async def get_stats():
     """Get enhanced database statistics"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM files")
-    file_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM functions")
-    function_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM code_chunks")
-    chunk_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM business_tags")
-    tag_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT AVG(cyclomatic_complexity) FROM functions WHERE cyclomatic_complexity > 0")
-    avg_complexity = cursor.fetchone()[0] or 0
-    
-    cursor.execute("SELECT MAX(nesting_level) FROM code_chunks")
-    max_nesting = cursor.fetchone()[0] or 0
-    
-    cursor.close()
-    conn.close()
+    async with get_pool().acquire() as conn:
+        row = await conn.fetchrow(CURRENT_STATS_QUERY)
+        max_nesting = await conn.fetchval(MAX_NESTING_QUERY)
     
-    return {
-        "files": file_count,
-        "functions": function_count,
-        "chunks": chunk_count,
-        "business_tags": tag_count,
-        "avg_complexity": round(float(avg_complexity), 2),
-        "max_nesting_level": max_nesting,
-        "database": "postgresql-enhanced"
-    }
+        return {
+            "files": row["files"],
+            "functions": row["functions"],
+            "chunks": row["chunks"],
+            "business_tags": row["business_tags"],
+            "avg_complexity": average(row["function_complexity_sum"], row["function_complexity_count"], 2) or 0,
+            "max_nesting_level": max_nesting or 0,
+            "database": "postgresql-enhanced"
+        }
 
 @router.get("/stats/progress", response_model=ProgressStats)
-async def get_progress():
+async def get_progress(conn: asyncpg.Connection = Depends(get_async_db)):
     """Get overall enrichment progress"""
-    conn = await get_async_db()
-    try:
-        query = """
-        SELECT 
-            COUNT(*) as total_chunks,
-            COUNT(enriched_at) as enriched_chunks,
-            COUNT(*) - COUNT(enriched_at) as pending_chunks,
-            ROUND(AVG(complexity_score)::numeric, 2) as avg_complexity,
-            ROUND(AVG(business_impact_score)::numeric, 2) as avg_impact
-        FROM code_chunks
-        """
-        row = await conn.fetchrow(query)
-        return ProgressStats(**dict(row))
-    finally:
-        await conn.close()
+    row = await conn.fetchrow(CURRENT_STATS_QUERY)
+    return ProgressStats(
+        total_chunks=row["chunks"],
+        enriched_chunks=row["enriched_chunks"],
+        pending_chunks=row["chunks"] - row["enriched_chunks"],
+        avg_complexity=average(row["complexity_sum"], row["complexity_count"], 2),
+        avg_impact=average(row["impact_sum"], row["impact_count"], 2),
+    )
+
+
+@router.get("/stats/progress/stream")
+async def stream_progress():
+    """Server-sent progress events (counts, chunks/minute, ETA) pushed on enrichment writes
+
+    All clients share one background reader, so database load does not grow
+    with the number of open dashboards.
+    """
+    return StreamingResponse(
+        progress_broadcaster.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/stats/summary")
+@cached(ttl=60)
 async def get_summary_stats():
     """Get summary statistics for the dashboard"""
-    conn = await get_async_db()
-    try:
-        query = """
-        SELECT 
-            (SELECT COUNT(*) FROM files) as total_files,
-            (SELECT COUNT(*) FROM functions) as total_functions,
-            (SELECT COUNT(*) FROM code_chunks) as total_chunks,
-            (SELECT COUNT(*) FROM code_chunks WHERE enriched_at IS NOT NULL) as enriched_chunks,
-            (SELECT COUNT(*) FROM code_chunks WHERE enriched_at > NOW() - INTERVAL '1 hour') as recent_enriched,
-            (SELECT ROUND(AVG(complexity_score)::numeric, 3) FROM code_chunks WHERE complexity_score IS NOT NULL) as avg_complexity,
-            (SELECT ROUND(AVG(business_impact_score)::numeric, 3) FROM code_chunks WHERE business_impact_score IS NOT NULL) as avg_impact,
-            (SELECT COUNT(*) FROM functions WHERE id IN (
-                SELECT function_id FROM code_chunks 
-                WHERE complexity_score > 0.7 
-                GROUP BY function_id
-            )) as high_complexity_functions
-        """
-        
-        row = await conn.fetchrow(query)
-        return dict(row)
-    finally:
-        await conn.close()
+    async with get_pool().acquire() as conn:
+        row = await conn.fetchrow(CURRENT_STATS_QUERY)
+        recent_enriched = await conn.fetchval(RECENT_ENRICHED_QUERY, timedelta(hours=1))
+
+        return {
+            "total_files": row["files"],
+            "total_functions": row["functions"],
+            "total_chunks": row["chunks"],
+            "enriched_chunks": row["enriched_chunks"],
+            "recent_enriched": recent_enriched,
+            "avg_complexity": average(row["complexity_sum"], row["complexity_count"], 3),
+            "avg_impact": average(row["impact_sum"], row["impact_count"], 3),
+            "high_complexity_functions": row["high_complexity_functions"],
+        }
+
+
+@router.get("/stats/hourly")
+async def get_hourly_enrichment(
+    hours: int = Query(24, ge=1, le=24 * 30),
+    conn: asyncpg.Connection = Depends(get_async_db)
+):
+    """Enriched chunks per hour for the last `hours` hours"""
+    rows = await conn.fetch(HOURLY_ENRICHMENT_QUERY, timedelta(hours=hours))
+    return [{"hour": row["hour"], "enriched": row["chunks"]} for row in rows]
+
+
+@router.get("/stats/cache")
+async def get_cache_stats():
+    """Response cache hit/miss counters of this API process"""
+    return {**response_cache.stats, "entries": len(response_cache.local),
+            "redis": response_cache.redis is not None}
+
+
+@router.get("/stats/rollup")
+async def get_rollup_status(conn: asyncpg.Connection = Depends(get_async_db)):
+    """Pending trigger deltas and the last compaction/reconciliation of the statistics rollup"""
+    row = await conn.fetchrow("""
+        SELECT reconciled_at, (SELECT COUNT(*) FROM stats_rollup_deltas) as pending_deltas
+        FROM stats_rollup
+    """)
+    return {**dict(row), "last_compacted": stats_rollup.last_compacted,
+            "last_reconciled": stats_rollup.last_reconciled}
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+import asyncpg
+
+# Deltas appended by the statistics triggers are folded into stats_rollup this often
+STATS_COMPACT_INTERVAL = float(os.getenv("STATS_COMPACT_INTERVAL", "30"))
+# Full recount against the source tables
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+# Several API workers share one maintenance job
+STATS_LOCK_ID = 0x5747_5354
+
+CURRENT_STATS_QUERY = "SELECT * FROM stats_current"
+MAX_NESTING_QUERY = "SELECT MAX(nesting_level) FROM stats_nesting_current"
+# Index range scan on idx_chunks_enriched, independent of table size
+RECENT_ENRICHED_QUERY = "SELECT COUNT(*) FROM code_chunks WHERE enriched_at > NOW() - $1::interval"
+HOURLY_ENRICHMENT_QUERY = """
+    SELECT hour, chunks FROM stats_enrichment_hourly_current
+    WHERE hour > date_trunc('hour', NOW()) - $1::interval
+    ORDER BY hour
+"""
+
+
+def average(total: float, count: int, digits: int) -> Optional[float]:
+    return round(float(total) / count, digits) if count else None
+
+
+class StatsRollup:
+    """Background compaction and reconciliation of the statistics rollup tables"""
+
+    def __init__(self):
+        self.last_compacted: Optional[float] = None
+        self.last_reconciled: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _locked(self, conn: asyncpg.Connection, statement: str):
+        """Run statement under the shared advisory lock; None if another worker holds it"""
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", STATS_LOCK_ID):
+            return None
+        try:
+            return await conn.fetchval(statement)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", STATS_LOCK_ID)
+
+    async def compact(self, conn: asyncpg.Connection) -> Optional[int]:
+        folded = await self._locked(conn, "SELECT compact_stats_rollup()")
+        self.last_compacted = time.time()
+        return folded
+
+    async def reconcile(self, conn: asyncpg.Connection) -> Optional[dict]:
+        drift = await self._locked(conn, "SELECT reconcile_stats_rollup()::text")
+        self.last_reconciled = time.time()
+        if drift is None:
+            return None
+        drift = json.loads(drift)
+        if any(drift.values()):
+            print(f"⚠️  Statistics rollup drift corrected: {drift}")
+        return drift
+
+    async def _loop(self, pool: asyncpg.Pool):
+        while True:
+            await asyncio.sleep(STATS_COMPACT_INTERVAL)
+            try:
+                async with pool.acquire() as conn:
+                    if time.time() - (self.last_reconciled or 0) >= STATS_RECONCILE_INTERVAL:
+                        await self.reconcile(conn)
+                    else:
+                        await self.compact(conn)
+            except (asyncpg.PostgresError, OSError) as e:
+                print(f"⚠️  Statistics rollup maintenance failed: {e}")
+
+    async def start(self, pool: asyncpg.Pool):
+        async with pool.acquire() as conn:
+            # A fresh database (or one loaded before the triggers existed) starts from a recount
+            if await conn.fetchval("SELECT reconciled_at IS NULL FROM stats_rollup"):
+                await self.reconcile(conn)
+                print("📊 Statistics rollup reconciled")
+            else:
+                self.last_reconciled = time.time()
+        self._task = asyncio.create_task(self._loop(pool))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+stats_rollup = StatsRollup()
@@ -1,59 +1,36 @@
+from fastapi import APIRouter, Depends
+import asyncpg
 
-from fastapi import APIRouter
-from app.routes.models import SearchResult, ProgressStats, StacktraceRequest
+from .database import get_async_db
+from .models import StacktraceRequest
+from .stacktrace import analyze_located_frames, describe_frame, parse_frames, resolve_frames
+from .traces import parse_trace
 
 router = APIRouter(prefix="", tags=["summaries"])
 
 
 # Analysis endpoints
-@router.post("/summarize") 
-def summarize_stacktrace(req: StacktraceRequest):
+@router.post("/summarize")
+async def summarize_stacktrace(req: StacktraceRequest, conn: asyncpg.Connection = Depends(get_async_db)):
     """Enhanced stacktrace analysis with complexity metrics"""
-    lines = req.stacktrace.strip().splitlines()
+    located = [frame for frame in parse_trace(req.stacktrace) if frame.line is not None]
+    if located:
+        results = await analyze_located_frames(conn, located)
+        return {"summaries": [result.summary for result in results if result.type != "chunk"]}
+
+    lines = parse_frames(req.stacktrace)
+    resolved = iter(await resolve_frames(conn, [line for line in lines if isinstance(line, tuple)]))
     summaries = []
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
+
     for line in lines:
-        if "::" not in line:
+        if not isinstance(line, tuple):
             summaries.append(f"❌ Invalid format: {line}")
             continue
-            
-        filepath, function = line.split("::", 1)
-        
-        cursor.execute("""
-            SELECT 
-                f.function_name,
-                f.visibility,
-                f.is_static,
-                f.cyclomatic_complexity,
-                f.parameter_count,
-                f.lines_of_code,
-                COUNT(c.id) as chunk_count,
-                ARRAY_AGG(DISTINCT c.chunk_type) FILTER (WHERE c.chunk_type IS NOT NULL) as chunk_types,
-                MAX(c.nesting_level) as max_nesting
-            FROM functions f 
-            JOIN files fl ON f.file_id = fl.id
-            LEFT JOIN code_chunks c ON f.id = c.function_id 
-            WHERE fl.filepath = %s AND f.function_name = %s
-            GROUP BY f.id, f.function_name, f.visibility, f.is_static, 
-                     f.cyclomatic_complexity, f.parameter_count, f.lines_of_code
-        """, (filepath, function))
-        
-        result = cursor.fetchone()
-        if result:
-            name, visibility, is_static, complexity, params, lines, chunks, types, max_nest = result
-            static_text = "static " if is_static else ""
-            vis_text = f"{visibility} " if visibility else ""
-            complexity_text = f"complexity:{complexity}" if complexity else "complexity:?"
-            
-            summary = f"✅ {vis_text}{static_text}{name} ({chunks} chunks, {complexity_text}, max nesting:{max_nest or 0})"
-            summaries.append(summary)
+
+        row = next(resolved)
+        if row["id"] is not None:
+            summaries.append(describe_frame(row))
         else:
-            summaries.append(f"❌ No function found: {line}")
-    
-    cursor.close()
-    conn.close()
-    
+            summaries.append(f"❌ No function found: {'::'.join(line)}")
+
     return {"summaries": summaries}
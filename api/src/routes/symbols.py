@@ -0,0 +1,181 @@
+import asyncio
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+SYMBOL_REFRESH_INTERVAL = float(os.getenv("SYMBOL_REFRESH_INTERVAL", "10"))
+# Re-read rows changed this long before the last refresh; parser transactions
+# stamp updated_at when they start, not when they commit
+SYMBOL_REFRESH_OVERLAP = float(os.getenv("SYMBOL_REFRESH_OVERLAP", "60"))
+FUZZY_MIN_SIMILARITY = float(os.getenv("AUTOCOMPLETE_FUZZY_MIN_SIMILARITY", "0.3"))
+
+KIND_ORDER = {"function": 0, "class": 1, "file": 2}
+
+SYMBOL_ROWS_QUERY = """
+    SELECT f.id, f.function_name, f.class_name, files.filepath, f.updated_at
+    FROM functions f
+    JOIN files ON f.file_id = files.id
+    WHERE f.updated_at > $1
+"""
+
+
+@dataclass(frozen=True)
+class Symbol:
+    kind: str
+    name: str
+    detail: str
+    filepath: str
+    function_id: Optional[int] = None
+
+
+def name_keys(name: str) -> List[str]:
+    """Lowercase keys a name is found under: the name and every camelCase/snake_case suffix"""
+    starts = [0] + [m.start() for m in re.finditer(r"(?<=[a-z0-9])(?=[A-Z])|(?<=_)(?=[A-Za-z0-9])", name)]
+    return list(dict.fromkeys(name[i:].lower() for i in starts if name[i:]))
+
+
+def trigrams(text: str) -> List[str]:
+    padded = f"  {text.lower()} "
+    return list({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+class SymbolSnapshot:
+    """Immutable lookup structures: sorted keys for prefixes, trigram postings for typos"""
+
+    def __init__(self, symbols: List[Symbol]):
+        self.symbols = symbols
+        keys: List[Tuple[str, int]] = []
+        self.trigrams: Dict[str, List[int]] = {}
+        self.trigram_counts: List[int] = []
+        for i, symbol in enumerate(symbols):
+            for key in name_keys(symbol.name):
+                keys.append((key, i))
+            grams = trigrams(symbol.name)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(i)
+        keys.sort()
+        self.keys = [key for key, _ in keys]
+        self.key_symbols = [i for _, i in keys]
+
+    def _rank(self, query: str, i: int) -> Tuple:
+        symbol = self.symbols[i]
+        name = symbol.name.lower()
+        return (name != query, not name.startswith(query), KIND_ORDER[symbol.kind], len(name), name)
+
+    def prefix(self, query: str, limit: int, kinds: Optional[set] = None) -> List[Tuple[Symbol, float]]:
+        query = query.lower()
+        found = set()
+        pos = bisect_left(self.keys, query)
+        while pos < len(self.keys) and self.keys[pos].startswith(query):
+            i = self.key_symbols[pos]
+            if kinds is None or self.symbols[i].kind in kinds:
+                found.add(i)
+            pos += 1
+        ranked = sorted(found, key=lambda i: self._rank(query, i))[:limit]
+        return [(self.symbols[i], 1.0) for i in ranked]
+
+    def fuzzy(self, query: str, limit: int, kinds: Optional[set] = None,
+              exclude: Optional[set] = None) -> List[Tuple[Symbol, float]]:
+        """Trigram similarity (Dice coefficient) above FUZZY_MIN_SIMILARITY"""
+        query_grams = trigrams(query)
+        counts = Counter()
+        for gram in query_grams:
+            counts.update(self.trigrams.get(gram, ()))
+        scored = []
+        for i, common in counts.items():
+            symbol = self.symbols[i]
+            if (kinds is not None and symbol.kind not in kinds) or (exclude and symbol in exclude):
+                continue
+            similarity = 2 * common / (len(query_grams) + self.trigram_counts[i])
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append((similarity, i))
+        scored.sort(key=lambda s: (-s[0], KIND_ORDER[self.symbols[s[1]].kind], len(self.symbols[s[1]].name)))
+        return [(self.symbols[i], round(similarity, 3)) for similarity, i in scored[:limit]]
+
+
+def build_snapshot(functions: Dict[int, Tuple[str, Optional[str], str]]) -> SymbolSnapshot:
+    symbols: List[Symbol] = []
+    classes, files = set(), set()
+    for function_id, (function_name, class_name, filepath) in functions.items():
+        detail = f"{class_name}::{function_name}" if class_name else function_name
+        symbols.append(Symbol("function", function_name, detail, filepath, function_id))
+        if class_name:
+            classes.add((class_name, filepath))
+        files.add(filepath)
+    symbols.extend(Symbol("class", name, filepath, filepath) for name, filepath in sorted(classes))
+    symbols.extend(Symbol("file", os.path.basename(path), path, path) for path in sorted(files))
+    return SymbolSnapshot(symbols)
+
+
+class SymbolIndex:
+    """Function, class and file names kept in the API process for autocomplete
+
+    Loaded once at startup; afterwards only functions whose updated_at moved are
+    re-read, and the lookup structures are rebuilt off the event loop and swapped
+    in. A changed row count (deleted files) triggers a full reload.
+    """
+
+    def __init__(self):
+        self.functions: Dict[int, Tuple[str, Optional[str], str]] = {}
+        self.snapshot: Optional[SymbolSnapshot] = None
+        self.last_updated = datetime.min
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self, conn: asyncpg.Connection, full: bool = False) -> int:
+        """Apply changed functions; returns the number of changed rows"""
+        full = full or self.snapshot is None
+        since = datetime.min if full else self.last_updated - timedelta(seconds=SYMBOL_REFRESH_OVERLAP)
+        rows = await conn.fetch(SYMBOL_ROWS_QUERY, since)
+
+        functions = {} if full else dict(self.functions)
+        changed = 0
+        for row in rows:
+            entry = (row["function_name"], row["class_name"], row["filepath"])
+            if functions.get(row["id"]) != entry:
+                functions[row["id"]] = entry
+                changed += 1
+            if row["updated_at"] and row["updated_at"] > self.last_updated:
+                self.last_updated = row["updated_at"]
+
+        # Deleted functions leave no updated_at trace
+        if not full and await conn.fetchval("SELECT COUNT(*) FROM functions") != len(functions):
+            return await self.refresh(conn, full=True)
+
+        if changed or full:
+            self.snapshot = await asyncio.to_thread(build_snapshot, functions)
+            self.functions = functions
+        return changed
+
+    async def _refresh_loop(self, pool: asyncpg.Pool):
+        while True:
+            await asyncio.sleep(SYMBOL_REFRESH_INTERVAL)
+            try:
+                async with pool.acquire() as conn:
+                    await self.refresh(conn)
+            except (asyncpg.PostgresError, OSError) as e:
+                print(f"⚠️  Symbol index refresh failed: {e}")
+
+    async def start(self, pool: asyncpg.Pool):
+        async with pool.acquire() as conn:
+            await self.refresh(conn, full=True)
+        print(f"🔤 Symbol index loaded: {len(self.snapshot.symbols)} symbols")
+        self._task = asyncio.create_task(self._refresh_loop(pool))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+symbol_index = SymbolIndex()
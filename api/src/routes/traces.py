@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+
+# Container/deploy paths mapped to the parser's paths, e.g. "/var/www/html/=,/srv/app/=legacy/"
+TRACE_PATH_PREFIXES = [
+    tuple(rule.split("=", 1)) for rule in
+    os.getenv("TRACE_PATH_PREFIXES", "/workspace/code/=,/var/www/html/=,/var/www/=,/app/=").split(",")
+    if "=" in rule
+]
+# Also try ever shorter path suffixes when no prefix rule yields a known file
+TRACE_PATH_SUFFIX_MATCH = os.getenv("TRACE_PATH_SUFFIX_MATCH", "true").lower() == "true"
+
+# #3 /var/www/src/Table.php(123): Foo\Table->render()
+NATIVE_FRAME = re.compile(r"^\s*#\d+\s+(?P<file>[^\s(]+)\((?P<line>\d+)\)(?::\s*(?P<call>.*?))?\s*$")
+# 0.0010  411232   2. Foo\Table->render($x = 1) /var/www/src/Table.php:123   (optionally "PHP   2. ...")
+XDEBUG_FRAME = re.compile(r"^\s*(?:PHP\s+)?(?:[\d.]+\s+\d+\s+)?\d+\.\s+(?P<call>.+?)\s+(?P<file>\S+\.php):(?P<line>\d+)\s*$")
+# Uncaught X: msg in /path/File.php:45 | thrown in /path/File.php on line 45 | Monolog "... at /path/File.php:45)"
+THROWN_AT = re.compile(r"\b(?:in|at) (?P<file>[^\s()]+\.php)(?::(?P<l1>\d+)|\((?P<l2>\d+)\)| on line (?P<l3>\d+))")
+# First frame of a native ("#0 ...") or Xdebug ("1. {main}() ...") stack
+STACK_START = re.compile(r"^\s*(?:#0\s|(?:PHP\s+)?(?:[\d.]+\s+\d+\s+)?1\.\s)")
+# Foo\Table->render(...) / Foo\Table::create(...) / helper(...)
+CALL = re.compile(r"^(?:(?P<class>[\w\\]+)(?:->|::))?(?P<function>[\w{}]+)\(")
+# Monolog normalized trace entries: "/path/File.php:45"
+FILE_LINE = re.compile(r"^(?P<file>.+\.php):(?P<line>\d+)$")
+# filepath::function, the analyzer's original input format
+SYNTHETIC_FRAME = re.compile(r"^(?P<file>[^\s:()]+)::(?P<function>\w+)$")
+
+
+@dataclass(frozen=True)
+class TraceFrame:
+    """One frame, innermost first; line is None for filepath::function input"""
+    filepath: str
+    line: Optional[int]
+    function: Optional[str] = None
+    class_name: Optional[str] = None
+    raw: str = ""
+
+
+def _call(call: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    match = CALL.match(call or "")
+    if not match:
+        return None, None
+    class_name = match.group("class")
+    return match.group("function"), class_name.rsplit("\\", 1)[-1] if class_name else None
+
+
+def _monolog_frames(record: Dict) -> Iterator[TraceFrame]:
+    """context.exception (and its previous exceptions) of a JSON-formatted Monolog record"""
+    exception = (record.get("context") or {}).get("exception")
+    while isinstance(exception, dict):
+        for location in [exception.get("file")] + list(exception.get("trace") or []):
+            match = FILE_LINE.match(location) if isinstance(location, str) else None
+            if match:
+                yield TraceFrame(match.group("file"), int(match.group("line")), raw=location)
+        exception = exception.get("previous")
+
+
+def classify_line(line: str) -> Tuple[str, List[TraceFrame]]:
+    """Kind of a log line ("json", "native", "xdebug", "synthetic", "thrown" or "") and its frames"""
+    stripped = line.strip()
+    if not stripped:
+        return "", []
+
+    if stripped.startswith("{"):
+        try:
+            return "json", list(_monolog_frames(json.loads(stripped)))
+        except (ValueError, AttributeError):
+            pass
+
+    match = NATIVE_FRAME.match(stripped)
+    if match:
+        function, class_name = _call(match.group("call"))
+        return "native", [TraceFrame(match.group("file"), int(match.group("line")), function, class_name, stripped)]
+
+    match = XDEBUG_FRAME.match(stripped)
+    if match:
+        # Line 0 is the script entry ({main}), not a location in the code
+        if int(match.group("line")) == 0:
+            return "xdebug", []
+        function, class_name = _call(match.group("call"))
+        return "xdebug", [TraceFrame(match.group("file"), int(match.group("line")), function, class_name, stripped)]
+
+    match = SYNTHETIC_FRAME.match(stripped)
+    if match:
+        return "synthetic", [TraceFrame(match.group("file"), None, match.group("function"), raw=stripped)]
+
+    match = THROWN_AT.search(stripped)
+    if match:
+        line_number = int(match.group("l1") or match.group("l2") or match.group("l3"))
+        return "thrown", [TraceFrame(match.group("file"), line_number, raw=stripped)]
+
+    return "", []
+
+
+class TraceBuilder:
+    """Collects the frames of one trace, innermost first
+
+    Xdebug lists the outermost call first; its frames are reversed on build.
+    A thrown-at location already present as a frame ("Uncaught ... in X:45"
+    and "thrown in X on line 45") is not added twice.
+    """
+
+    def __init__(self, max_frames: Optional[int] = None):
+        self.max_frames = max_frames
+        self.frames: List[TraceFrame] = []
+        self.xdebug: List[TraceFrame] = []
+        self.kinds = set()
+
+    def add(self, kind: str, frames: List[TraceFrame]):
+        self.kinds.add(kind)
+        target = self.xdebug if kind == "xdebug" else self.frames
+        for frame in frames:
+            if kind == "thrown" and any((f.filepath, f.line) == (frame.filepath, frame.line) for f in self.frames):
+                continue
+            if self.max_frames is None or len(self.frames) + len(self.xdebug) < self.max_frames:
+                target.append(frame)
+
+    def build(self) -> List[TraceFrame]:
+        return self.frames + self.xdebug[::-1]
+
+
+class TraceSegmenter:
+    """Splits a log stream into traces, one line at a time
+
+    A trace ends at the next exception header, at a new "#0"/"1." stack once
+    the current one has frames of that kind, after a "thrown in" line, or at
+    a JSON record (which is a trace of its own). Only the current trace is
+    held in memory, capped at max_frames.
+    """
+
+    def __init__(self, max_frames: int):
+        self.max_frames = max_frames
+        self.current: Optional[TraceBuilder] = None
+
+    def _finish(self) -> List[List[TraceFrame]]:
+        builder, self.current = self.current, None
+        frames = builder.build() if builder else []
+        return [frames] if frames else []
+
+    def feed(self, line: str) -> List[List[TraceFrame]]:
+        """Traces completed by this line"""
+        kind, frames = classify_line(line)
+        if not kind:
+            return []
+        if kind == "json":
+            return self._finish() + ([frames] if frames else [])
+
+        done = []
+        closing = kind == "thrown" and line.lstrip().startswith("thrown")
+        if self.current is not None and not closing and (
+                kind == "thrown" or (STACK_START.match(line) and kind in self.current.kinds)):
+            done = self._finish()
+        if self.current is None:
+            self.current = TraceBuilder(self.max_frames)
+        self.current.add(kind, frames)
+        return done + (self._finish() if closing else [])
+
+    def close(self) -> List[List[TraceFrame]]:
+        return self._finish()
+
+
+def parse_trace(text: str) -> List[TraceFrame]:
+    """Frames of PHP native, Xdebug, Monolog (line or JSON) or filepath::function traces
+
+    Lines that are not frames (messages, "Stack trace:", {main}) are skipped.
+    Every format comes back innermost first.
+    """
+    builder = TraceBuilder()
+    for line in text.splitlines():
+        kind, frames = classify_line(line)
+        if kind:
+            builder.add(kind, frames)
+    return builder.build()
+
+
+def path_candidates(path: str) -> List[str]:
+    """Stored filepaths a trace path may refer to, most specific first"""
+    candidates = []
+    for prefix, replacement in TRACE_PATH_PREFIXES:
+        if path.startswith(prefix):
+            candidates.append(replacement + path[len(prefix):])
+            break
+    candidates.append(path.lstrip("/"))
+    if TRACE_PATH_SUFFIX_MATCH:
+        parts = path.strip("/").split("/")
+        candidates.extend("/".join(parts[i:]) for i in range(1, len(parts)))
+    return list(dict.fromkeys(candidates))
+
+
+def trace_fingerprint(frames: List[TraceFrame]) -> Tuple[str, str]:
+    """SHA-1 and text of the normalized trace
+
+    Frames are reduced to rewritten path and called function, dropping line
+    numbers (which move with every deploy) and argument values. Frames
+    without a function (Monolog, "thrown in") are reduced to their path.
+    """
+    lines = []
+    for frame in frames:
+        path = path_candidates(frame.filepath)[0]
+        if frame.function:
+            qualified = f"{frame.class_name}::{frame.function}" if frame.class_name else frame.function
+            lines.append(f"{path} {qualified}")
+        else:
+            lines.append(path)
+    normalized = "\n".join(lines)
+    return hashlib.sha1(normalized.encode()).hexdigest(), normalized
+
+
+def trace_result_key(frames: List[TraceFrame]) -> str:
+    """SHA-1 of the normalized trace with its lines, which /analyze results depend on
+
+    The fingerprint groups a trace across deploys; a cached result is only
+    valid for traces whose frames fall on the same lines.
+    """
+    lines = []
+    for frame in frames:
+        qualified = f"{frame.class_name}::{frame.function}" if frame.class_name else frame.function or ""
+        lines.append(f"{path_candidates(frame.filepath)[0]} {qualified}:{frame.line}")
+    return hashlib.sha1("\n".join(lines).encode()).hexdigest()
+
+
+# Innermost function, then innermost chunk, containing each (file, line); both
+# lookups are answered by the btree_gist range indexes idx_*_line_range
+FRAME_LOCATIONS_QUERY = """
+    SELECT
+        fr.position,
+        fr.line,
+        f.id as function_id,
+        f.function_name,
+        f.class_name,
+        f.visibility,
+        f.is_static,
+        f.cyclomatic_complexity,
+        cc.id as chunk_id,
+        cc.chunk_index,
+        cc.chunk_type,
+        cc.nesting_level,
+        cc.start_line,
+        cc.end_line,
+        cc.summary,
+        cc.complexity_score,
+        cc.business_impact_score
+    FROM unnest($1::int[], $2::int[]) WITH ORDINALITY AS fr(file_id, line, position)
+    LEFT JOIN LATERAL (
+        SELECT * FROM functions
+        WHERE file_id = fr.file_id
+        AND start_line IS NOT NULL AND end_line IS NOT NULL
+        AND int4range(start_line, end_line, '[]') @> fr.line
+        ORDER BY end_line - start_line
+        LIMIT 1
+    ) f ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT * FROM code_chunks
+        WHERE function_id = f.id
+        AND start_line IS NOT NULL AND end_line IS NOT NULL
+        AND int4range(start_line, end_line, '[]') @> fr.line
+        ORDER BY nesting_level DESC, end_line - start_line
+        LIMIT 1
+    ) cc ON TRUE
+    ORDER BY fr.position
+"""
+
+
+async def resolve_locations(conn: asyncpg.Connection, frames: List[TraceFrame]) -> List[Dict]:
+    """Per frame (in order): the stored filepath and the innermost function/chunk at its line"""
+    candidates = {frame.filepath: path_candidates(frame.filepath) for frame in frames}
+    known = {
+        row["filepath"]: row["id"] for row in await conn.fetch(
+            "SELECT id, filepath FROM files WHERE filepath = ANY($1::text[])",
+            list({path for paths in candidates.values() for path in paths}))
+    }
+    filepaths = [next((path for path in candidates[frame.filepath] if path in known), None) for frame in frames]
+
+    rows = await conn.fetch(FRAME_LOCATIONS_QUERY,
+                            [known.get(path) for path in filepaths],
+                            [frame.line for frame in frames])
+    return [{**dict(row), "filepath": path} for row, path in zip(rows, filepaths)]
@@ -35,6 +35,14 @@ class APIClient {
         return this.request('/stats/progress');
     }
 
+    // Server-sent progress updates; returns the EventSource so the caller can close it
+    streamProgress(onProgress, onError) {
+        const source = new EventSource(`${this.baseURL}/stats/progress/stream`);
+        source.addEventListener('progress', (event) => onProgress(JSON.parse(event.data)));
+        if (onError) source.onerror = onError;
+        return source;
+    }
+
     // Function endpoints
     async getFunctions(limit = CONFIG.FUNCTIONS_LIMIT) {
         return this.request(`/functions?limit=${limit}&include_stats=true`);
@@ -50,6 +58,17 @@ class APIClient {
         return this.request(`/search?q=${encodeURIComponent(query)}&limit=${CONFIG.SEARCH_LIMIT}&fuzzy=${fuzzy}`);
     }
 
+    async autocomplete(query, limit = 10) {
+        if (!query.trim()) return [];
+        return this.request(`/autocomplete?q=${encodeURIComponent(query)}&limit=${limit}`);
+    }
+
+    async searchSemantic(query, filters = {}) {
+        if (!query.trim()) return [];
+        const params = new URLSearchParams({ q: query, limit: CONFIG.SEARCH_LIMIT, ...filters });
+        return this.request(`/search/semantic?${params}`);
+    }
+
     // Analysis endpoints
     async analyzeStacktrace(stacktrace) {
         return this.request('/analyze', {
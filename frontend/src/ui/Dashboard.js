@@ -17,6 +17,7 @@ export class Dashboard {
     constructor() {
         this.initializeComponents();
         this.autoRefreshInterval = null;
+        this.progressStream = null;
     }
 
     initializeComponents() {
@@ -168,16 +169,30 @@ export class Dashboard {
         if (this.analyticsCard) this.analyticsCard.renderError(message);
     }
 
-    startAutoRefresh() {
-        // Clear any existing interval
-        if (this.autoRefreshInterval) {
-            clearInterval(this.autoRefreshInterval);
+    async refreshFunctions() {
+        try {
+            const functions = await api.getFunctions();
+            store.setFunctions(functions);
+            if (this.functionsList) this.functionsList.render(functions);
+            if (this.analyticsCard) this.analyticsCard.render(functions);
+        } catch (error) {
+            console.error('Failed to refresh functions:', error);
         }
-        
+    }
+
+    startAutoRefresh() {
+        this.stopAutoRefresh();
+
+        // Progress is pushed by the API; EventSource reconnects on its own
+        this.progressStream = api.streamProgress((progress) => {
+            store.setProgress(progress);
+            if (this.progressCard) this.progressCard.render(progress);
+        }, () => console.warn('Progress stream interrupted, reconnecting...'));
+
         this.autoRefreshInterval = setInterval(() => {
             const { autoRefresh, isLoading } = store.getState();
             if (autoRefresh && !isLoading) {
-                this.load();
+                this.refreshFunctions();
             }
         }, CONFIG.AUTO_REFRESH_INTERVAL);
     }
@@ -187,5 +202,9 @@ export class Dashboard {
             clearInterval(this.autoRefreshInterval);
             this.autoRefreshInterval = null;
         }
+        if (this.progressStream) {
+            this.progressStream.close();
+            this.progressStream = null;
+        }
     }
 } 
\ No newline at end of file
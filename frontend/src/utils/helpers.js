@@ -23,9 +23,13 @@ export function calculateProgress(progress) {
         ? (progress.enriched_chunks / progress.total_chunks * 100).toFixed(1)
         : 0;
     
-    const eta = progress.pending_chunks > 0 
-        ? Math.ceil(progress.pending_chunks / CONFIG.CHUNKS_PER_MINUTE)
-        : 0;
+    // Streamed progress carries the measured rate; fall back to the configured one
+    let eta = 0;
+    if (progress.pending_chunks > 0) {
+        eta = progress.eta_seconds != null
+            ? Math.ceil(progress.eta_seconds / 60)
+            : Math.ceil(progress.pending_chunks / CONFIG.CHUNKS_PER_MINUTE);
+    }
 
     return { percentage, eta };
 }
@@ -56,7 +60,8 @@ export function getTopComplexFunctions(functions, limit = CONFIG.MAX_COMPLEX_FUN
 }
 
 export function isStacktraceInput(input) {
-    return input.includes('::');
+    // filepath::function lines, or PHP/Xdebug/Monolog frames with a file and line
+    return input.includes('::') || /\.php(\(\d+\)|:\d+| on line \d+)/.test(input);
 }
 
 export function debounce(func, wait) {
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+ANN recall/latency benchmark
+Runs a fixed sample of chunk embeddings as queries against the active vector
+index for each ef_search (HNSW) or probes (IVFFlat) setting and compares the
+top-k with exact brute-force results. Reports recall@k against p50/p99 latency,
+so index parameters (see vector_index.py) and the search API defaults can be
+picked per use case.
+
+Usage: python src/bench_ann.py [--queries 100] [--k 10]
+       python src/bench_ann.py --ef-search 20,40,80,160 --output ann.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+import asyncpg
+from typing import Dict, List, Sequence, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import EnricherConfig
+from vector_index import ann_indexes
+
+NEAREST_QUERY = """
+SELECT id FROM code_chunks
+WHERE embedding IS NOT NULL
+ORDER BY embedding <=> $1::vector
+LIMIT $2
+"""
+
+
+async def sample_queries(conn: asyncpg.Connection, count: int, seed: str) -> List[str]:
+    """Stable sample of stored embeddings used as query vectors"""
+    rows = await conn.fetch("""
+    SELECT embedding::text as embedding FROM code_chunks
+    WHERE embedding IS NOT NULL
+    ORDER BY md5(id::text || $2)
+    LIMIT $1
+    """, count, seed)
+    return [row['embedding'] for row in rows]
+
+
+async def exact_neighbours(conn: asyncpg.Connection, queries: Sequence[str], k: int) -> Tuple[List[List[int]], List[float]]:
+    """Brute-force top-k with index scans disabled"""
+    results, latencies = [], []
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_indexscan = off")
+        await conn.execute("SET LOCAL enable_bitmapscan = off")
+        for query in queries:
+            start = time.perf_counter()
+            rows = await conn.fetch(NEAREST_QUERY, query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append([row['id'] for row in rows])
+    return results, latencies
+
+
+async def ann_neighbours(conn: asyncpg.Connection, queries: Sequence[str], k: int,
+                         setting: str, value: int) -> Tuple[List[List[int]], List[float]]:
+    results, latencies = [], []
+    async with conn.transaction():
+        await conn.execute(f"SET LOCAL {setting} = {int(value)}")
+        # Warm up so the first query does not pay for loading the index
+        await conn.fetch(NEAREST_QUERY, queries[0], k)
+        for query in queries:
+            start = time.perf_counter()
+            rows = await conn.fetch(NEAREST_QUERY, query, k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append([row['id'] for row in rows])
+    return results, latencies
+
+
+def recall_at_k(approximate: List[List[int]], exact: List[List[int]]) -> float:
+    hits = [len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact) if e]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def summarize(label: str, latencies: List[float], recall: float) -> Dict:
+    return {
+        "setting": label,
+        "recall": round(recall, 4),
+        "p50_latency_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_latency_ms": round(float(np.percentile(latencies, 99)), 2),
+    }
+
+
+def parse_values(spec: str) -> List[int]:
+    return [int(v) for v in spec.split(',') if v.strip()]
+
+
+async def main(args):
+    conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+    try:
+        indexes = [index for index in await ann_indexes(conn) if index['valid']]
+        if not indexes:
+            print("❌ No valid vector index on code_chunks.embedding - build one with vector_index.py --build")
+            return
+        if len(indexes) > 1:
+            print(f"⚠️  Several vector indexes exist, the planner picks one: {', '.join(i['name'] for i in indexes)}")
+        index = indexes[0]
+
+        queries = await sample_queries(conn, args.queries, args.seed)
+        if not queries:
+            print("❌ No embeddings to benchmark")
+            return
+
+        if index['method'] == 'hnsw':
+            setting, values = 'hnsw.ef_search', parse_values(args.ef_search)
+        else:
+            setting, values = 'ivfflat.probes', parse_values(args.probes)
+
+        print(f"\n🎯 {index['name']} ({index['size']}): {len(queries)} queries, recall@{args.k}")
+        print(f"   {index['definition']}\n")
+
+        exact, exact_latencies = await exact_neighbours(conn, queries, args.k)
+        results = [summarize('exact', exact_latencies, 1.0)]
+        for value in values:
+            approximate, latencies = await ann_neighbours(conn, queries, args.k, setting, value)
+            results.append(summarize(f"{setting}={value}", latencies, recall_at_k(approximate, exact)))
+
+        print(f"{'setting':<22} {'recall':>8} {'p50_ms':>8} {'p99_ms':>8}")
+        for row in results:
+            print(f"{row['setting']:<22} {row['recall']:>8.3f} {row['p50_latency_ms']:>8.2f} {row['p99_latency_ms']:>8.2f}")
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump({"index": index, "k": args.k, "queries": len(queries), "results": results}, f, indent=2)
+            print(f"\n💾 Results written to {args.output}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANN recall@k vs latency against exact search")
+    parser.add_argument('--queries', type=int, default=100, help="number of sampled query vectors")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--seed', default='ann-v1', help="sample seed; keep it fixed to compare runs")
+    parser.add_argument('--ef-search', default='10,20,40,80,160,320', help="HNSW settings to try")
+    parser.add_argument('--probes', default='1,2,5,10,20,50', help="IVFFlat settings to try")
+    parser.add_argument('--output', help="also write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
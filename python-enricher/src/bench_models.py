@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+LLM / embedding model bake-off
+Runs a fixed stratified sample of code_chunks through several models or endpoints
+and reports chunks/sec, tokens/sec, p50/p99 latency, parse-failure rate and
+agreement with a reference run. Results are stored in benchmark_runs /
+benchmark_results (and optionally a JSON file) so runs can be compared later.
+
+Usage:
+  python src/bench_models.py --target label=qwen,model=qwen2.5-coder-7b \\
+                             --target label=llama,model=llama-3.1-8b,endpoint=http://gpu2:1234/v1/chat/completions
+  python src/bench_models.py --mock --synthetic 60      # CI: in-process mock server, no database
+  python src/bench_models.py --target model=qwen2.5-coder-7b --reference-run 12
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from mock_llm_server import start_mock_server
+
+METRIC_PROMPTS = ('summary', 'complexity', 'business_impact', 'tags')
+
+
+@dataclass
+class Target:
+    label: str
+    model: str
+    endpoint: str
+    embedding_model: Optional[str] = None
+    embedding_endpoint: Optional[str] = None
+
+
+@dataclass
+class ChunkResult:
+    chunk_id: int
+    summary: Optional[str] = None
+    complexity_score: Optional[float] = None
+    business_impact_score: Optional[float] = None
+    tags: List[str] = field(default_factory=list)
+    latency_ms: float = 0.0
+    parse_failures: int = 0
+
+
+def parse_target(spec: str, default_endpoint: str) -> Target:
+    """Parse 'label=x,model=y,endpoint=z,embedding_model=e,embedding_endpoint=u'"""
+    values = dict(part.split('=', 1) for part in spec.split(',') if '=' in part)
+    if 'model' not in values:
+        raise ValueError(f"Target needs a model: {spec}")
+    endpoint = values.get('endpoint', default_endpoint)
+    return Target(
+        label=values.get('label', values['model']),
+        model=values['model'],
+        endpoint=endpoint,
+        embedding_model=values.get('embedding_model'),
+        embedding_endpoint=values.get('embedding_endpoint', endpoint.replace('/chat/completions', '/embeddings'))
+    )
+
+
+async def load_stratified_sample(conn, size: int, seed: str) -> List[int]:
+    """Deterministic sample spread evenly over chunk type and nesting depth"""
+    rows = await conn.fetch("""
+    WITH ranked AS (
+        SELECT
+            id,
+            ROW_NUMBER() OVER (
+                PARTITION BY chunk_type, LEAST(nesting_level, 3)
+                ORDER BY md5(id::text || $2)
+            ) as rn,
+            COUNT(*) OVER (PARTITION BY chunk_type, LEAST(nesting_level, 3)) as stratum_size
+        FROM code_chunks
+    )
+    SELECT id
+    FROM ranked
+    ORDER BY rn::float / stratum_size, md5(id::text || $2)
+    LIMIT $1
+    """, size, seed)
+    return sorted(r['id'] for r in rows)
+
+
+async def load_chunks(enricher, conn, chunk_ids: List[int]) -> List:
+    rows = await conn.fetch("""
+    SELECT
+        cc.id, cc.function_id, cc.chunk_index, cc.chunk_type, cc.nesting_level, cc.code,
+        f.function_name, f.class_name, files.filepath,
+        COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 0) as chunk_length_lines,
+        f.cyclomatic_complexity,
+        NULL::real as complexity_score
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    WHERE cc.id = ANY($1::int[])
+    ORDER BY cc.function_id, cc.chunk_index
+    """, chunk_ids)
+    return [enricher._row_to_chunk(row) for row in rows]
+
+
+class ModelBenchmark:
+    def __init__(self, enricher, target: Target, concurrency: int):
+        self.enricher = enricher
+        self.target = target
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.latencies: List[float] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.failed_requests = 0
+
+    async def chat(self, prompt: str, max_tokens: int) -> Optional[str]:
+        from config import EnricherConfig, PromptTemplates
+        from compaction import estimate_tokens
+
+        payload = {
+            "model": self.target.model,
+            "messages": [
+                {"role": "system", "content": PromptTemplates.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": EnricherConfig.LLM_TEMPERATURE
+        }
+        async with self.semaphore:
+            start = time.perf_counter()
+            try:
+                response = await self.enricher.http_client.post(self.target.endpoint, json=payload)
+            except Exception:
+                self.failed_requests += 1
+                return None
+            self.latencies.append((time.perf_counter() - start) * 1000)
+
+        if response.status_code != 200:
+            self.failed_requests += 1
+            return None
+
+        result = response.json()
+        content = result['choices'][0]['message']['content'].strip()
+        usage = result.get('usage') or {}
+        self.prompt_tokens += usage.get('prompt_tokens', estimate_tokens(prompt))
+        self.completion_tokens += usage.get('completion_tokens', estimate_tokens(content))
+        return content
+
+    async def run_chunk(self, chunk) -> ChunkResult:
+        from config import EnricherConfig, PromptTemplates
+        from enricher import parse_score, parse_tags
+
+        build = self.enricher.build_prompt
+        start = time.perf_counter()
+        summary, complexity, impact, tags = await asyncio.gather(
+            self.chat(build(PromptTemplates.SUMMARY_TEMPLATE, chunk), EnricherConfig.MAX_SUMMARY_LENGTH),
+            self.chat(build(PromptTemplates.COMPLEXITY_TEMPLATE, chunk), 10),
+            self.chat(build(PromptTemplates.BUSINESS_IMPACT_TEMPLATE, chunk), 10),
+            self.chat(build(PromptTemplates.TAG_DETECTION_TEMPLATE, chunk), 100),
+        )
+
+        result = ChunkResult(chunk_id=chunk.id, summary=summary)
+        result.complexity_score = parse_score(complexity)
+        result.business_impact_score = parse_score(impact)
+        parsed_tags = parse_tags(tags)
+        result.tags = parsed_tags or []
+        result.parse_failures = sum(v is None for v in (
+            summary, result.complexity_score, result.business_impact_score, parsed_tags))
+        result.latency_ms = (time.perf_counter() - start) * 1000
+        return result
+
+    async def embed(self, texts: List[str]) -> Optional[List[List[float]]]:
+        if not self.target.embedding_model:
+            return None
+        vectors = []
+        for start in range(0, len(texts), 64):
+            response = await self.enricher.http_client.post(
+                self.target.embedding_endpoint,
+                json={"model": self.target.embedding_model, "input": texts[start:start + 64]}
+            )
+            if response.status_code != 200:
+                return None
+            data = sorted(response.json()['data'], key=lambda d: d.get('index', 0))
+            vectors.extend(d['embedding'] for d in data)
+        return vectors
+
+
+def neighbour_agreement(vectors, reference, k: int = 5) -> Optional[float]:
+    """Mean overlap of top-k neighbours within the sample (embedding models are not directly comparable)"""
+    import numpy as np
+
+    if vectors is None or reference is None or len(vectors) <= k:
+        return None
+
+    def top_k(matrix):
+        m = np.asarray(matrix, dtype=np.float32)
+        m /= np.linalg.norm(m, axis=1, keepdims=True) + 1e-12
+        sims = m @ m.T
+        np.fill_diagonal(sims, -np.inf)
+        return np.argpartition(-sims, k, axis=1)[:, :k]
+
+    a, b = top_k(vectors), top_k(reference)
+    return float(np.mean([len(set(x) & set(y)) / k for x, y in zip(a, b)]))
+
+
+def agreement(results: List[ChunkResult], reference: Dict[int, Dict]) -> Dict:
+    """Agreement of scores, tags and summary wording with the reference run"""
+    import numpy as np
+
+    score_diffs = {'complexity_score': [], 'business_impact_score': []}
+    tag_jaccard, summary_jaccard = [], []
+
+    for r in results:
+        ref = reference.get(r.chunk_id)
+        if not ref:
+            continue
+        for key in score_diffs:
+            if getattr(r, key) is not None and ref.get(key) is not None:
+                score_diffs[key].append(abs(getattr(r, key) - ref[key]))
+        a, b = set(r.tags), set(ref.get('tags') or [])
+        if a or b:
+            tag_jaccard.append(len(a & b) / len(a | b))
+        if r.summary and ref.get('summary'):
+            wa, wb = set(r.summary.lower().split()), set(ref['summary'].lower().split())
+            summary_jaccard.append(len(wa & wb) / max(len(wa | wb), 1))
+
+    def mean(values):
+        return round(float(np.mean(values)), 4) if values else None
+
+    return {
+        "compared_chunks": sum(1 for r in results if r.chunk_id in reference),
+        "complexity_mae": mean(score_diffs['complexity_score']),
+        "complexity_within_0.1": mean([d <= 0.1 for d in score_diffs['complexity_score']]),
+        "business_impact_mae": mean(score_diffs['business_impact_score']),
+        "business_impact_within_0.1": mean([d <= 0.1 for d in score_diffs['business_impact_score']]),
+        "tag_jaccard": mean(tag_jaccard),
+        "summary_word_jaccard": mean(summary_jaccard),
+    }
+
+
+async def run_target(enricher, target: Target, chunks: List, concurrency: int) -> Dict:
+    import numpy as np
+
+    bench = ModelBenchmark(enricher, target, concurrency)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bench.run_chunk(chunk) for chunk in chunks))
+    elapsed = time.perf_counter() - start
+
+    embed_start = time.perf_counter()
+    vectors = await bench.embed([enricher.embedding_text(r.summary or '', c.code) for r, c in zip(results, chunks)])
+    embed_elapsed = time.perf_counter() - embed_start
+
+    latencies = np.array(bench.latencies) if bench.latencies else np.zeros(1)
+    requests = len(chunks) * len(METRIC_PROMPTS)
+    metrics = {
+        "chunks": len(chunks),
+        "elapsed_s": round(elapsed, 3),
+        "chunks_per_sec": round(len(chunks) / elapsed, 3) if elapsed else None,
+        "completion_tokens_per_sec": round(bench.completion_tokens / elapsed, 1) if elapsed else None,
+        "prompt_tokens_per_sec": round(bench.prompt_tokens / elapsed, 1) if elapsed else None,
+        "p50_latency_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p99_latency_ms": round(float(np.percentile(latencies, 99)), 1),
+        "failed_requests": bench.failed_requests,
+        "parse_failure_rate": round(sum(r.parse_failures for r in results) / requests, 4) if requests else 0.0,
+        "embeddings_per_sec": round(len(chunks) / embed_elapsed, 1) if vectors and embed_elapsed else None,
+    }
+    return {"target": asdict(target), "metrics": metrics, "results": results, "vectors": vectors}
+
+
+async def store_run(conn, run: Dict, sample_seed: str, reference_run_id: Optional[int]) -> int:
+    run_id = await conn.fetchval("""
+    INSERT INTO benchmark_runs
+        (label, model, endpoint, embedding_model, sample_size, sample_seed, reference_run_id, metrics)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8::jsonb)
+    RETURNING id
+    """, run['target']['label'], run['target']['model'], run['target']['endpoint'],
+        run['target']['embedding_model'], run['metrics']['chunks'], sample_seed,
+        reference_run_id, json.dumps(run['metrics']))
+
+    await conn.executemany("""
+    INSERT INTO benchmark_results
+        (run_id, chunk_id, summary, complexity_score, business_impact_score, tags, latency_ms, parse_failures)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+    """, [(run_id, r.chunk_id, r.summary, r.complexity_score, r.business_impact_score,
+           r.tags, r.latency_ms, r.parse_failures) for r in run['results']])
+    return run_id
+
+
+async def load_reference_run(conn, run_id: int) -> Dict[int, Dict]:
+    rows = await conn.fetch("""
+    SELECT chunk_id, summary, complexity_score, business_impact_score, tags
+    FROM benchmark_results WHERE run_id = $1
+    """, run_id)
+    return {r['chunk_id']: dict(r) for r in rows}
+
+
+def print_table(runs: List[Dict]):
+    columns = [('label', 14), ('chunks_per_sec', 9), ('completion_tokens_per_sec', 9), ('p50_latency_ms', 9),
+               ('p99_latency_ms', 9), ('parse_failure_rate', 8), ('complexity_mae', 8), ('tag_jaccard', 8),
+               ('summary_word_jaccard', 8), ('neighbour_agreement@5', 8)]
+    headers = ['target', 'chunk/s', 'tok/s', 'p50_ms', 'p99_ms', 'parse%', 'cplx_mae', 'tag_jac', 'sum_jac', 'nn@5']
+    print(' '.join(f"{h:>{w}}" if i else f"{h:<{w}}" for i, (h, (_, w)) in enumerate(zip(headers, columns))))
+    for run in runs:
+        values = {**run['metrics'], **run.get('agreement', {}), 'label': run['target']['label']}
+        cells = []
+        for i, (key, width) in enumerate(columns):
+            value = values.get(key)
+            if value is None:
+                text = '-'
+            elif key == 'parse_failure_rate':
+                text = f"{value:.1%}"
+            elif isinstance(value, float):
+                text = f"{value:.1f}" if key.endswith('_ms') or value >= 10 else f"{value:.3f}"
+            else:
+                text = str(value)
+            cells.append(f"{text:<{width}}" if i == 0 else f"{text:>{width}}")
+        print(' '.join(cells))
+
+
+async def main(args):
+    server = None
+    if args.mock:
+        server = start_mock_server(0)
+        os.environ['LLM_ENDPOINT'] = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+        os.environ['EMBEDDING_ENDPOINT'] = f"http://127.0.0.1:{server.server_address[1]}/v1/embeddings"
+
+    # Import after the endpoints are set - the config is read at import time
+    import asyncpg
+    from config import EnricherConfig
+    from enricher import LMStudioEnricher, CodeChunk
+
+    enricher = LMStudioEnricher()
+    targets = [parse_target(spec, EnricherConfig.LLM_ENDPOINT) for spec in args.target]
+    if not targets:
+        targets = [parse_target("label=mock-a,model=mock-a,embedding_model=mock-embed-a", EnricherConfig.LLM_ENDPOINT),
+                   parse_target("label=mock-b,model=mock-b,embedding_model=mock-embed-b", EnricherConfig.LLM_ENDPOINT)] \
+            if args.mock else [parse_target(f"model={EnricherConfig.LLM_MODEL},embedding_model={enricher.embedding_model_name}",
+                                            EnricherConfig.LLM_ENDPOINT)]
+
+    conn = None
+    if args.synthetic:
+        from bench_prefix_cache import make_chunks
+        chunks = make_chunks(CodeChunk, max(1, args.synthetic // 5), 5)[:args.synthetic]
+        for chunk in chunks:
+            chunk.code = enricher.prepare_code(chunk.code)
+    else:
+        conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+        chunk_ids = await load_stratified_sample(conn, args.sample, args.seed)
+        chunks = await load_chunks(enricher, conn, chunk_ids)
+
+    print(f"\n🏁 Model bake-off: {len(chunks)} chunks, {len(targets)} targets, concurrency {args.concurrency}\n")
+
+    reference: Optional[Dict[int, Dict]] = None
+    reference_vectors = None
+    if args.reference_run and conn:
+        reference = await load_reference_run(conn, args.reference_run)
+
+    runs = []
+    for target in targets:
+        run = await run_target(enricher, target, chunks, args.concurrency)
+        if reference is None:
+            # First target of this invocation is the reference
+            reference = {r.chunk_id: asdict(r) for r in run['results']}
+            reference_vectors = run['vectors']
+        run['agreement'] = agreement(run['results'], reference)
+        run['agreement']['neighbour_agreement@5'] = neighbour_agreement(run['vectors'], reference_vectors)
+        run['metrics'].update(run['agreement'])
+        if conn:
+            run['run_id'] = await store_run(conn, run, args.seed, args.reference_run)
+        runs.append(run)
+
+    print_table(runs)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{"run_id": r.get('run_id'), "target": r['target'], "metrics": r['metrics'],
+                        "results": [asdict(x) for x in r['results']]} for r in runs], f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    if conn:
+        print(f"\n💾 Stored runs: {', '.join(str(r['run_id']) for r in runs)}")
+        await conn.close()
+
+    await enricher.http_client.aclose()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM / embedding model bake-off")
+    parser.add_argument('--target', action='append', default=[],
+                        help="label=..,model=..[,endpoint=..][,embedding_model=..][,embedding_endpoint=..]")
+    parser.add_argument('--sample', type=int, default=200, help="stratified sample size")
+    parser.add_argument('--seed', default='bakeoff-v1', help="sample seed; keep it fixed to compare runs")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--reference-run', type=int, help="benchmark_runs.id to compare against")
+    parser.add_argument('--synthetic', type=int, help="use N synthetic chunks instead of the database")
+    parser.add_argument('--mock', action='store_true', help="start the mock LLM server in-process")
+    parser.add_argument('--output', help="also write results to this JSON file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark: prompt tokens processed and wall-clock throughput with and without
+prefix-cache friendly scheduling
+Runs synthetic chunks through the enricher against the mock LLM server and compares
+  interleaved - chunks of different functions alternate, all prompts per chunk (old order)
+  grouped     - chunks of one function back to back, prompt type by prompt type
+The mock charges --ms-per-token for every prompt token it does not find cached, so
+time_s and chunks/s include the latency saved by the cache and by concurrent requests.
+
+Usage: python src/bench_prefix_cache.py [--functions 20] [--chunks 6] [--cache-slots 1]
+       python src/bench_prefix_cache.py --endpoint http://localhost:1234/v1/chat/completions
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import urllib.request
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from mock_llm_server import start_mock_server
+
+
+def _mock_call(base_url: str, path: str, method: str = 'GET') -> dict:
+    request = urllib.request.Request(f"{base_url}{path}", method=method, data=b'{}' if method == 'POST' else None,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def make_chunks(code_chunk_cls, functions: int, chunks_per_function: int) -> List:
+    """Synthetic chunks shaped like parser output"""
+    chunks = []
+    chunk_id = 1
+    for f in range(functions):
+        for c in range(chunks_per_function):
+            body = '\n'.join(
+                f"    $value{f}_{c}_{i} = $this->service{f}->handle{c}($input['field{i}'] ?? null);"
+                for i in range(4 + c)
+            )
+            chunks.append(code_chunk_cls(
+                id=chunk_id,
+                function_id=f + 1,
+                chunk_index=c,
+                chunk_type='main' if c == 0 else 'if',
+                nesting_level=0 if c == 0 else 1,
+                code=f"{{\n{body}\n    return $value{f}_{c}_0;\n}}",
+                function_name=f"processOrder{f}",
+                class_name=f"OrderService{f % 5}",
+                filepath=f"src/Orders/OrderService{f % 5}.php"
+            ))
+            chunk_id += 1
+    return chunks
+
+
+def interleave(chunks: List) -> List:
+    """Round-robin across functions - the worst case for prefix reuse"""
+    by_function = {}
+    for chunk in chunks:
+        by_function.setdefault(chunk.function_id, []).append(chunk)
+    ordered = []
+    groups = list(by_function.values())
+    for i in range(max(len(g) for g in groups)):
+        ordered.extend(g[i] for g in groups if i < len(g))
+    return ordered
+
+
+async def run_schedule(enricher, chunks: List, schedule: str):
+    if schedule == 'interleaved':
+        for chunk in interleave(chunks):
+            await enricher.enrich_chunk(chunk)
+    else:
+        for group in enricher.group_by_function(chunks):
+            await enricher.enrich_function_group(group)
+
+
+async def main(args):
+    server = None
+    if args.endpoint:
+        endpoint = args.endpoint
+    else:
+        server = start_mock_server(0, cache_slots=args.cache_slots, ms_per_token=args.ms_per_token)
+        endpoint = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    base_url = endpoint.split('/v1/')[0]
+    os.environ['LLM_ENDPOINT'] = endpoint
+    os.environ['EMBEDDING_ENDPOINT'] = f"{base_url}/v1/embeddings"
+
+    # Import after the endpoints are set - the config is read at import time
+    from enricher import LMStudioEnricher, CodeChunk
+
+    enricher = LMStudioEnricher()
+    chunks = make_chunks(CodeChunk, args.functions, args.chunks)
+
+    print(f"\n📏 Prefix cache benchmark: {len(chunks)} chunks in {args.functions} functions, "
+          f"{args.cache_slots} cache slot(s)\n")
+    print(f"{'schedule':<12} {'requests':>9} {'prompt_tok':>11} {'cached_tok':>11} {'processed':>10} {'cached%':>8} "
+          f"{'time_s':>7} {'chunks/s':>9}")
+
+    results, elapsed_by_schedule = {}, {}
+    for schedule in ('interleaved', 'grouped'):
+        _mock_call(base_url, '/mock/reset', 'POST')
+        start = time.perf_counter()
+        await run_schedule(enricher, chunks, schedule)
+        elapsed = time.perf_counter() - start
+        stats = _mock_call(base_url, '/mock/stats')
+
+        processed = stats['prompt_tokens'] - stats['cached_tokens']
+        cached_pct = stats['cached_tokens'] / stats['prompt_tokens'] if stats['prompt_tokens'] else 0.0
+        results[schedule] = processed
+        elapsed_by_schedule[schedule] = elapsed
+        print(f"{schedule:<12} {stats['requests']:>9} {stats['prompt_tokens']:>11} {stats['cached_tokens']:>11} "
+              f"{processed:>10} {cached_pct:>8.1%} {elapsed:>7.2f} {len(chunks) / elapsed:>9.1f}")
+
+    if results['interleaved']:
+        reduction = 1 - results['grouped'] / results['interleaved']
+        print(f"\n🎯 Grouped scheduling processes {reduction:.1%} fewer prompt tokens")
+    if elapsed_by_schedule['grouped'] > 0:
+        speedup = elapsed_by_schedule['interleaved'] / elapsed_by_schedule['grouped']
+        print(f"⏱️  Grouped scheduling runs at {speedup:.2f}x the interleaved throughput")
+
+    await enricher.http_client.aclose()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prefix cache scheduling benchmark")
+    parser.add_argument('--functions', type=int, default=20)
+    parser.add_argument('--chunks', type=int, default=6, help="chunks per function")
+    parser.add_argument('--cache-slots', type=int, default=1)
+    parser.add_argument('--ms-per-token', type=float, default=0.05, help="simulated latency per uncached prompt token")
+    parser.add_argument('--endpoint', help="use an already running mock server instead of starting one")
+    asyncio.run(main(parser.parse_args()))
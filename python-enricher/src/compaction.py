@@ -0,0 +1,179 @@
+"""
+Token-aware code compaction before prompting
+Strips comments and excess whitespace, collapses long string/array literals
+and fits the result into an approximate per-model token budget
+"""
+
+import re
+import difflib
+from typing import List, Optional, Tuple
+
+from config import EnricherConfig
+
+PLACEHOLDER = '\x00{}\x00'
+PLACEHOLDER_PATTERN = re.compile('\x00(\\d+)\x00')
+INLINE_WHITESPACE_PATTERN = re.compile(r'[ \t]+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count, good enough for budgeting without a tokenizer"""
+    return int(len(text) / EnricherConfig.CHARS_PER_TOKEN) + 1
+
+
+def _strip_comments_and_strings(code: str, strings: Optional[List[str]]) -> str:
+    """Remove comments and swap string literals for placeholders in a single pass
+
+    Without a strings list the literals are kept as they are.
+    """
+    max_string = EnricherConfig.COMPACT_MAX_STRING_LENGTH
+    out = []
+    i = 0
+    n = len(code)
+
+    while i < n:
+        ch = code[i]
+
+        # Block comments and docblocks
+        if code.startswith('/*', i):
+            end = code.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            continue
+
+        # Line comments (but keep PHP 8 attributes "#[...]")
+        if code.startswith('//', i) or (ch == '#' and not code.startswith('#[', i)):
+            end = code.find('\n', i)
+            i = n if end == -1 else end
+            continue
+
+        if ch in ('"', "'"):
+            j = i + 1
+            while j < n and code[j] != ch:
+                j += 2 if code[j] == '\\' else 1
+            literal = code[i:j + 1]
+            if strings is None:
+                out.append(literal)
+                i = j + 1
+                continue
+            if len(literal) > max_string + 2:
+                literal = literal[:max_string + 1] + '...' + ch
+            strings.append(literal)
+            out.append(PLACEHOLDER.format(len(strings) - 1))
+            i = j + 1
+            continue
+
+        out.append(ch)
+        i += 1
+
+    return ''.join(out)
+
+
+def strip_comments(code: str) -> str:
+    """Remove comments, leaving string literals and PHP 8 attributes alone"""
+    return _strip_comments_and_strings(code, None)
+
+
+def _collapse_whitespace(code: str) -> str:
+    """Drop blank lines and trailing spaces, shrink indentation to one space per level"""
+    lines = []
+    for line in code.split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        indent = line[:len(line) - len(line.lstrip())]
+        depth = indent.count('\t') + indent.count(' ') // 4
+        lines.append(' ' * depth + INLINE_WHITESPACE_PATTERN.sub(' ', stripped))
+    return '\n'.join(lines)
+
+
+def _collapse_arrays(code: str) -> str:
+    """Shorten [...] literals with more than COMPACT_MAX_ARRAY_ITEMS top-level items"""
+    max_items = EnricherConfig.COMPACT_MAX_ARRAY_ITEMS
+    out = []
+    # One [comma_count, paren_depth] entry per open bracket
+    stack: List[List[int]] = []
+    skip_depth = None
+
+    for ch in code:
+        if skip_depth is not None:
+            if ch == '[':
+                stack.append([0, 0])
+            elif ch == ']':
+                stack.pop()
+                if len(stack) == skip_depth:
+                    out.append(', ...]')
+                    skip_depth = None
+            continue
+
+        if ch == '[':
+            stack.append([0, 0])
+        elif ch == ']' and stack:
+            stack.pop()
+        elif stack and ch == '(':
+            stack[-1][1] += 1
+        elif stack and ch == ')':
+            stack[-1][1] -= 1
+        elif stack and ch == ',' and stack[-1][1] == 0:
+            stack[-1][0] += 1
+            if stack[-1][0] >= max_items:
+                skip_depth = len(stack) - 1
+                continue
+
+        out.append(ch)
+
+    return ''.join(out)
+
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """Keep the start and end of text so that it fits into max_tokens"""
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+
+    max_chars = int(max_tokens * EnricherConfig.CHARS_PER_TOKEN)
+    lines = text.split('\n')
+    head_budget = int(max_chars * EnricherConfig.COMPACT_HEAD_FRACTION)
+    tail_budget = max_chars - head_budget
+
+    head: List[str] = []
+    used = 0
+    for line in lines:
+        if used + len(line) + 1 > head_budget:
+            break
+        head.append(line)
+        used += len(line) + 1
+
+    tail: List[str] = []
+    used = 0
+    for line in reversed(lines[len(head):]):
+        if used + len(line) + 1 > tail_budget:
+            break
+        tail.append(line)
+        used += len(line) + 1
+    tail.reverse()
+
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # A single huge line - fall back to a character cut at both ends
+        return f"{text[:head_budget]}\n...\n{text[-tail_budget:]}" if tail_budget else text[:head_budget]
+
+    return '\n'.join(head + [f"... ({omitted} lines omitted) ..."] + tail)
+
+
+def compact_code(code: str, max_tokens: int) -> str:
+    """Compact PHP code for prompting and fit it into max_tokens"""
+    strings: List[str] = []
+    compacted = _strip_comments_and_strings(code, strings)
+    compacted = _collapse_whitespace(compacted)
+    compacted = _collapse_arrays(compacted)
+    compacted = PLACEHOLDER_PATTERN.sub(lambda m: strings[int(m.group(1))], compacted)
+    return fit_to_budget(compacted, max_tokens)
+
+
+def compact_diff(old: str, new: str, context_lines: int = 1) -> Tuple[str, float]:
+    """Unified diff of two compacted chunks and the ratio of changed lines"""
+    old_lines = old.split('\n')
+    new_lines = new.split('\n')
+    diff = list(difflib.unified_diff(old_lines, new_lines, lineterm='', n=context_lines))[2:]
+
+    changed = sum(1 for line in diff if line[:1] in ('+', '-'))
+    ratio = changed / max(len(old_lines) + len(new_lines), 1)
+    return '\n'.join(diff), ratio
@@ -4,6 +4,7 @@ Simple text prompts - no JSON schema parsing
 """
 
 import os
+import json
 from typing import Dict, Any
 
 class EnricherConfig:
@@ -33,6 +34,13 @@ class EnricherConfig:
     RETRY_DELAY = int(os.getenv('RETRY_DELAY', '2'))
     CHUNK_DELAY = float(os.getenv('CHUNK_DELAY', '0.5'))
     
+    # Per-chunk failure handling: exponential backoff, then dead-letter
+    MAX_CHUNK_ATTEMPTS = int(os.getenv('MAX_CHUNK_ATTEMPTS', '5'))
+    RETRY_BACKOFF_BASE = float(os.getenv('RETRY_BACKOFF_BASE', '30'))     # seconds, doubled per attempt
+    RETRY_BACKOFF_MAX = float(os.getenv('RETRY_BACKOFF_MAX', '3600'))
+    RETRY_MAX_WAIT = float(os.getenv('RETRY_MAX_WAIT', '60'))             # wait for due retries at most this long
+    REQUEUE_DEAD_LETTERS = os.getenv('REQUEUE_DEAD_LETTERS', 'false').lower() == 'true'
+    
     # Embedding settings
     EMBED_MODEL_PATH = os.getenv('EMBED_MODEL_PATH', '/app/models')
     EMBED_MODEL_NAME = os.getenv('EMBED_MODEL_NAME', 'text-embedding-all-minilm-l12-v2')
@@ -47,6 +55,71 @@ class EnricherConfig:
     # Advanced settings
     MAX_CODE_LENGTH = int(os.getenv('MAX_CODE_LENGTH', '2000'))
     MAX_SUMMARY_LENGTH = int(os.getenv('MAX_SUMMARY_LENGTH', '500'))  # Reduced for simple prompts
+    EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+    
+    # Code compaction and token budgets
+    ENABLE_CODE_COMPACTION = os.getenv('ENABLE_CODE_COMPACTION', 'true').lower() == 'true'
+    CHARS_PER_TOKEN = float(os.getenv('CHARS_PER_TOKEN', '3.5'))
+    COMPACT_MAX_STRING_LENGTH = int(os.getenv('COMPACT_MAX_STRING_LENGTH', '40'))
+    COMPACT_MAX_ARRAY_ITEMS = int(os.getenv('COMPACT_MAX_ARRAY_ITEMS', '5'))
+    COMPACT_HEAD_FRACTION = float(os.getenv('COMPACT_HEAD_FRACTION', '0.6'))
+    LLM_CODE_TOKEN_BUDGET = int(os.getenv('LLM_CODE_TOKEN_BUDGET', '600'))
+    EMBEDDING_TOKEN_BUDGET = int(os.getenv('EMBEDDING_TOKEN_BUDGET', '256'))
+    # Per-model overrides, e.g. MODEL_TOKEN_BUDGETS='{"qwen2.5-coder-7b": 2000}'
+    MODEL_TOKEN_BUDGETS: Dict[str, int] = json.loads(os.getenv('MODEL_TOKEN_BUDGETS', '{}'))
+    
+    # Heuristic pre-filter for trivial chunks (getters, setters, one-line returns, empty blocks)
+    ENABLE_HEURISTIC_PREFILTER = os.getenv('ENABLE_HEURISTIC_PREFILTER', 'true').lower() == 'true'
+    UPGRADE_HEURISTIC_CHUNKS = os.getenv('UPGRADE_HEURISTIC_CHUNKS', 'false').lower() == 'true'
+    HEURISTIC_RULES = [r.strip() for r in os.getenv(
+        'HEURISTIC_RULES', 'empty_block,one_line_return,getter,setter').split(',') if r.strip()]
+    HEURISTIC_MAX_LINES = int(os.getenv('HEURISTIC_MAX_LINES', '4'))
+    HEURISTIC_MAX_NESTING = int(os.getenv('HEURISTIC_MAX_NESTING', '1'))
+    HEURISTIC_MAX_CYCLOMATIC = int(os.getenv('HEURISTIC_MAX_CYCLOMATIC', '1'))
+    HEURISTIC_COMPLEXITY_SCORE = float(os.getenv('HEURISTIC_COMPLEXITY_SCORE', '0.1'))
+    HEURISTIC_BUSINESS_IMPACT_SCORE = float(os.getenv('HEURISTIC_BUSINESS_IMPACT_SCORE', '0.1'))
+    
+    # Diff-based re-summarization of chunks that replace an enriched predecessor
+    ENABLE_DIFF_RESUMMARIZATION = os.getenv('ENABLE_DIFF_RESUMMARIZATION', 'true').lower() == 'true'
+    DIFF_CONTEXT_LINES = int(os.getenv('DIFF_CONTEXT_LINES', '1'))
+    DIFF_SCORE_THRESHOLD = float(os.getenv('DIFF_SCORE_THRESHOLD', '0.25'))   # re-score above this changed-line ratio
+    DIFF_MAX_RATIO = float(os.getenv('DIFF_MAX_RATIO', '0.6'))               # enrich from scratch above this
+    
+    # Metric-derived complexity scoring (LLM prompt only where the model is uncertain)
+    ENABLE_METRIC_SCORING = os.getenv('ENABLE_METRIC_SCORING', 'true').lower() == 'true'
+    METRIC_SCORE_MIN_SAMPLES = int(os.getenv('METRIC_SCORE_MIN_SAMPLES', '200'))
+    METRIC_SCORE_MAX_UNCERTAINTY = float(os.getenv('METRIC_SCORE_MAX_UNCERTAINTY', '0.15'))
+    METRIC_SCORE_Z = float(os.getenv('METRIC_SCORE_Z', '1.64'))
+    
+    # Function/class embeddings pooled from chunk embeddings (no extra model calls)
+    ENABLE_POOLED_EMBEDDINGS = os.getenv('ENABLE_POOLED_EMBEDDINGS', 'true').lower() == 'true'
+    POOL_CLASS_EMBEDDINGS = os.getenv('POOL_CLASS_EMBEDDINGS', 'true').lower() == 'true'
+    POOLING_BATCH_SIZE = int(os.getenv('POOLING_BATCH_SIZE', '500'))       # functions per bulk pass
+    
+    # Near-duplicate chunk clusters (python src/duplicates.py)
+    DUPLICATE_SIMILARITY = float(os.getenv('DUPLICATE_SIMILARITY', '0.95'))  # cosine similarity linking two chunks
+    DUPLICATE_BLOCK_SIZE = int(os.getenv('DUPLICATE_BLOCK_SIZE', '4096'))   # rows per similarity block
+    DUPLICATE_MIN_LINES = int(os.getenv('DUPLICATE_MIN_LINES', '5'))       # smaller chunks are not compared
+    
+    # Selective re-enrichment of fields whose prompt template or model changed
+    REENRICH_STALE_FIELDS = os.getenv('REENRICH_STALE_FIELDS', 'true').lower() == 'true'
+    REENRICH_BATCH_SIZE = int(os.getenv('REENRICH_BATCH_SIZE', '20'))
+    REENRICH_MAX_PER_RUN = int(os.getenv('REENRICH_MAX_PER_RUN', '500'))     # chunks per enricher run, 0 = no limit
+    
+    # Bulk-load mode: stage embeddings, merge in batches, build the ANN index at the end
+    BULK_LOAD_MODE = os.getenv('BULK_LOAD_MODE', 'auto').lower()               # auto, on, off
+    BULK_LOAD_THRESHOLD = int(os.getenv('BULK_LOAD_THRESHOLD', '5000'))       # pending chunks that switch auto mode on
+    BULK_MERGE_BATCH_SIZE = int(os.getenv('BULK_MERGE_BATCH_SIZE', '5000'))
+    BULK_LOAD_DROP_INDEX = os.getenv('BULK_LOAD_DROP_INDEX', 'true').lower() == 'true'
+    
+    # ANN index on code_chunks.embedding
+    VECTOR_INDEX_METHOD = os.getenv('VECTOR_INDEX_METHOD', 'hnsw').lower()     # hnsw, ivfflat
+    HNSW_M = int(os.getenv('HNSW_M', '16'))
+    HNSW_EF_CONSTRUCTION = int(os.getenv('HNSW_EF_CONSTRUCTION', '64'))
+    IVFFLAT_LISTS = int(os.getenv('IVFFLAT_LISTS', '0'))                       # 0 = derive from row count
+    INDEX_MAINTENANCE_WORK_MEM = os.getenv('INDEX_MAINTENANCE_WORK_MEM', '512MB')
+    INDEX_PARALLEL_WORKERS = int(os.getenv('INDEX_PARALLEL_WORKERS', '2'))
+    INDEX_PROGRESS_INTERVAL = float(os.getenv('INDEX_PROGRESS_INTERVAL', '10'))
     
     @classmethod
     def get_llm_payload_template(cls) -> Dict[str, Any]:
@@ -57,6 +130,11 @@ class EnricherConfig:
             "max_tokens": cls.LLM_MAX_TOKENS
         }
     
+    @classmethod
+    def get_token_budget(cls, model: str, default: int) -> int:
+        """Get the approximate code token budget for a model"""
+        return int(cls.MODEL_TOKEN_BUDGETS.get(model, default))
+    
     @classmethod
     def validate(cls):
         """Validate configuration"""
@@ -74,6 +152,36 @@ class EnricherConfig:
         if cls.MAX_RETRIES < 0:
             errors.append("MAX_RETRIES must be non-negative")
         
+        if cls.MAX_CHUNK_ATTEMPTS <= 0:
+            errors.append("MAX_CHUNK_ATTEMPTS must be positive")
+        
+        if cls.EMBEDDING_BATCH_SIZE <= 0:
+            errors.append("EMBEDDING_BATCH_SIZE must be positive")
+        
+        if cls.BULK_LOAD_MODE not in ('auto', 'on', 'off'):
+            errors.append("BULK_LOAD_MODE must be auto, on or off")
+        
+        if cls.BULK_MERGE_BATCH_SIZE <= 0:
+            errors.append("BULK_MERGE_BATCH_SIZE must be positive")
+        
+        if cls.VECTOR_INDEX_METHOD not in ('hnsw', 'ivfflat'):
+            errors.append("VECTOR_INDEX_METHOD must be hnsw or ivfflat")
+        
+        if cls.REENRICH_BATCH_SIZE <= 0:
+            errors.append("REENRICH_BATCH_SIZE must be positive")
+        
+        if cls.POOLING_BATCH_SIZE <= 0:
+            errors.append("POOLING_BATCH_SIZE must be positive")
+        
+        if not 0.0 < cls.DUPLICATE_SIMILARITY <= 1.0:
+            errors.append("DUPLICATE_SIMILARITY must be between 0 and 1")
+        
+        if cls.DUPLICATE_BLOCK_SIZE <= 0:
+            errors.append("DUPLICATE_BLOCK_SIZE must be positive")
+        
+        if not 0.0 < cls.COMPACT_HEAD_FRACTION < 1.0:
+            errors.append("COMPACT_HEAD_FRACTION must be between 0 and 1")
+        
         if errors:
             raise ValueError(f"Configuration errors: {', '.join(errors)}")
     
@@ -91,74 +199,116 @@ class EnricherConfig:
         print(f"  Embedding Dimension: {cls.EMBED_DIMENSION}")
         print(f"  Batch Size: {cls.BATCH_SIZE}")
         print(f"  Features: Embeddings={cls.ENABLE_EMBEDDINGS}, Complexity={cls.ENABLE_COMPLEXITY_SCORING}, Business={cls.ENABLE_BUSINESS_IMPACT}")
+        print(f"  Code Compaction: {cls.ENABLE_CODE_COMPACTION} (llm_budget={cls.get_token_budget(cls.LLM_MODEL, cls.LLM_CODE_TOKEN_BUDGET)} tokens, embedding_budget={cls.get_token_budget(cls.EMBEDDING_MODEL_NAME, cls.EMBEDDING_TOKEN_BUDGET)} tokens)")
+        print(f"  Diff Re-summarization: {cls.ENABLE_DIFF_RESUMMARIZATION} (rescore>{cls.DIFF_SCORE_THRESHOLD:.0%}, scratch>{cls.DIFF_MAX_RATIO:.0%} changed lines)")
+        print(f"  Metric Scoring: {cls.ENABLE_METRIC_SCORING} (min_samples={cls.METRIC_SCORE_MIN_SAMPLES}, max_uncertainty={cls.METRIC_SCORE_MAX_UNCERTAINTY})")
+        print(f"  Bulk Load: {cls.BULK_LOAD_MODE} (threshold={cls.BULK_LOAD_THRESHOLD} pending, merge_batch={cls.BULK_MERGE_BATCH_SIZE}, drop_index={cls.BULK_LOAD_DROP_INDEX})")
+        print(f"  Vector Index: {cls.VECTOR_INDEX_METHOD} (m={cls.HNSW_M}, ef_construction={cls.HNSW_EF_CONSTRUCTION}, lists={cls.IVFFLAT_LISTS or 'auto'})")
+        print(f"  Stale Field Re-enrichment: {cls.REENRICH_STALE_FIELDS} (batch={cls.REENRICH_BATCH_SIZE}, max_per_run={cls.REENRICH_MAX_PER_RUN or 'unlimited'})")
+        print(f"  Pooled Embeddings: {cls.ENABLE_POOLED_EMBEDDINGS} (classes={cls.POOL_CLASS_EMBEDDINGS}, batch={cls.POOLING_BATCH_SIZE})")
+        print(f"  Duplicate Clusters: similarity>={cls.DUPLICATE_SIMILARITY} (block={cls.DUPLICATE_BLOCK_SIZE}, min_lines={cls.DUPLICATE_MIN_LINES})")
+        print(f"  Heuristic Pre-filter: {cls.ENABLE_HEURISTIC_PREFILTER} (rules={','.join(cls.HEURISTIC_RULES)}, max_lines={cls.HEURISTIC_MAX_LINES})")
 
 
 # Simple text prompts - no JSON, no complex parsing
+#
+# Every template is laid out from most to least stable so that local inference
+# servers can reuse their KV cache for the shared prefix:
+#   instructions (per template) -> context (per function) -> chunk type -> code
+# Only the tail after the code differs between consecutive chunks of a function.
 class PromptTemplates:
     """Super simple text prompts that just work"""
     
-    # Minimal system prompt
-    SYSTEM_PROMPT = """You are a helpful code analysis assistant."""
+    # Minimal system prompt, identical for every request
+    SYSTEM_PROMPT = """You are a code analysis expert. Provide concise, accurate analysis."""
     
     # Simple summary prompt
     SUMMARY_TEMPLATE = """You're a senior PHP developer reviewing code for clarity and documentation.
 
 Summarize the **intent and effect** of the following code in **1-2 clear, technical sentences**.
 Use the context and code type to guide your phrasing and level of detail.
+Respond with the summary only.
 
 Context: {context}
 Chunk Type: {chunk_type}
 
 ```php
 {code}
-```
-
-Summary:"""
+```"""
 
     # Super simple complexity - just ask for a number
     COMPLEXITY_TEMPLATE = """Rate this PHP code complexity from 0.1 to 1.0 (0.1=very simple, 1.0=very complex).
 Respond with ONLY the number.
 
+Context: {context}
+Chunk Type: {chunk_type}
+
 ```php
 {code}
-```
-
-Complexity score:"""
+```"""
 
     # Simple business impact - just ask for a number
     BUSINESS_IMPACT_TEMPLATE = """Rate the business criticality of this PHP code from 0.1 to 1.0 (0.1=low impact, 1.0=mission critical).
 Respond with ONLY the number.
 
 Context: {context}
+Chunk Type: {chunk_type}
+
 ```php
 {code}
-```
-
-Business impact score:"""
+```"""
 
     # Simple tags - just ask for a comma-separated list
     TAG_DETECTION_TEMPLATE = """List 1-3 relevant tags for this PHP code. Choose from:
 authentication, payment, user-management, reporting, integration, data-processing, validation, notification, api-endpoint, security-sensitive, performance-critical, legacy-code, external-dependency, error-prone
+Respond with the tags only, comma separated.
 
 Context: {context}
+Chunk Type: {chunk_type}
+
 ```php
 {code}
-```
+```"""
 
-Tags (comma separated):"""
+    # Revise an existing summary from a unified diff of the chunk
+    RESUMMARIZE_TEMPLATE = """You're a senior PHP developer keeping code documentation up to date.
+
+The code below was edited. Revise the previous summary so it describes the **intent and effect**
+of the new code in **1-2 clear, technical sentences**. Keep the wording if the change does not affect it.
+Respond with the revised summary only.
+
+Context: {context}
+Chunk Type: {chunk_type}
+
+Previous summary: {previous_summary}
+
+```diff
+{diff}
+```"""
 
     # Optional: Simple comprehensive analysis
-    COMPREHENSIVE_ANALYSIS_TEMPLATE = """Analyze this PHP code:
+    COMPREHENSIVE_ANALYSIS_TEMPLATE = """Analyze this PHP code and provide:
+1. Summary (1-2 sentences):
+2. Complexity (0.1-1.0):
+3. Business impact (0.1-1.0):
+4. Tags (comma separated):
 
 Context: {context}
 Type: {chunk_type}
 
 ```php
 {code}
-```
+```"""
 
-Please provide:
-1. Summary (1-2 sentences):
-2. Complexity (0.1-1.0):
-3. Business impact (0.1-1.0):
-4. Tags (comma separated):"""
+    # Text embedded for each chunk (summary first, code last)
+    EMBEDDING_TEXT_TEMPLATE = """{summary}
+
+Code: {code}"""
+    
+    # Templated summaries for chunks classified as trivial by the heuristic pre-filter
+    HEURISTIC_SUMMARIES = {
+        "empty_block": "Empty {chunk_type} block in {function_name}; it has no effect.",
+        "one_line_return": "Returns {target} from {function_name} without further logic.",
+        "getter": "Getter in {function_name} that returns the {target} property.",
+        "setter": "Setter in {function_name} that assigns the {target} property.",
+    }
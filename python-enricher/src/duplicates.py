@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate chunk clusters across the whole corpus
+Every pair of chunk embeddings with cosine similarity of at least
+DUPLICATE_SIMILARITY (chunks of the same function excluded) links two chunks;
+connected chunks form a cluster. Similarities are computed exactly, one
+DUPLICATE_BLOCK_SIZE x DUPLICATE_BLOCK_SIZE matrix product at a time, over an
+embedding matrix kept in a memory-mapped temporary file. Memory is bounded by
+the block size plus a few numbers per chunk, however large the corpus. Results
+replace duplicate_clusters and duplicate_cluster_members.
+
+Usage: python src/duplicates.py                       # rebuild clusters
+       python src/duplicates.py --similarity 0.9 --block-size 2048
+       python src/duplicates.py --report 20           # largest clusters, no rebuild
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+import asyncpg
+import numpy as np
+from typing import Dict, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import EnricherConfig
+from pooling import parse_vector
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_FILTER = """
+FROM code_chunks cc
+WHERE cc.embedding IS NOT NULL
+AND GREATEST(COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 1), 1) >= $1
+"""
+
+CANDIDATES_QUERY = f"""
+SELECT
+    cc.id,
+    cc.function_id,
+    GREATEST(COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 1), 1) as lines,
+    cc.embedding::text as embedding
+{CANDIDATE_FILTER}
+ORDER BY cc.id
+"""
+
+# Members of chunks deleted while the job ran are dropped by the join
+INSERT_MEMBERS_QUERY = """
+INSERT INTO duplicate_cluster_members (cluster_id, chunk_id, best_similarity)
+SELECT m.cluster_id, m.chunk_id, m.best_similarity
+FROM unnest($1::int[], $2::int[], $3::real[]) as m(cluster_id, chunk_id, best_similarity)
+JOIN code_chunks cc ON cc.id = m.chunk_id
+"""
+
+
+class DisjointSet:
+    """Union-find over row numbers, with path halving"""
+
+    def __init__(self, size: int):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union_pairs(self, left: np.ndarray, right: np.ndarray):
+        for a, b in zip(left.tolist(), right.tolist()):
+            root_a, root_b = self.find(a), self.find(b)
+            if root_a != root_b:
+                self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def roots(self, rows: np.ndarray) -> np.ndarray:
+        return np.array([self.find(x) for x in rows.tolist()], dtype=np.int64)
+
+
+async def load_embeddings(conn: asyncpg.Connection, path: str, min_lines: int,
+                          block_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Chunk ids, function ids, line counts and the unit embedding matrix (memory-mapped at path)"""
+    async with conn.transaction(isolation='repeatable_read', readonly=True):
+        count = await conn.fetchval(f"SELECT COUNT(*) {CANDIDATE_FILTER}", min_lines)
+        ids = np.zeros(count, dtype=np.int64)
+        function_ids = np.zeros(count, dtype=np.int64)
+        lines = np.zeros(count, dtype=np.int64)
+        matrix = np.memmap(path, dtype=np.float32, mode='w+', shape=(max(count, 1), EnricherConfig.EMBED_DIMENSION))
+
+        row, pending = 0, []
+
+        def flush():
+            nonlocal row, pending
+            if not pending:
+                return
+            end = row + len(pending)
+            ids[row:end] = [r['id'] for r in pending]
+            function_ids[row:end] = [r['function_id'] for r in pending]
+            lines[row:end] = [r['lines'] for r in pending]
+            vectors = np.stack([parse_vector(r['embedding']) for r in pending])
+            matrix[row:end] = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            row, pending = end, []
+
+        async for record in conn.cursor(CANDIDATES_QUERY, min_lines, prefetch=block_size):
+            pending.append(record)
+            if len(pending) >= block_size:
+                flush()
+        flush()
+
+    matrix.flush()
+    return ids, function_ids, lines, matrix[:count]
+
+
+def link_similar(matrix: np.ndarray, function_ids: np.ndarray, threshold: float,
+                 block_size: int) -> Tuple[DisjointSet, np.ndarray]:
+    """Union every cross-function pair at or above threshold, block by block
+
+    Returns the disjoint sets and, per chunk, its best similarity to a linked
+    chunk (-1 for chunks without any link).
+    """
+    count = len(function_ids)
+    sets = DisjointSet(count)
+    best = np.full(count, -1.0, dtype=np.float32)
+
+    for i in range(0, count, block_size):
+        left = np.asarray(matrix[i:i + block_size])
+        left_functions = function_ids[i:i + block_size]
+        for j in range(i, count, block_size):
+            right = left if j == i else np.asarray(matrix[j:j + block_size])
+            similarity = left @ right.T
+            linked = similarity >= threshold
+            linked &= left_functions[:, None] != function_ids[None, j:j + block_size]
+            if j == i:
+                # Each pair once, no self pairs
+                linked = np.triu(linked, 1)
+            rows, cols = np.nonzero(linked)
+            if not len(rows):
+                continue
+            values = similarity[rows, cols]
+            rows, cols = rows + i, cols + j
+            np.maximum.at(best, rows, values)
+            np.maximum.at(best, cols, values)
+            sets.union_pairs(rows, cols)
+
+    return sets, best
+
+
+def build_clusters(sets: DisjointSet, best: np.ndarray, ids: np.ndarray, function_ids: np.ndarray,
+                   lines: np.ndarray) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Cluster and member columns, clusters ranked by duplicated lines"""
+    linked = np.nonzero(best >= 0)[0] if len(best) else np.array([], dtype=np.int64)
+    _, cluster = np.unique(sets.roots(linked), return_inverse=True)
+    n_clusters = int(cluster.max()) + 1 if len(cluster) else 0
+
+    size = np.bincount(cluster, minlength=n_clusters)
+    total_lines = np.bincount(cluster, weights=lines[linked], minlength=n_clusters)
+    avg_similarity = np.bincount(cluster, weights=best[linked], minlength=n_clusters) / np.maximum(size, 1)
+    function_pairs = np.unique(np.stack([cluster, function_ids[linked]]), axis=1) if len(cluster) \
+        else np.zeros((2, 0), dtype=np.int64)
+    function_count = np.bincount(function_pairs[0], minlength=n_clusters)
+
+    # Rank 1 = most duplicated lines
+    order = np.lexsort((-size, -total_lines))
+    rank = np.empty(n_clusters, dtype=np.int64)
+    rank[order] = np.arange(1, n_clusters + 1)
+
+    clusters = {
+        "id": rank[order],
+        "size": size[order],
+        "function_count": function_count[order],
+        "total_lines": total_lines[order].astype(np.int64),
+        "avg_similarity": avg_similarity[order],
+    }
+    members = {
+        "cluster_id": rank[cluster] if n_clusters else np.array([], dtype=np.int64),
+        "chunk_id": ids[linked],
+        "best_similarity": best[linked],
+    }
+    return clusters, members
+
+
+async def store_clusters(conn: asyncpg.Connection, clusters: Dict[str, np.ndarray],
+                         members: Dict[str, np.ndarray], threshold: float):
+    async with conn.transaction():
+        await conn.execute("DELETE FROM duplicate_clusters")
+        await conn.execute("""
+        INSERT INTO duplicate_clusters (id, size, function_count, total_lines, avg_similarity, threshold)
+        SELECT c.*, $6::real
+        FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::real[])
+            as c(id, size, function_count, total_lines, avg_similarity)
+        """, clusters["id"].tolist(), clusters["size"].tolist(), clusters["function_count"].tolist(),
+            clusters["total_lines"].tolist(), clusters["avg_similarity"].tolist(), threshold)
+        await conn.execute(INSERT_MEMBERS_QUERY, members["cluster_id"].tolist(), members["chunk_id"].tolist(),
+                           members["best_similarity"].tolist())
+
+
+async def find_duplicate_clusters(conn: asyncpg.Connection, threshold: float = None,
+                                  block_size: int = None, min_lines: int = None) -> Dict[str, float]:
+    """Rebuild the duplicate clusters; returns counts and timings"""
+    threshold = threshold or EnricherConfig.DUPLICATE_SIMILARITY
+    block_size = block_size or EnricherConfig.DUPLICATE_BLOCK_SIZE
+    min_lines = EnricherConfig.DUPLICATE_MIN_LINES if min_lines is None else min_lines
+
+    with tempfile.TemporaryDirectory(prefix="duplicates-") as directory:
+        started = time.time()
+        ids, function_ids, lines, matrix = await load_embeddings(
+            conn, os.path.join(directory, "embeddings.f32"), min_lines, block_size)
+        loaded = time.time()
+        logger.info(f"Loaded {len(ids)} chunk embeddings in {loaded - started:.1f}s")
+
+        sets, best = link_similar(matrix, function_ids, threshold, block_size)
+        compared = time.time()
+        del matrix
+
+    clusters, members = build_clusters(sets, best, ids, function_ids, lines)
+    await store_clusters(conn, clusters, members, threshold)
+    return {
+        "chunks": len(ids),
+        "clusters": len(clusters["id"]),
+        "duplicated_chunks": len(members["chunk_id"]),
+        "load_seconds": round(loaded - started, 1),
+        "compare_seconds": round(compared - loaded, 1),
+    }
+
+
+async def print_report(conn: asyncpg.Connection, limit: int):
+    clusters = await conn.fetch("""
+    SELECT id, size, function_count, total_lines, avg_similarity
+    FROM duplicate_clusters
+    ORDER BY id
+    LIMIT $1
+    """, limit)
+    if not clusters:
+        print("No duplicate clusters - run python src/duplicates.py first")
+        return
+    members = await conn.fetch("""
+    SELECT m.cluster_id, m.best_similarity, cc.chunk_type, cc.start_line, cc.end_line,
+           f.function_name, f.class_name, files.filepath
+    FROM duplicate_cluster_members m
+    JOIN code_chunks cc ON cc.id = m.chunk_id
+    JOIN functions f ON cc.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    WHERE m.cluster_id = ANY($1::int[])
+    ORDER BY m.cluster_id, files.filepath, cc.start_line
+    """, [c['id'] for c in clusters])
+
+    by_cluster: Dict[int, list] = {}
+    for m in members:
+        by_cluster.setdefault(m['cluster_id'], []).append(m)
+    for c in clusters:
+        print(f"#{c['id']}: {c['size']} chunks in {c['function_count']} functions, "
+              f"{c['total_lines']} lines, similarity {c['avg_similarity']:.3f}")
+        for m in by_cluster.get(c['id'], []):
+            name = f"{m['class_name']}::{m['function_name']}" if m['class_name'] else m['function_name']
+            print(f"    {m['best_similarity']:.3f}  {name:<50} {m['filepath']}:{m['start_line']}-{m['end_line']} "
+                  f"({m['chunk_type']})")
+
+
+async def main(args):
+    conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+    try:
+        if args.report:
+            await print_report(conn, args.report)
+            return
+
+        counts = await find_duplicate_clusters(conn, args.similarity, args.block_size, args.min_lines)
+        print(f"🧬 Duplicate clusters: {counts['clusters']} clusters of {counts['duplicated_chunks']} chunks "
+              f"among {counts['chunks']} compared (load {counts['load_seconds']}s, "
+              f"compare {counts['compare_seconds']}s)")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Near-duplicate chunk clusters from chunk embeddings")
+    parser.add_argument('--similarity', type=float, help="cosine similarity linking two chunks "
+                        f"(default DUPLICATE_SIMILARITY={EnricherConfig.DUPLICATE_SIMILARITY})")
+    parser.add_argument('--block-size', type=int, help="rows per similarity block "
+                        f"(default DUPLICATE_BLOCK_SIZE={EnricherConfig.DUPLICATE_BLOCK_SIZE})")
+    parser.add_argument('--min-lines', type=int, help="skip smaller chunks "
+                        f"(default DUPLICATE_MIN_LINES={EnricherConfig.DUPLICATE_MIN_LINES})")
+    parser.add_argument('--report', type=int, metavar='N', help="print the N largest clusters instead of rebuilding")
+    asyncio.run(main(parser.parse_args()))
@@ -5,6 +5,7 @@ Uses LM Studio for both LLM and embedding generation
 """
 
 import os
+import re
 import sys
 import json
 import time
@@ -14,12 +15,19 @@ import httpx
 import logging
 import numpy as np
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
 # Add the src directory to the path so we can import config
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from config import EnricherConfig, PromptTemplates
+from heuristics import TrivialChunkClassifier, PrefilterReport
+from compaction import compact_code, compact_diff, fit_to_budget, estimate_tokens
+import score_model
+from pooling import refresh_pooled_embeddings
+from versioning import current_versions, template_hash
+from reenrich import reenrich_stale
+import vector_index
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +36,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+TAG_SEPARATOR_PATTERN = re.compile(r'[,\n]')
+# The whole reply: "0.7", ".7", "1" (a closing period is tolerated)
+SCORE_PATTERN = re.compile(r'\d*\.?\d+')
+
+
+def parse_score(response: Optional[str]) -> Optional[float]:
+    """Parse a 0.1-1.0 score from an LLM response; None if it is not a number"""
+    if not response:
+        return None
+    cleaned = response.strip().rstrip('.')
+    if not SCORE_PATTERN.fullmatch(cleaned):
+        return None
+    return max(0.1, min(1.0, float(cleaned)))
+
+
+def complexity_with_source(score: Optional[float]) -> Tuple[float, str]:
+    """Score and complexity_source to store; no score stores the 0.5 placeholder as 'fallback'"""
+    return (0.5, 'fallback') if score is None else (score, 'llm')
+
+
+def parse_tags(response: Optional[str]) -> Optional[List[str]]:
+    """Parse tags from a JSON array or a comma separated list; None if nothing usable"""
+    if not response:
+        return None
+    cleaned = response.strip().strip('`')
+    if cleaned.startswith('json'):
+        cleaned = cleaned[4:]
+    
+    # Look for JSON array in the response
+    json_match = re.search(r'\[[\s\S]*?\]', cleaned)
+    if json_match:
+        try:
+            tags = json.loads(json_match.group(0))
+            if isinstance(tags, list):
+                return [str(tag) for tag in tags]
+        except json.JSONDecodeError:
+            pass
+    
+    tags = [t.strip().strip('"\'-* ').lower() for t in TAG_SEPARATOR_PATTERN.split(cleaned)]
+    tags = [t for t in tags if t and re.fullmatch(r'[a-z][a-z\-]*', t)]
+    return tags or None
+
+
 @dataclass
 class CodeChunk:
     id: int
@@ -39,14 +90,37 @@ class CodeChunk:
     function_name: str
     class_name: Optional[str]
     filepath: str
+    chunk_length_lines: int = 0
+    cyclomatic_complexity: Optional[int] = None
+    complexity_score: Optional[float] = None
+    complexity_source: Optional[str] = None
+
+    @property
+    def metric_scored(self) -> bool:
+        """Complexity already scored confidently by the metric model"""
+        return self.complexity_source == 'metric' and self.complexity_score is not None
 
 @dataclass
 class EnrichmentResult:
     summary: str
     complexity_score: float
     business_impact_score: float
-    embedding: List[float]
+    embedding: Optional[List[float]]
     tags: List[str]
+    source: str = 'llm'
+    # 'fallback' for the placeholder stored when no complexity score was obtained
+    complexity_source: str = 'llm'
+    # Prompt/model version per field, see versioning.py
+    versions: Dict[str, Optional[str]] = field(default_factory=dict)
+
+@dataclass
+class PreviousEnrichment:
+    code: str
+    summary: str
+    complexity_score: Optional[float]
+    business_impact_score: Optional[float]
+    versions: Dict[str, Optional[str]] = field(default_factory=dict)
+    complexity_source: Optional[str] = None
 
 class LMStudioEnricher:
     def __init__(self):
@@ -69,6 +143,18 @@ class LMStudioEnricher:
         # Determine embedding dimension based on model
         self.embedding_dimension = self._get_embedding_dimension()
         
+        # Approximate token budgets for prompt code and embedding input
+        self.code_token_budget = EnricherConfig.get_token_budget(
+            EnricherConfig.LLM_MODEL, EnricherConfig.LLM_CODE_TOKEN_BUDGET)
+        self.embedding_token_budget = EnricherConfig.get_token_budget(
+            self.embedding_model_name, EnricherConfig.EMBEDDING_TOKEN_BUDGET)
+        self.compaction_stats = {"raw_tokens": 0, "compacted_tokens": 0}
+        
+        # Bulk-load mode: embeddings go to chunk_embedding_staging instead of code_chunks
+        self.bulk_load = False
+        self.staged_embeddings: List[Tuple[int, str]] = []
+        self.unmerged_embeddings = 0
+        
         logger.info(f"🔧 LM Studio Configuration:")
         logger.info(f"   LLM Endpoint: {self.llm_endpoint}")
         logger.info(f"   Embedding Endpoint: {self.embedding_endpoint}")
@@ -160,32 +246,52 @@ class LMStudioEnricher:
             cc.code,
             f.function_name,
             f.class_name,
-            files.filepath
+            files.filepath,
+            COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 0) as chunk_length_lines,
+            f.cyclomatic_complexity,
+            cc.complexity_score,
+            cc.complexity_source
         FROM code_chunks cc
         JOIN functions f ON cc.function_id = f.id
         JOIN files ON f.file_id = files.id
         WHERE cc.enriched_at IS NULL
-        ORDER BY cc.id
+        AND cc.dead_lettered_at IS NULL
+        AND (cc.next_attempt_at IS NULL OR cc.next_attempt_at <= NOW())
+        ORDER BY cc.function_id, cc.chunk_index
         {limit_clause}
         """
         
         rows = await conn.fetch(query)
         
-        chunks = []
-        for row in rows:
-            chunks.append(CodeChunk(
-                id=row['id'],
-                function_id=row['function_id'],
-                chunk_index=row['chunk_index'],
-                chunk_type=row['chunk_type'],
-                nesting_level=row['nesting_level'],
-                code=row['code'][:EnricherConfig.MAX_CODE_LENGTH],
-                function_name=row['function_name'],
-                class_name=row['class_name'],
-                filepath=row['filepath']
-            ))
+        return [self._row_to_chunk(row) for row in rows]
+
+    def prepare_code(self, code: str) -> str:
+        """Compact code to the LLM token budget (or cut at MAX_CODE_LENGTH if compaction is off)"""
+        if not EnricherConfig.ENABLE_CODE_COMPACTION:
+            return code[:EnricherConfig.MAX_CODE_LENGTH]
         
-        return chunks
+        compacted = compact_code(code, self.code_token_budget)
+        self.compaction_stats["raw_tokens"] += estimate_tokens(code)
+        self.compaction_stats["compacted_tokens"] += estimate_tokens(compacted)
+        return compacted
+
+    def _row_to_chunk(self, row) -> CodeChunk:
+        """Build a CodeChunk from a pending-chunk query row"""
+        return CodeChunk(
+            id=row['id'],
+            function_id=row['function_id'],
+            chunk_index=row['chunk_index'],
+            chunk_type=row['chunk_type'],
+            nesting_level=row['nesting_level'],
+            code=self.prepare_code(row['code']),
+            function_name=row['function_name'],
+            class_name=row['class_name'],
+            filepath=row['filepath'],
+            chunk_length_lines=row['chunk_length_lines'] or 0,
+            cyclomatic_complexity=row['cyclomatic_complexity'],
+            complexity_score=row['complexity_score'],
+            complexity_source=row.get('complexity_source')
+        )
 
     async def call_llm(self, prompt: str, max_tokens: int = None) -> Optional[str]:
         """Call the LM Studio LLM endpoint"""
@@ -197,7 +303,7 @@ class LMStudioEnricher:
             "messages": [
                 {
                     "role": "system",
-                    "content": "You are a code analysis expert. Provide concise, accurate analysis."
+                    "content": PromptTemplates.SYSTEM_PROMPT
                 },
                 {
                     "role": "user", 
@@ -230,16 +336,19 @@ class LMStudioEnricher:
         
         return None
 
-    async def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding using LM Studio embedding endpoint"""
+    @staticmethod
+    def _valid_embedding(embedding) -> bool:
+        """Reject empty and all-zero vectors - they only pollute similarity search"""
+        return bool(embedding) and any(v != 0.0 for v in embedding)
+
+    async def generate_embedding(self, text: str) -> Optional[List[float]]:
+        """Generate embedding using LM Studio embedding endpoint; None if it failed"""
         if not EnricherConfig.ENABLE_EMBEDDINGS:
-            return [0.0] * self.embedding_dimension
+            return None
         
         try:
-            # Truncate text if too long
-            max_length = 8000  # LM Studio can handle longer texts
-            if len(text) > max_length:
-                text = text[:max_length] + "..."
+            # Keep start and end of long texts within the embedding model's budget
+            text = fit_to_budget(text, self.embedding_token_budget)
             
             payload = {
                 "model": self.embedding_model_name,
@@ -258,6 +367,10 @@ class LMStudioEnricher:
                         result = response.json()
                         embedding = result['data'][0]['embedding']
                         
+                        if not self._valid_embedding(embedding):
+                            logger.warning("Embedding endpoint returned an empty or zero vector")
+                            return None
+                        
                         # Verify dimension
                         if len(embedding) != self.embedding_dimension:
                             logger.warning(f"Embedding dimension mismatch: expected {self.embedding_dimension}, got {len(embedding)}")
@@ -274,12 +387,52 @@ class LMStudioEnricher:
                 if attempt < EnricherConfig.MAX_RETRIES - 1:
                     await asyncio.sleep(EnricherConfig.RETRY_DELAY * (attempt + 1))
             
-            # Return zero vector as fallback
-            return [0.0] * self.embedding_dimension
+            # Stored as NULL and picked up again by the re-embedding queue
+            return None
         
         except Exception as e:
             logger.warning(f"❌ Failed to generate embedding: {e}")
-            return [0.0] * self.embedding_dimension
+            return None
+
+    async def generate_embeddings_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Generate embeddings for many texts with one request per EMBEDDING_BATCH_SIZE texts"""
+        if not EnricherConfig.ENABLE_EMBEDDINGS:
+            return [None for _ in texts]
+        
+        embeddings: List[Optional[List[float]]] = []
+        batch_size = EnricherConfig.EMBEDDING_BATCH_SIZE
+        
+        for start in range(0, len(texts), batch_size):
+            batch = [fit_to_budget(t, self.embedding_token_budget) for t in texts[start:start + batch_size]]
+            payload = {
+                "model": self.embedding_model_name,
+                "input": batch
+            }
+            
+            try:
+                response = await self.http_client.post(
+                    self.embedding_endpoint,
+                    json=payload,
+                    headers={"Content-Type": "application/json"}
+                )
+                
+                if response.status_code == 200:
+                    data = sorted(response.json()['data'], key=lambda d: d.get('index', 0))
+                    if len(data) == len(batch):
+                        embeddings.extend(d['embedding'] if self._valid_embedding(d['embedding']) else None
+                                          for d in data)
+                        continue
+                    logger.warning(f"Batch embedding returned {len(data)} vectors for {len(batch)} inputs")
+                else:
+                    logger.warning(f"Batch embedding request failed with status {response.status_code}: {response.text}")
+            except Exception as e:
+                logger.warning(f"Batch embedding request failed: {e}")
+            
+            # Server does not support list input (or failed) - fall back to one request per text
+            for text in batch:
+                embeddings.append(await self.generate_embedding(text))
+        
+        return embeddings
 
     def get_context_string(self, chunk: CodeChunk) -> str:
         """Generate context string for prompts"""
@@ -289,15 +442,36 @@ class LMStudioEnricher:
         context += f", Function: {chunk.function_name}"
         return context
 
-    async def generate_summary(self, chunk: CodeChunk) -> str:
-        """Generate summary for a code chunk"""
-        context = self.get_context_string(chunk)
-        prompt = PromptTemplates.SUMMARY_TEMPLATE.format(
-            context=context,
+    def build_prompt(self, template: str, chunk: CodeChunk) -> str:
+        """Fill a prompt template; the code always goes last so the prefix stays cacheable"""
+        return template.format(
+            context=self.get_context_string(chunk),
             chunk_type=chunk.chunk_type,
-            nesting_level=chunk.nesting_level,
             code=chunk.code
         )
+
+    @staticmethod
+    def embedding_text(summary: str, code: str) -> str:
+        """Text embedded for a chunk"""
+        return PromptTemplates.EMBEDDING_TEXT_TEMPLATE.format(summary=summary, code=code)
+
+    @staticmethod
+    def result_versions(chunk: CodeChunk, embedding: Optional[List[float]]) -> Dict[str, Optional[str]]:
+        """Versions of a fully enriched chunk; disabled or failed fields stay unversioned"""
+        versions: Dict[str, Optional[str]] = dict(current_versions())
+        if not EnricherConfig.ENABLE_COMPLEXITY_SCORING:
+            versions['complexity'] = None
+        elif chunk.metric_scored:
+            versions['complexity'] = 'metric'
+        if not EnricherConfig.ENABLE_BUSINESS_IMPACT:
+            versions['business_impact'] = None
+        if embedding is None:
+            versions['embedding'] = None
+        return versions
+
+    async def generate_summary(self, chunk: CodeChunk) -> str:
+        """Generate summary for a code chunk"""
+        prompt = self.build_prompt(PromptTemplates.SUMMARY_TEMPLATE, chunk)
         
         summary = await self.call_llm(prompt, EnricherConfig.MAX_SUMMARY_LENGTH)
         
@@ -306,99 +480,50 @@ class LMStudioEnricher:
         
         return summary
 
-    async def assess_complexity(self, chunk: CodeChunk) -> float:
-        """Assess complexity score for a code chunk"""
+    async def assess_complexity(self, chunk: CodeChunk) -> Optional[float]:
+        """Assess complexity score for a code chunk; None if no score was obtained"""
         if not EnricherConfig.ENABLE_COMPLEXITY_SCORING:
-            return 0.5
+            return None
+        
+        # Already scored confidently by the metric model
+        if chunk.metric_scored:
+            return chunk.complexity_score
             
-        prompt = PromptTemplates.COMPLEXITY_TEMPLATE.format(code=chunk.code)
+        prompt = self.build_prompt(PromptTemplates.COMPLEXITY_TEMPLATE, chunk)
         response = await self.call_llm(prompt, max_tokens=10)
         
-        try:
-            score = float(response) if response else 0.5
-            return max(0.1, min(1.0, score))
-        except (ValueError, TypeError):
+        score = parse_score(response)
+        if score is None:
             logger.warning(f"❌ Invalid complexity score for chunk {chunk.id}: {response}")
-            return 0.5
+            return None
+        return score
 
     async def assess_business_impact(self, chunk: CodeChunk) -> float:
         """Assess business impact score for a code chunk"""
         if not EnricherConfig.ENABLE_BUSINESS_IMPACT:
             return 0.5
             
-        context = self.get_context_string(chunk)
-        prompt = PromptTemplates.BUSINESS_IMPACT_TEMPLATE.format(
-            context=context,
-            code=chunk.code
-        )
+        prompt = self.build_prompt(PromptTemplates.BUSINESS_IMPACT_TEMPLATE, chunk)
         
         response = await self.call_llm(prompt, max_tokens=10)
         
-        try:
-            score = float(response) if response else 0.5
-            return max(0.1, min(1.0, score))
-        except (ValueError, TypeError):
+        score = parse_score(response)
+        if score is None:
             logger.warning(f"❌ Invalid business impact score for chunk {chunk.id}: {response}")
             return 0.5
+        return score
 
     async def detect_tags(self, chunk: CodeChunk) -> List[str]:
         """Detect business/technical tags for a code chunk"""
-        context = self.get_context_string(chunk)
-        prompt = PromptTemplates.TAG_DETECTION_TEMPLATE.format(
-            context=context,
-            code=chunk.code
-        )
+        prompt = self.build_prompt(PromptTemplates.TAG_DETECTION_TEMPLATE, chunk)
         
         response = await self.call_llm(prompt, max_tokens=100)
         
-        try:
-            if response:
-                # Clean up response - extract JSON from potentially verbose response
-                cleaned_response = response.strip()
-                
-                # Look for JSON array in the response
-                import re
-                json_pattern = r'\[[\s\S]*?\]'
-                json_match = re.search(json_pattern, cleaned_response)
-                
-                if json_match:
-                    json_str = json_match.group(0)
-                    tags = json.loads(json_str)
-                    if isinstance(tags, list):
-                        return [str(tag) for tag in tags]
-                
-                # Fallback: try to clean markdown and parse
-                if cleaned_response.startswith('```json'):
-                    cleaned_response = cleaned_response[7:]
-                if cleaned_response.startswith('```'):
-                    cleaned_response = cleaned_response[3:]
-                if cleaned_response.endswith('```'):
-                    cleaned_response = cleaned_response[:-3]
-                
-                # Find the first complete JSON array
-                lines = cleaned_response.split('\n')
-                json_lines = []
-                in_array = False
-                
-                for line in lines:
-                    if '[' in line:
-                        in_array = True
-                    if in_array:
-                        json_lines.append(line)
-                    if ']' in line and in_array:
-                        break
-                
-                if json_lines:
-                    json_str = '\n'.join(json_lines).strip()
-                    tags = json.loads(json_str)
-                    if isinstance(tags, list):
-                        return [str(tag) for tag in tags]
-                        
-        except (json.JSONDecodeError, TypeError, AttributeError) as e:
-            # Don't log as warning anymore since the LLM is actually working well
-            logger.debug(f"Could not parse tags for chunk {chunk.id}, LLM gave detailed response")
-        
-        return []
+        tags = parse_tags(response)
+        if tags is None:
+            logger.debug(f"Could not parse tags for chunk {chunk.id}: {response}")
+            return []
+        return tags
 
     async def enrich_chunk(self, chunk: CodeChunk) -> EnrichmentResult:
         """Enrich a single chunk with all analysis"""
@@ -410,7 +535,7 @@ class LMStudioEnricher:
             analysis = await self.comprehensive_analysis(chunk)
             
             summary = analysis.get('summary', f"Code chunk in {chunk.function_name} ({chunk.chunk_type})")
-            complexity_score = float(analysis.get('complexity_score', 0.5))
+            complexity_score, complexity_source = float(analysis.get('complexity_score', 0.5)), 'llm'
             business_impact_score = float(analysis.get('business_impact_score', 0.5))
             tags = analysis.get('tags', [])
             
@@ -421,10 +546,7 @@ class LMStudioEnricher:
             # Generate all other enrichments concurrently
             tasks = []
             
-            if EnricherConfig.ENABLE_COMPLEXITY_SCORING:
-                tasks.append(self.assess_complexity(chunk))
-            else:
-                tasks.append(self._return_default_score(0.5))
+            tasks.append(self.assess_complexity(chunk))
             
             if EnricherConfig.ENABLE_BUSINESS_IMPACT:
                 tasks.append(self.assess_business_impact(chunk))
@@ -436,33 +558,89 @@ class LMStudioEnricher:
             
             # Wait for LLM tasks
             results = await asyncio.gather(*tasks)
-            complexity_score = results[0] if len(results) > 0 else 0.5
+            complexity_score, complexity_source = complexity_with_source(results[0])
             business_impact_score = results[1] if len(results) > 1 else 0.5
             tags = results[2] if len(results) > 2 else []
         
         # Generate embedding from summary + code
-        embed_text = f"{summary}\n\nCode: {chunk.code}"
+        embed_text = self.embedding_text(summary, chunk.code)
         embedding = await self.generate_embedding(embed_text)
         
-        logger.info(f"✅ Enriched chunk {chunk.id}: complexity={complexity_score:.2f}, impact={business_impact_score:.2f}, tags={len(tags)}, embedding_dim={len(embedding)}")
+        versions = self.result_versions(chunk, embedding)
+        if EnricherConfig.USE_COMPREHENSIVE_ANALYSIS:
+            comprehensive = f"{EnricherConfig.LLM_MODEL}@{template_hash(PromptTemplates.SYSTEM_PROMPT, PromptTemplates.COMPREHENSIVE_ANALYSIS_TEMPLATE)}"
+            versions.update({f: comprehensive for f in ('summary', 'complexity', 'business_impact', 'tags')})
+        
+        logger.info(f"✅ Enriched chunk {chunk.id}: complexity={complexity_score:.2f}, impact={business_impact_score:.2f}, tags={len(tags)}, embedding_dim={len(embedding or [])}")
         
         return EnrichmentResult(
             summary=summary,
             complexity_score=complexity_score,
             business_impact_score=business_impact_score,
             embedding=embedding,
-            tags=tags
+            tags=tags,
+            complexity_source=complexity_source,
+            versions=versions
         )
     
+    async def enrich_function_group(self, chunks: List[CodeChunk]) -> List[EnrichmentResult]:
+        """Enrich the chunks of one function prompt type by prompt type
+        
+        Requests in flight together then share system prompt, instructions and
+        function context, so the inference server only processes each chunk's
+        code. The chunks of one prompt type are sent concurrently.
+        """
+        logger.info(f"🔄 Enriching {len(chunks)} chunks of {chunks[0].filepath}::{chunks[0].function_name}")
+        
+        summaries = await asyncio.gather(*(self.generate_summary(chunk) for chunk in chunks))
+        complexity_scores = await asyncio.gather(*(self.assess_complexity(chunk) for chunk in chunks))
+        business_impact_scores = await asyncio.gather(*(self.assess_business_impact(chunk) for chunk in chunks))
+        tags = await asyncio.gather(*(self.detect_tags(chunk) for chunk in chunks))
+        
+        embeddings = await self.generate_embeddings_batch([
+            self.embedding_text(summary, chunk.code) for chunk, summary in zip(chunks, summaries)
+        ])
+        
+        results = []
+        for i, chunk in enumerate(chunks):
+            complexity_score, complexity_source = complexity_with_source(complexity_scores[i])
+            results.append(EnrichmentResult(
+                summary=summaries[i],
+                complexity_score=complexity_score,
+                business_impact_score=business_impact_scores[i],
+                embedding=embeddings[i],
+                tags=tags[i],
+                complexity_source=complexity_source,
+                versions=self.result_versions(chunk, embeddings[i])
+            ))
+        return results
+
+    @staticmethod
+    def group_by_function(chunks: List[CodeChunk]) -> List[List[CodeChunk]]:
+        """Group chunks by function, keeping the order in which functions first appear"""
+        groups: Dict[int, List[CodeChunk]] = {}
+        for chunk in chunks:
+            groups.setdefault(chunk.function_id, []).append(chunk)
+        return list(groups.values())
+    
     async def _return_default_score(self, score: float) -> float:
         """Helper method for default scores"""
         return score
 
+    @staticmethod
+    def to_pgvector(embedding: Optional[List[float]]) -> Optional[str]:
+        """Convert an embedding list to pgvector text format (None stays NULL)"""
+        if embedding is None:
+            return None
+        return f"[{','.join(map(str, embedding))}]"
+
     async def update_chunk_enrichment(self, conn: asyncpg.Connection, chunk_id: int, 
                                     result: EnrichmentResult):
         """Update the database with enrichment results"""
-        # Convert embedding list to pgvector format
-        embedding_str = f"[{','.join(map(str, result.embedding))}]"
+        embedding_str = self.to_pgvector(result.embedding)
+        if self.bulk_load and embedding_str is not None:
+            self.staged_embeddings.append((chunk_id, embedding_str))
+            embedding_str = None
         
         query = """
         UPDATE code_chunks 
@@ -470,6 +648,12 @@ class LMStudioEnricher:
             complexity_score = $2,
             business_impact_score = $3,
             embedding = $4,
+            enrichment_source = $6,
+            complexity_source = CASE WHEN complexity_source = 'metric' THEN 'metric' ELSE $8 END,
+            heuristic_rule = NULL,
+            enrichment_versions = $7::jsonb,
+            next_attempt_at = NULL,
+            last_error = NULL,
             enriched_at = NOW()
         WHERE id = $5
         """
@@ -479,24 +663,436 @@ class LMStudioEnricher:
                           result.complexity_score, 
                           result.business_impact_score, 
                           embedding_str, 
-                          chunk_id)
+                          chunk_id,
+                          result.source,
+                          json.dumps(result.versions),
+                          result.complexity_source)
+        
+        if result.versions.get('tags'):
+            await self.store_chunk_tags(conn, chunk_id, result.tags)
+
+    async def store_chunk_tags(self, conn: asyncpg.Connection, chunk_id: int, tags: List[str]):
+        """Replace the LLM-detected tags of a chunk"""
+        names = sorted({tag[:50] for tag in tags if tag})
+        await conn.execute("DELETE FROM chunk_business_tags WHERE chunk_id = $1 AND source = 'llm'", chunk_id)
+        if not names:
+            return
+        await conn.execute("""
+        INSERT INTO business_tags (name) SELECT unnest($1::text[]) ON CONFLICT (name) DO NOTHING
+        """, names)
+        await conn.execute("""
+        INSERT INTO chunk_business_tags (chunk_id, tag_id, source)
+        SELECT $1, id, 'llm' FROM business_tags WHERE name = ANY($2::text[])
+        ON CONFLICT (chunk_id, tag_id) DO NOTHING
+        """, chunk_id, names)
+
+    async def reuse_unchanged_chunks(self, conn: asyncpg.Connection) -> int:
+        """Copy enrichment from the archived predecessor of chunks whose code did not change
+
+        LLM tags are not archived (they were deleted with the old chunk), so
+        their version is dropped and the stale-field backlog detects them again.
+        """
+        result = await conn.execute("""
+        UPDATE code_chunks cc
+        SET summary = h.summary,
+            complexity_score = h.complexity_score,
+            complexity_source = h.complexity_source,
+            business_impact_score = h.business_impact_score,
+            embedding = h.embedding,
+            enrichment_source = h.enrichment_source,
+            heuristic_rule = h.heuristic_rule,
+            enrichment_versions = CASE WHEN h.enrichment_source = 'heuristic' THEN h.enrichment_versions
+                                       ELSE h.enrichment_versions - 'tags' END,
+            enriched_at = NOW()
+        FROM chunk_history h
+        WHERE cc.enriched_at IS NULL
+        AND h.function_id = cc.function_id
+        AND h.chunk_index = cc.chunk_index
+        AND h.code_hash = cc.code_hash
+        AND h.embedding IS NOT NULL
+        """)
+        count = int(result.split()[-1])
+        if count:
+            logger.info(f"♻️  Reused enrichment of {count} unchanged chunks")
+        return count
+
+    async def get_previous_enrichments(self, conn: asyncpg.Connection,
+                                       chunks: List[CodeChunk]) -> Dict[int, PreviousEnrichment]:
+        """Find the enriched predecessor at the same function and position for each chunk"""
+        rows = await conn.fetch("""
+        SELECT cc.id, h.code, h.summary, h.complexity_score, h.complexity_source,
+               h.business_impact_score, h.enrichment_versions
+        FROM code_chunks cc
+        JOIN chunk_history h ON h.function_id = cc.function_id AND h.chunk_index = cc.chunk_index
+        WHERE cc.id = ANY($1::int[])
+        AND h.summary IS NOT NULL
+        AND h.enrichment_source IS DISTINCT FROM 'heuristic'
+        """, [chunk.id for chunk in chunks])
+        
+        return {
+            row['id']: PreviousEnrichment(
+                code=row['code'],
+                summary=row['summary'],
+                complexity_score=row['complexity_score'],
+                business_impact_score=row['business_impact_score'],
+                versions=json.loads(row['enrichment_versions']) if row['enrichment_versions'] else {},
+                complexity_source=row['complexity_source']
+            )
+            for row in rows
+        }
+
+    async def revise_chunk(self, chunk: CodeChunk, previous: PreviousEnrichment) -> Optional[EnrichmentResult]:
+        """Revise the previous summary from a compact diff; None if the chunk changed too much"""
+        previous_code = (compact_code(previous.code, self.code_token_budget)
+                         if EnricherConfig.ENABLE_CODE_COMPACTION
+                         else previous.code[:EnricherConfig.MAX_CODE_LENGTH])
+        diff, ratio = compact_diff(previous_code, chunk.code, EnricherConfig.DIFF_CONTEXT_LINES)
+        
+        if ratio > EnricherConfig.DIFF_MAX_RATIO:
+            return None
+        
+        if not diff:
+            summary = previous.summary
+        else:
+            prompt = PromptTemplates.RESUMMARIZE_TEMPLATE.format(
+                context=self.get_context_string(chunk),
+                chunk_type=chunk.chunk_type,
+                previous_summary=previous.summary,
+                diff=diff
+            )
+            summary = await self.call_llm(prompt, EnricherConfig.MAX_SUMMARY_LENGTH) or previous.summary
+        
+        tags: List[str] = []
+        rescored = (ratio > EnricherConfig.DIFF_SCORE_THRESHOLD or previous.complexity_score is None
+                    or previous.complexity_source == 'fallback')
+        if rescored:
+            complexity_score, business_impact_score, tags = await asyncio.gather(
+                self.assess_complexity(chunk),
+                self.assess_business_impact(chunk),
+                self.detect_tags(chunk)
+            )
+            complexity_score, complexity_source = complexity_with_source(complexity_score)
+        else:
+            complexity_score, complexity_source = previous.complexity_score, previous.complexity_source or 'llm'
+            business_impact_score = previous.business_impact_score if previous.business_impact_score is not None else 0.5
+        
+        embedding = await self.generate_embedding(self.embedding_text(summary, chunk.code))
+        
+        versions = self.result_versions(chunk, embedding)
+        if not rescored:
+            # Carried-over scores keep the version they were produced with; tags
+            # were not re-detected and are left to the stale-field backlog
+            versions['complexity'] = previous.versions.get('complexity')
+            versions['business_impact'] = previous.versions.get('business_impact')
+            versions['tags'] = None
+        
+        logger.info(f"✏️  Revised chunk {chunk.id} from diff ({ratio:.0%} changed, rescored={rescored})")
+        return EnrichmentResult(
+            summary=summary,
+            complexity_score=complexity_score,
+            business_impact_score=business_impact_score,
+            embedding=embedding,
+            tags=tags,
+            source='llm_diff',
+            complexity_source=complexity_source,
+            versions=versions
+        )
 
     async def process_chunks_batch(self, conn: asyncpg.Connection, chunks: List[CodeChunk]):
         """Process a batch of chunks"""
         logger.info(f"🔄 Processing batch of {len(chunks)} chunks")
         
-        for chunk in chunks:
+        if EnricherConfig.USE_COMPREHENSIVE_ANALYSIS:
+            for chunk in chunks:
+                try:
+                    result = await self.enrich_chunk(chunk)
+                    await self.update_chunk_enrichment(conn, chunk.id, result)
+                    
+                    # Delay to avoid overwhelming LM Studio
+                    if EnricherConfig.CHUNK_DELAY > 0:
+                        await asyncio.sleep(EnricherConfig.CHUNK_DELAY)
+                    
+                except Exception as e:
+                    logger.error(f"❌ Failed to process chunk {chunk.id}: {e}")
+                    await self.record_failures(conn, [chunk.id], str(e))
+                    continue
+            return
+        
+        # Edited chunks with an enriched predecessor only need their summary revised
+        if EnricherConfig.ENABLE_DIFF_RESUMMARIZATION:
+            previous = await self.get_previous_enrichments(conn, chunks)
+            fresh = []
+            for chunk in chunks:
+                if chunk.id not in previous:
+                    fresh.append(chunk)
+                    continue
+                try:
+                    result = await self.revise_chunk(chunk, previous[chunk.id])
+                    if result is None:
+                        fresh.append(chunk)
+                        continue
+                    await self.update_chunk_enrichment(conn, chunk.id, result)
+                except Exception as e:
+                    logger.error(f"❌ Failed to process chunk {chunk.id}: {e}")
+                    await self.record_failures(conn, [chunk.id], str(e))
+            chunks = fresh
+        
+        # Dispatch chunks of the same function back to back for prefix cache reuse
+        for group in self.group_by_function(chunks):
             try:
-                result = await self.enrich_chunk(chunk)
-                await self.update_chunk_enrichment(conn, chunk.id, result)
-                
-                # Delay to avoid overwhelming LM Studio
-                if EnricherConfig.CHUNK_DELAY > 0:
-                    await asyncio.sleep(EnricherConfig.CHUNK_DELAY)
-                
+                pairs = list(zip(group, await self.enrich_function_group(group)))
+            except Exception as e:
+                logger.error(f"❌ Failed to process function {group[0].function_id}: {e}")
+                pairs = await self._enrich_individually(conn, group)
+            
+            for chunk, result in pairs:
+                try:
+                    await self.update_chunk_enrichment(conn, chunk.id, result)
+                    logger.info(f"✅ Enriched chunk {chunk.id}: complexity={result.complexity_score:.2f}, impact={result.business_impact_score:.2f}, tags={len(result.tags)}, embedding_dim={len(result.embedding or [])}")
+                except Exception as e:
+                    logger.error(f"❌ Failed to process chunk {chunk.id}: {e}")
+                    await self.record_failures(conn, [chunk.id], str(e))
+            
+            # Delay to avoid overwhelming LM Studio, per chunk as before grouping
+            if EnricherConfig.CHUNK_DELAY > 0:
+                await asyncio.sleep(EnricherConfig.CHUNK_DELAY * len(group))
+        
+        await self.flush_staged_embeddings(conn)
+
+    async def _enrich_individually(self, conn: asyncpg.Connection,
+                                   group: List[CodeChunk]) -> List[Tuple[CodeChunk, EnrichmentResult]]:
+        """Retry a failed function group chunk by chunk so one poison chunk cannot block the rest"""
+        pairs = []
+        for chunk in group:
+            try:
+                pairs.append((chunk, (await self.enrich_function_group([chunk]))[0]))
             except Exception as e:
                 logger.error(f"❌ Failed to process chunk {chunk.id}: {e}")
-                continue
+                await self.record_failures(conn, [chunk.id], str(e))
+        return pairs
+
+    async def record_failures(self, conn: asyncpg.Connection, chunk_ids: List[int], error: str,
+                              counter: str = 'enrich_attempts'):
+        """Count a failed attempt, back off exponentially and dead-letter after MAX_CHUNK_ATTEMPTS"""
+        try:
+            await conn.execute(f"""
+            UPDATE code_chunks 
+            SET {counter} = {counter} + 1,
+                last_error = $2,
+                next_attempt_at = NOW() + make_interval(secs => LEAST($3 * power(2, {counter}), $4)),
+                dead_lettered_at = CASE WHEN {counter} + 1 >= $5 THEN NOW() ELSE NULL END
+            WHERE id = ANY($1::int[])
+            """, chunk_ids, error[:1000], float(EnricherConfig.RETRY_BACKOFF_BASE),
+               float(EnricherConfig.RETRY_BACKOFF_MAX), EnricherConfig.MAX_CHUNK_ATTEMPTS)
+        except Exception as e:
+            logger.error(f"❌ Could not record failure for chunks {chunk_ids}: {e}")
+
+    async def requeue_dead_letters(self, conn: asyncpg.Connection) -> int:
+        """Give dead-lettered chunks a fresh set of attempts"""
+        result = await conn.execute("""
+        UPDATE code_chunks 
+        SET dead_lettered_at = NULL,
+            enrich_attempts = 0,
+            embedding_attempts = 0,
+            next_attempt_at = NULL
+        WHERE dead_lettered_at IS NOT NULL
+        """)
+        count = int(result.split()[-1])
+        logger.info(f"📬 Requeued {count} dead-lettered chunks")
+        return count
+
+    async def reembed_missing(self, conn: asyncpg.Connection) -> int:
+        """Embed enriched chunks whose embedding failed earlier (stored as NULL)"""
+        if not EnricherConfig.ENABLE_EMBEDDINGS:
+            return 0
+        
+        embedded = 0
+        while True:
+            rows = await conn.fetch("""
+            SELECT id, summary, code
+            FROM code_chunks
+            WHERE enriched_at IS NOT NULL
+            AND embedding IS NULL
+            AND summary IS NOT NULL
+            AND dead_lettered_at IS NULL
+            AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+            ORDER BY id
+            LIMIT $1
+            """, EnricherConfig.EMBEDDING_BATCH_SIZE)
+            
+            if not rows:
+                break
+            
+            embeddings = await self.generate_embeddings_batch([
+                self.embedding_text(row['summary'], self.prepare_code(row['code'])) for row in rows
+            ])
+            
+            embedding_version = current_versions()['embedding']
+            done = [(self.to_pgvector(e), row['id'], embedding_version)
+                    for row, e in zip(rows, embeddings) if e is not None]
+            failed = [row['id'] for row, e in zip(rows, embeddings) if e is None]
+            
+            if done:
+                await conn.executemany("""
+                UPDATE code_chunks 
+                SET embedding = $1,
+                    enrichment_versions = COALESCE(enrichment_versions, '{}'::jsonb) || jsonb_build_object('embedding', $3::text),
+                    next_attempt_at = NULL,
+                    last_error = NULL
+                WHERE id = $2
+                """, done)
+                embedded += len(done)
+            if failed:
+                await self.record_failures(conn, failed, "embedding failed", counter='embedding_attempts')
+        
+        if embedded:
+            logger.info(f"🧭 Re-embedded {embedded} chunks with missing embeddings")
+        return embedded
+
+    async def wait_for_backoff(self, conn: asyncpg.Connection) -> bool:
+        """Sleep until the next backed-off chunk is due if that is soon; False if nothing is due"""
+        wait = await conn.fetchval("""
+        SELECT EXTRACT(EPOCH FROM MIN(next_attempt_at) - NOW())
+        FROM code_chunks
+        WHERE enriched_at IS NULL
+        AND dead_lettered_at IS NULL
+        AND next_attempt_at > NOW()
+        """)
+        if wait is None or wait > EnricherConfig.RETRY_MAX_WAIT:
+            return False
+        logger.info(f"⏳ Waiting {wait:.0f}s for backed-off chunks")
+        await asyncio.sleep(max(float(wait), 0.0))
+        return True
+
+    async def get_trivial_candidates(self, conn: asyncpg.Connection) -> List[CodeChunk]:
+        """Fetch pending chunks small and shallow enough to be considered by the heuristic rules"""
+        query = """
+        SELECT 
+            cc.id,
+            cc.function_id,
+            cc.chunk_index,
+            cc.chunk_type,
+            cc.nesting_level,
+            cc.code,
+            f.function_name,
+            f.class_name,
+            files.filepath,
+            COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 0) as chunk_length_lines,
+            f.cyclomatic_complexity,
+            cc.complexity_score
+        FROM code_chunks cc
+        JOIN functions f ON cc.function_id = f.id
+        JOIN files ON f.file_id = files.id
+        WHERE cc.enriched_at IS NULL
+        AND cc.dead_lettered_at IS NULL
+        AND COALESCE(cc.nesting_level, 0) <= $1
+        AND COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 0) <= $2
+        ORDER BY cc.id
+        """
+        
+        rows = await conn.fetch(query, EnricherConfig.HEURISTIC_MAX_NESTING, EnricherConfig.HEURISTIC_MAX_LINES)
+        return [self._row_to_chunk(row) for row in rows]
+
+    async def prefilter_trivial_chunks(self, conn: asyncpg.Connection) -> PrefilterReport:
+        """Enrich trivial chunks with templated summaries, fixed scores and bulk embeddings"""
+        report = PrefilterReport()
+        report.pending = await conn.fetchval(
+            "SELECT COUNT(*) FROM code_chunks WHERE enriched_at IS NULL AND dead_lettered_at IS NULL")
+        
+        candidates = await self.get_trivial_candidates(conn)
+        report.candidates = len(candidates)
+        
+        classifier = TrivialChunkClassifier()
+        matched = []
+        for chunk in candidates:
+            match = classifier.classify(chunk)
+            if match:
+                matched.append((chunk, match))
+                report.by_rule[match.rule] += 1
+        
+        if matched:
+            texts = [self.embedding_text(match.summary, chunk.code) for chunk, match in matched]
+            embeddings = await self.generate_embeddings_batch(texts)
+            
+            query = """
+            UPDATE code_chunks 
+            SET summary = $1,
+                complexity_score = $2,
+                business_impact_score = $3,
+                embedding = $4,
+                enrichment_source = 'heuristic',
+                complexity_source = 'heuristic',
+                heuristic_rule = $5,
+                enrichment_versions = $7::jsonb,
+                enriched_at = NOW()
+            WHERE id = $6
+            """
+            embedding_version = current_versions()['embedding']
+            if self.bulk_load:
+                self.staged_embeddings.extend(
+                    (chunk.id, self.to_pgvector(embedding))
+                    for (chunk, _), embedding in zip(matched, embeddings) if embedding is not None)
+                await self.flush_staged_embeddings(conn)
+            await conn.executemany(query, [
+                (match.summary,
+                 EnricherConfig.HEURISTIC_COMPLEXITY_SCORE,
+                 EnricherConfig.HEURISTIC_BUSINESS_IMPACT_SCORE,
+                 None if self.bulk_load else self.to_pgvector(embedding),
+                 match.rule,
+                 chunk.id,
+                 json.dumps({'summary': 'heuristic', 'complexity': 'heuristic', 'business_impact': 'heuristic',
+                             'tags': 'heuristic', 'embedding': embedding_version if embedding else None}))
+                for (chunk, match), embedding in zip(matched, embeddings)
+            ])
+        
+        logger.info(f"🧹 Heuristic pre-filter removed {report.matched} of {report.pending} pending chunks "
+                    f"({report.fraction_removed:.1%}), by rule: {dict(report.by_rule)}")
+        return report
+
+    async def apply_metric_scores(self, conn: asyncpg.Connection) -> int:
+        """Score all pending chunks from parser metrics in one NumPy pass
+        
+        Only scores within METRIC_SCORE_MAX_UNCERTAINTY are written; the rest
+        keep their LLM complexity prompt.
+        """
+        model = await score_model.fit_from_database(conn)
+        if model is None:
+            logger.info(f"📐 Metric scoring skipped: fewer than {EnricherConfig.METRIC_SCORE_MIN_SAMPLES} LLM-scored chunks to calibrate on")
+            return 0
+        
+        chunk_ids, features = await score_model.load_pending_features(conn)
+        if not chunk_ids:
+            return 0
+        
+        scores, half_width = model.predict(features)
+        confident = half_width <= EnricherConfig.METRIC_SCORE_MAX_UNCERTAINTY
+        
+        await conn.executemany("""
+        UPDATE code_chunks 
+        SET complexity_score = $1,
+            complexity_source = 'metric'
+        WHERE id = $2
+        """, [(float(score), chunk_id)
+              for chunk_id, score, ok in zip(chunk_ids, scores, confident) if ok])
+        
+        count = int(confident.sum())
+        logger.info(f"📐 Metric model scored {count} of {len(chunk_ids)} pending chunks "
+                    f"({count / len(chunk_ids):.1%}), calibrated on {model.n_samples} LLM scores")
+        return count
+
+    async def reset_heuristic_chunks(self, conn: asyncpg.Connection) -> int:
+        """Mark heuristically enriched chunks as pending so they get full LLM enrichment"""
+        result = await conn.execute("""
+        UPDATE code_chunks 
+        SET enriched_at = NULL,
+            complexity_score = NULL,
+            complexity_source = NULL,
+            enrichment_versions = jsonb_set(COALESCE(enrichment_versions, '{}'::jsonb), '{complexity}', 'null')
+        WHERE enrichment_source = 'heuristic'
+        """)
+        count = int(result.split()[-1])
+        logger.info(f"⬆️  Queued {count} heuristically enriched chunks for LLM upgrade")
+        return count
 
     async def get_enrichment_stats(self, conn: asyncpg.Connection) -> Dict:
         """Get statistics about enrichment progress"""
@@ -504,7 +1100,9 @@ class LMStudioEnricher:
         SELECT 
             COUNT(*) as total_chunks,
             COUNT(enriched_at) as enriched_chunks,
-            COUNT(*) - COUNT(enriched_at) as pending_chunks,
+            COUNT(*) FILTER (WHERE enriched_at IS NULL AND dead_lettered_at IS NULL) as pending_chunks,
+            COUNT(dead_lettered_at) as dead_lettered_chunks,
+            COUNT(*) FILTER (WHERE enriched_at IS NOT NULL AND embedding IS NULL) as missing_embeddings,
             ROUND(AVG(complexity_score)::numeric, 2) as avg_complexity,
             ROUND(AVG(business_impact_score)::numeric, 2) as avg_business_impact
         FROM code_chunks
@@ -513,6 +1111,90 @@ class LMStudioEnricher:
         row = await conn.fetchrow(stats_query)
         return dict(row)
 
+    async def should_bulk_load(self, conn: asyncpg.Connection) -> bool:
+        """Bulk-load when forced on, or in auto mode when the backlog is large"""
+        if EnricherConfig.BULK_LOAD_MODE == 'off' or not EnricherConfig.ENABLE_EMBEDDINGS:
+            return False
+        if EnricherConfig.BULK_LOAD_MODE == 'on':
+            return True
+        pending = await conn.fetchval(
+            "SELECT COUNT(*) FROM code_chunks WHERE enriched_at IS NULL AND dead_lettered_at IS NULL")
+        return pending >= EnricherConfig.BULK_LOAD_THRESHOLD
+
+    async def start_bulk_load(self, conn: asyncpg.Connection):
+        """Stage embeddings and stop paying for per-row vector index inserts"""
+        self.bulk_load = True
+        logger.info(f"📦 Bulk-load mode: staging embeddings, merging every {EnricherConfig.BULK_MERGE_BATCH_SIZE}")
+        if EnricherConfig.BULK_LOAD_DROP_INDEX:
+            await vector_index.drop_index(conn)
+
+    async def flush_staged_embeddings(self, conn: asyncpg.Connection):
+        """Write buffered embeddings to the (unindexed) staging table"""
+        if not self.staged_embeddings:
+            return
+        await conn.executemany("""
+        INSERT INTO chunk_embedding_staging (chunk_id, embedding) VALUES ($1, $2::vector)
+        """, self.staged_embeddings)
+        self.unmerged_embeddings += len(self.staged_embeddings)
+        self.staged_embeddings = []
+
+    async def merge_staged_embeddings(self, conn: asyncpg.Connection) -> int:
+        """Move staged embeddings into code_chunks in BULK_MERGE_BATCH_SIZE batches"""
+        await self.flush_staged_embeddings(conn)
+        merged = 0
+        while await conn.fetchval("SELECT EXISTS (SELECT 1 FROM chunk_embedding_staging)"):
+            result = await conn.execute("""
+            WITH batch AS (
+                DELETE FROM chunk_embedding_staging
+                WHERE ctid = ANY(ARRAY(SELECT ctid FROM chunk_embedding_staging LIMIT $1))
+                RETURNING chunk_id, embedding, staged_at
+            ), latest AS (
+                SELECT DISTINCT ON (chunk_id) chunk_id, embedding
+                FROM batch
+                ORDER BY chunk_id, staged_at DESC
+            )
+            UPDATE code_chunks cc
+            SET embedding = latest.embedding
+            FROM latest
+            WHERE cc.id = latest.chunk_id
+            """, EnricherConfig.BULK_MERGE_BATCH_SIZE)
+            merged += int(result.split()[-1])
+        
+        self.unmerged_embeddings = 0
+        if merged:
+            logger.info(f"📦 Merged {merged} staged embeddings into code_chunks")
+        return merged
+
+    async def finish_bulk_load(self, conn: asyncpg.Connection):
+        """Merge what is left and build the vector index once for the whole load"""
+        await self.merge_staged_embeddings(conn)
+        self.bulk_load = False
+        await vector_index.build_index(conn)
+
+    async def reenrich_stale_fields(self, conn: asyncpg.Connection):
+        """Work off part of the stale-field backlog after regular enrichment"""
+        if not EnricherConfig.REENRICH_STALE_FIELDS:
+            return
+        
+        try:
+            totals = await reenrich_stale(self, conn, limit=EnricherConfig.REENRICH_MAX_PER_RUN)
+            if any(totals.values()):
+                logger.info(f"🔁 Stale fields re-enriched: {dict((f, c) for f, c in totals.items() if c)}")
+        except Exception as e:
+            logger.error(f"❌ Stale field re-enrichment failed: {e}")
+
+    async def update_pooled_embeddings(self, conn: asyncpg.Connection):
+        """Refresh function/class embeddings of functions whose chunks changed"""
+        if not (EnricherConfig.ENABLE_POOLED_EMBEDDINGS and EnricherConfig.ENABLE_EMBEDDINGS):
+            return
+        
+        try:
+            counts = await refresh_pooled_embeddings(conn)
+            if counts['functions'] or counts['classes'] or counts['stale_functions']:
+                logger.info(f"🧮 Pooled embeddings updated: {counts['functions']} functions, {counts['classes']} classes")
+        except Exception as e:
+            logger.error(f"❌ Failed to update pooled embeddings: {e}")
+
     async def run(self):
         """Main enrichment loop"""
         logger.info("🚀 Starting LM Studio Enricher Service")
@@ -523,11 +1205,40 @@ class LMStudioEnricher:
         conn = await self.connect_db()
         
         try:
+            if EnricherConfig.REQUEUE_DEAD_LETTERS:
+                await self.requeue_dead_letters(conn)
+            
+            # Embeddings staged by an interrupted bulk load
+            await self.merge_staged_embeddings(conn)
+            
+            if await self.should_bulk_load(conn):
+                await self.start_bulk_load(conn)
+            elif EnricherConfig.ENABLE_EMBEDDINGS:
+                # Restores an index dropped by an interrupted bulk load
+                await vector_index.build_index(conn)
+            
+            await self.reembed_missing(conn)
+            
+            if EnricherConfig.ENABLE_DIFF_RESUMMARIZATION:
+                await self.reuse_unchanged_chunks(conn)
+            
+            if EnricherConfig.UPGRADE_HEURISTIC_CHUNKS:
+                await self.reset_heuristic_chunks(conn)
+            elif EnricherConfig.ENABLE_HEURISTIC_PREFILTER:
+                await self.prefilter_trivial_chunks(conn)
+            
+            if EnricherConfig.ENABLE_METRIC_SCORING and EnricherConfig.ENABLE_COMPLEXITY_SCORING:
+                await self.apply_metric_scores(conn)
+            
             # Show initial stats
             stats = await self.get_enrichment_stats(conn)
             logger.info(f"📊 Initial stats: {stats['pending_chunks']} pending out of {stats['total_chunks']} total chunks")
             
             if stats['pending_chunks'] == 0:
+                if self.bulk_load:
+                    await self.finish_bulk_load(conn)
+                await self.reenrich_stale_fields(conn)
+                await self.update_pooled_embeddings(conn)
                 logger.info("✅ All chunks already enriched!")
                 return
             
@@ -539,11 +1250,17 @@ class LMStudioEnricher:
                 chunks = await self.get_pending_chunks(conn, EnricherConfig.BATCH_SIZE)
                 
                 if not chunks:
+                    # Only backed-off chunks left - wait for them if they are due soon
+                    if await self.wait_for_backoff(conn):
+                        continue
                     break
                 
                 await self.process_chunks_batch(conn, chunks)
                 processed_total += len(chunks)
                 
+                if self.bulk_load and self.unmerged_embeddings >= EnricherConfig.BULK_MERGE_BATCH_SIZE:
+                    await self.merge_staged_embeddings(conn)
+                
                 elapsed = time.time() - start_time
                 rate = processed_total / elapsed if elapsed > 0 else 0
                 
@@ -558,13 +1275,27 @@ class LMStudioEnricher:
                     
                 logger.info(f"📊 {remaining} chunks remaining")
             
+            if self.bulk_load:
+                await self.finish_bulk_load(conn)
+            
+            await self.reembed_missing(conn)
+            await self.reenrich_stale_fields(conn)
+            await self.update_pooled_embeddings(conn)
+            
             # Final stats
             final_stats = await self.get_enrichment_stats(conn)
             elapsed = time.time() - start_time
             
             logger.info(f"🎉 Enrichment completed!")
             logger.info(f"📊 Final stats: {final_stats}")
+            if final_stats['dead_lettered_chunks']:
+                logger.warning(f"📭 {final_stats['dead_lettered_chunks']} chunks are dead-lettered "
+                               f"(see code_chunks.last_error, REQUEUE_DEAD_LETTERS=true to retry)")
             logger.info(f"⏱️  Total time: {elapsed:.1f}s, Rate: {processed_total/elapsed:.1f} chunks/sec")
+            if self.compaction_stats["raw_tokens"]:
+                saved = 1 - self.compaction_stats["compacted_tokens"] / self.compaction_stats["raw_tokens"]
+                logger.info(f"🗜️  Code compaction: ~{self.compaction_stats['raw_tokens']} → "
+                            f"~{self.compaction_stats['compacted_tokens']} tokens ({saved:.1%} saved)")
             
         except Exception as e:
             logger.error(f"❌ Enrichment failed: {e}")
@@ -0,0 +1,128 @@
+"""
+Rule-based pre-classification of trivial code chunks
+Getters, setters, one-line returns and empty blocks get templated summaries
+and fixed scores instead of four LLM prompts
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config import EnricherConfig, PromptTemplates
+from compaction import strip_comments
+
+GETTER_PATTERN = re.compile(r'^return\s+\$this->(\w+)\s*;$')
+SETTER_PATTERN = re.compile(r'^\$this->(\w+)\s*=\s*\$\w+\s*;(?:\s*return\s+\$this\s*;)?$')
+ONE_LINE_RETURN_PATTERN = re.compile(r'^return\b\s*([^;]*);$')
+
+MAX_TARGET_LENGTH = 60
+
+
+@dataclass
+class HeuristicMatch:
+    rule: str
+    summary: str
+
+
+@dataclass
+class PrefilterReport:
+    candidates: int = 0
+    pending: int = 0
+    by_rule: Counter = field(default_factory=Counter)
+
+    @property
+    def matched(self) -> int:
+        return sum(self.by_rule.values())
+
+    @property
+    def fraction_removed(self) -> float:
+        return self.matched / self.pending if self.pending else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "pending": self.pending,
+            "candidates": self.candidates,
+            "matched": self.matched,
+            "fraction_removed": round(self.fraction_removed, 4),
+            "by_rule": dict(self.by_rule),
+        }
+
+
+class TrivialChunkClassifier:
+    """Detects trivial chunks from parser metrics and a few code patterns"""
+
+    def __init__(self, rules: Optional[List[str]] = None):
+        self.rules = rules if rules is not None else EnricherConfig.HEURISTIC_RULES
+        self.max_lines = EnricherConfig.HEURISTIC_MAX_LINES
+        self.max_nesting = EnricherConfig.HEURISTIC_MAX_NESTING
+        self.max_cyclomatic = EnricherConfig.HEURISTIC_MAX_CYCLOMATIC
+
+    @staticmethod
+    def _body(code: str) -> str:
+        """Strip comments, outer braces and whitespace from a chunk"""
+        body = strip_comments(code).strip()
+        if body.startswith('{') and body.endswith('}'):
+            body = body[1:-1].strip()
+        return body
+
+    @staticmethod
+    def _line_count(chunk) -> int:
+        if getattr(chunk, 'chunk_length_lines', 0):
+            return chunk.chunk_length_lines
+        return chunk.code.count('\n') + 1
+
+    def _passes_metric_gates(self, chunk) -> bool:
+        if self._line_count(chunk) > self.max_lines:
+            return False
+        if (chunk.nesting_level or 0) > self.max_nesting:
+            return False
+        # Cyclomatic complexity is measured per function, so it only says
+        # something about the chunk when the chunk is the whole function body
+        if chunk.chunk_type == 'main':
+            cyclomatic = getattr(chunk, 'cyclomatic_complexity', None)
+            if cyclomatic is not None and cyclomatic > self.max_cyclomatic:
+                return False
+        return True
+
+    def _match_rule(self, body: str) -> Optional[tuple]:
+        """Return (rule, target) for the first enabled rule matching the body"""
+        if 'empty_block' in self.rules and not body:
+            return 'empty_block', ''
+
+        if 'getter' in self.rules:
+            match = GETTER_PATTERN.match(body)
+            if match:
+                return 'getter', f"${match.group(1)}"
+
+        if 'setter' in self.rules:
+            match = SETTER_PATTERN.match(body)
+            if match:
+                return 'setter', f"${match.group(1)}"
+
+        if 'one_line_return' in self.rules and '\n' not in body:
+            match = ONE_LINE_RETURN_PATTERN.match(body)
+            if match:
+                target = match.group(1).strip() or 'nothing'
+                if len(target) > MAX_TARGET_LENGTH:
+                    target = target[:MAX_TARGET_LENGTH] + '...'
+                return 'one_line_return', f"`{target}`" if target != 'nothing' else target
+
+        return None
+
+    def classify(self, chunk) -> Optional[HeuristicMatch]:
+        """Classify a chunk, returning None if it needs full LLM enrichment"""
+        if not self._passes_metric_gates(chunk):
+            return None
+
+        matched = self._match_rule(self._body(chunk.code))
+        if not matched:
+            return None
+
+        rule, target = matched
+        summary = PromptTemplates.HEURISTIC_SUMMARIES[rule].format(
+            chunk_type=chunk.chunk_type or 'code',
+            function_name=chunk.function_name,
+            target=target
+        )
+        return HeuristicMatch(rule=rule, summary=summary)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI-compatible LLM server for benchmarks and CI
+Serves /v1/chat/completions, /v1/embeddings and /v1/models like LM Studio,
+with deterministic answers and a simulated KV prefix cache
+
+Usage: python src/mock_llm_server.py --port 1234 [--cache-slots 1] [--ms-per-token 0.05]
+"""
+
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+TAGS = ['authentication', 'payment', 'user-management', 'reporting', 'integration',
+        'data-processing', 'validation', 'notification', 'api-endpoint', 'security-sensitive']
+
+
+def tokenize(text: str) -> List[str]:
+    """Rough tokenizer - words and punctuation"""
+    return TOKEN_PATTERN.findall(text)
+
+
+def _seed(text: str) -> int:
+    return int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class PrefixCache:
+    """Simulates an inference server keeping KV cache for the last N prompts"""
+
+    def __init__(self, slots: int = 1):
+        self.slots: List[List[str]] = []
+        self.max_slots = max(1, slots)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    @staticmethod
+    def _common_prefix(a: List[str], b: List[str]) -> int:
+        n = min(len(a), len(b))
+        i = 0
+        while i < n and a[i] == b[i]:
+            i += 1
+        return i
+
+    def lookup(self, tokens: List[str]) -> int:
+        """Return the number of cached prompt tokens and store the prompt in a slot"""
+        with self.lock:
+            best_slot, best_len = None, 0
+            for i, cached in enumerate(self.slots):
+                common = self._common_prefix(cached, tokens)
+                if common > best_len:
+                    best_slot, best_len = i, common
+
+            # The slot that served the request now holds this prompt (LRU order)
+            if best_slot is not None:
+                self.slots.pop(best_slot)
+            elif len(self.slots) >= self.max_slots:
+                self.slots.pop(0)
+            self.slots.append(tokens)
+
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += len(tokens)
+            self.stats["cached_tokens"] += best_len
+            return best_len
+
+    def reset(self):
+        with self.lock:
+            self.slots = []
+            self.stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+
+class MockLLM:
+    """Deterministic answers so that runs against the mock are reproducible"""
+
+    def __init__(self, cache_slots: int = 1, ms_per_token: float = 0.0,
+                 dimension: int = 384, failure_rate: float = 0.0):
+        self.cache = PrefixCache(cache_slots)
+        self.ms_per_token = ms_per_token
+        self.dimension = dimension
+        self.failure_rate = failure_rate
+
+    def complete(self, messages: List[Dict], model: str) -> Dict:
+        prompt = '\n'.join(m.get('content', '') for m in messages)
+        tokens = tokenize(prompt)
+        cached = self.cache.lookup(tokens)
+        processed = len(tokens) - cached
+
+        if self.ms_per_token > 0:
+            time.sleep(processed * self.ms_per_token / 1000.0)
+
+        rng = random.Random(_seed(model + prompt))
+        if 'ONLY the number' in prompt:
+            content = f"{rng.randint(1, 10) / 10:.1f}"
+        elif 'tags' in prompt.lower() and 'Choose from' in prompt:
+            content = ', '.join(rng.sample(TAGS, rng.randint(1, 3)))
+        else:
+            words = [t for t in tokenize(prompt.split('```php')[-1]) if t.isidentifier()][:6]
+            content = f"Handles {' '.join(words) or 'the given logic'} and returns the result."
+
+        return {
+            "id": f"mock-{_seed(prompt) % 10**8}",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(tokens),
+                "completion_tokens": len(tokenize(content)),
+                "total_tokens": len(tokens) + len(tokenize(content)),
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+
+    def embed(self, inputs, model: str) -> Dict:
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        data = []
+        for i, text in enumerate(inputs):
+            rng = random.Random(_seed(model + text))
+            vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimension)]
+            norm = sum(v * v for v in vector) ** 0.5 or 1.0
+            data.append({"object": "embedding", "index": i, "embedding": [v / norm for v in vector]})
+
+        return {"object": "list", "model": model, "data": data,
+                "usage": {"prompt_tokens": sum(len(tokenize(t)) for t in inputs)}}
+
+
+def make_handler(llm: MockLLM):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Dict):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_json(self) -> Optional[Dict]:
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                return json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                return None
+
+        def do_GET(self):
+            if self.path.rstrip('/') in ('/v1/models', '/models'):
+                self._send(200, {"data": [{"id": "mock-llm"}, {"id": "mock-embedding"}]})
+            elif self.path.rstrip('/') in ('/mock/stats', '/health'):
+                self._send(200, dict(llm.cache.stats))
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = self._read_json()
+            if body is None:
+                self._send(400, {"error": "invalid json"})
+                return
+
+            if self.path.rstrip('/') == '/mock/reset':
+                llm.cache.reset()
+                self._send(200, {"status": "reset"})
+                return
+
+            if llm.failure_rate and random.random() < llm.failure_rate:
+                self._send(500, {"error": "simulated failure"})
+                return
+
+            model = body.get('model', 'mock')
+            if self.path.endswith('/chat/completions'):
+                self._send(200, llm.complete(body.get('messages', []), model))
+            elif self.path.endswith('/embeddings'):
+                self._send(200, llm.embed(body.get('input', ''), model))
+            else:
+                self._send(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_mock_server(port: int = 0, **kwargs) -> ThreadingHTTPServer:
+    """Start the mock server in a daemon thread; port 0 picks a free port"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(MockLLM(**kwargs)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=1234)
+    parser.add_argument('--cache-slots', type=int, default=1)
+    parser.add_argument('--ms-per-token', type=float, default=0.0)
+    parser.add_argument('--dimension', type=int, default=384)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    llm = MockLLM(args.cache_slots, args.ms_per_token, args.dimension, args.failure_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(llm))
+    print(f"🧪 Mock LLM server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Function- and class-level embeddings pooled from chunk embeddings
+Each function vector is the chunk-length weighted mean of its (normalized) chunk
+vectors, each class vector the line weighted mean of its function vectors.
+No model calls are needed; vectors are computed in bulk with NumPy and only
+for functions whose chunks changed since the last pass.
+
+Usage: python src/pooling.py                       # incremental refresh
+       python src/pooling.py --full                # recompute everything
+       python src/pooling.py --search "refund an order payment"
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+import asyncpg
+import numpy as np
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import EnricherConfig
+
+logger = logging.getLogger(__name__)
+
+# Chunks of a function that changed since its pooled vector was written:
+# new functions, added/removed chunk embeddings or re-enriched chunks
+STALE_FUNCTIONS_QUERY = """
+SELECT cc.function_id
+FROM code_chunks cc
+LEFT JOIN function_embeddings fe ON fe.function_id = cc.function_id
+GROUP BY cc.function_id, fe.function_id, fe.chunk_count, fe.source_enriched_at
+HAVING (fe.function_id IS NULL AND COUNT(cc.embedding) > 0)
+    OR (fe.function_id IS NOT NULL AND (
+        COUNT(cc.embedding) <> fe.chunk_count
+        OR MAX(cc.enriched_at) FILTER (WHERE cc.embedding IS NOT NULL) IS DISTINCT FROM fe.source_enriched_at))
+ORDER BY cc.function_id
+"""
+
+STALE_CLASSES_QUERY = """
+SELECT f.file_id, f.class_name
+FROM functions f
+JOIN function_embeddings fe ON fe.function_id = f.id
+LEFT JOIN class_embeddings ce ON ce.file_id = f.file_id AND ce.class_name = f.class_name
+WHERE f.class_name IS NOT NULL AND f.class_name <> ''
+GROUP BY f.file_id, f.class_name, ce.function_count, ce.updated_at
+HAVING ce.updated_at IS NULL
+    OR COUNT(*) <> ce.function_count
+    OR MAX(fe.updated_at) > ce.updated_at
+"""
+
+
+def parse_vector(text: str) -> np.ndarray:
+    """pgvector text format '[0.1,0.2,...]' to a float32 array"""
+    return np.asarray(json.loads(text), dtype=np.float32)
+
+
+def format_vector(vector: np.ndarray) -> str:
+    """float array to pgvector text format"""
+    return '[' + ','.join(f"{v:.7g}" for v in vector) + ']'
+
+
+def pool(vectors: np.ndarray, weights: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+    """Weighted mean of unit vectors per group, renormalized for cosine search"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+    pooled = np.zeros((n_groups, vectors.shape[1]), dtype=np.float64)
+    np.add.at(pooled, groups, unit * weights[:, None])
+    pooled_norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.maximum(pooled_norms, 1e-12)).astype(np.float32)
+
+
+async def stale_function_ids(conn: asyncpg.Connection, full: bool = False) -> List[int]:
+    if full:
+        rows = await conn.fetch("""
+        SELECT DISTINCT function_id FROM code_chunks WHERE embedding IS NOT NULL ORDER BY function_id
+        """)
+    else:
+        rows = await conn.fetch(STALE_FUNCTIONS_QUERY)
+    return [r['function_id'] for r in rows]
+
+
+async def refresh_function_batch(conn: asyncpg.Connection, function_ids: List[int]) -> int:
+    """Recompute pooled vectors for one batch of functions; returns rows written"""
+    rows = await conn.fetch("""
+    SELECT
+        cc.function_id,
+        cc.embedding::text as embedding,
+        GREATEST(COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 1), 1) as lines,
+        cc.enriched_at
+    FROM code_chunks cc
+    WHERE cc.function_id = ANY($1::int[])
+    AND cc.embedding IS NOT NULL
+    """, function_ids)
+
+    if rows:
+        ids, groups = np.unique(np.array([r['function_id'] for r in rows]), return_inverse=True)
+        vectors = np.stack([parse_vector(r['embedding']) for r in rows])
+        weights = np.array([r['lines'] for r in rows], dtype=np.float64)
+        pooled = pool(vectors, weights, groups, len(ids))
+        counts = np.bincount(groups, minlength=len(ids))
+        total_lines = np.bincount(groups, weights=weights, minlength=len(ids))
+
+        last_enriched: Dict[int, object] = {}
+        for r in rows:
+            current = last_enriched.get(r['function_id'])
+            if r['enriched_at'] is not None and (current is None or r['enriched_at'] > current):
+                last_enriched[r['function_id']] = r['enriched_at']
+
+        await conn.executemany("""
+        INSERT INTO function_embeddings
+            (function_id, embedding, chunk_count, total_lines, source_enriched_at, updated_at)
+        VALUES ($1, $2::vector, $3, $4, $5, NOW())
+        ON CONFLICT (function_id) DO UPDATE SET
+            embedding = EXCLUDED.embedding,
+            chunk_count = EXCLUDED.chunk_count,
+            total_lines = EXCLUDED.total_lines,
+            source_enriched_at = EXCLUDED.source_enriched_at,
+            updated_at = NOW()
+        """, [(int(fid), format_vector(pooled[i]), int(counts[i]), int(total_lines[i]), last_enriched.get(int(fid)))
+              for i, fid in enumerate(ids)])
+        written = {int(fid) for fid in ids}
+    else:
+        written = set()
+
+    # Functions that no longer have any chunk embedding lose their pooled vector
+    gone = [fid for fid in function_ids if fid not in written]
+    if gone:
+        await conn.execute("DELETE FROM function_embeddings WHERE function_id = ANY($1::int[])", gone)
+
+    return len(written)
+
+
+async def refresh_class_embeddings(conn: asyncpg.Connection) -> int:
+    """Recompute vectors of classes whose function vectors changed"""
+    await conn.execute("""
+    DELETE FROM class_embeddings ce
+    WHERE NOT EXISTS (
+        SELECT 1 FROM functions f
+        JOIN function_embeddings fe ON fe.function_id = f.id
+        WHERE f.file_id = ce.file_id AND f.class_name = ce.class_name
+    )
+    """)
+
+    stale = await conn.fetch(STALE_CLASSES_QUERY)
+    if not stale:
+        return 0
+
+    written = 0
+    batch_size = EnricherConfig.POOLING_BATCH_SIZE
+    for start in range(0, len(stale), batch_size):
+        batch = stale[start:start + batch_size]
+        rows = await conn.fetch("""
+        SELECT f.file_id, f.class_name, fe.embedding::text as embedding, fe.total_lines
+        FROM unnest($1::int[], $2::text[]) as c(file_id, class_name)
+        JOIN functions f ON f.file_id = c.file_id AND f.class_name = c.class_name
+        JOIN function_embeddings fe ON fe.function_id = f.id
+        """, [r['file_id'] for r in batch], [r['class_name'] for r in batch])
+        if not rows:
+            continue
+
+        keys = [(r['file_id'], r['class_name']) for r in rows]
+        index: Dict[Tuple[int, str], int] = {}
+        groups = np.array([index.setdefault(k, len(index)) for k in keys])
+        vectors = np.stack([parse_vector(r['embedding']) for r in rows])
+        weights = np.array([max(r['total_lines'], 1) for r in rows], dtype=np.float64)
+        pooled = pool(vectors, weights, groups, len(index))
+        counts = np.bincount(groups, minlength=len(index))
+        total_lines = np.bincount(groups, weights=weights, minlength=len(index))
+
+        await conn.executemany("""
+        INSERT INTO class_embeddings (file_id, class_name, embedding, function_count, total_lines, updated_at)
+        VALUES ($1, $2, $3::vector, $4, $5, NOW())
+        ON CONFLICT (file_id, class_name) DO UPDATE SET
+            embedding = EXCLUDED.embedding,
+            function_count = EXCLUDED.function_count,
+            total_lines = EXCLUDED.total_lines,
+            updated_at = NOW()
+        """, [(file_id, class_name, format_vector(pooled[i]), int(counts[i]), int(total_lines[i]))
+              for (file_id, class_name), i in index.items()])
+        written += len(index)
+
+    return written
+
+
+async def refresh_pooled_embeddings(conn: asyncpg.Connection, full: bool = False) -> Dict[str, int]:
+    """Bring function (and class) embeddings up to date with the chunk embeddings"""
+    function_ids = await stale_function_ids(conn, full)
+    functions = 0
+    batch_size = EnricherConfig.POOLING_BATCH_SIZE
+    for start in range(0, len(function_ids), batch_size):
+        functions += await refresh_function_batch(conn, function_ids[start:start + batch_size])
+
+    classes = await refresh_class_embeddings(conn) if EnricherConfig.POOL_CLASS_EMBEDDINGS else 0
+    return {"stale_functions": len(function_ids), "functions": functions, "classes": classes}
+
+
+async def search_functions(conn: asyncpg.Connection, query_embedding: str, limit: int = 10) -> List[Dict]:
+    """Nearest functions to a query embedding (pgvector text format)"""
+    rows = await conn.fetch("""
+    SELECT f.id, f.function_name, f.class_name, files.filepath, fe.chunk_count,
+           fe.embedding <=> $1::vector as distance
+    FROM function_embeddings fe
+    JOIN functions f ON fe.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    ORDER BY fe.embedding <=> $1::vector
+    LIMIT $2
+    """, query_embedding, limit)
+    return [dict(r) for r in rows]
+
+
+async def main(args):
+    conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+    try:
+        if args.search:
+            from enricher import LMStudioEnricher
+
+            enricher = LMStudioEnricher()
+            embedding = await enricher.generate_embedding(args.search)
+            await enricher.http_client.aclose()
+            if embedding is None:
+                print("❌ Could not embed the query")
+                return
+            for r in await search_functions(conn, enricher.to_pgvector(embedding), args.limit):
+                name = f"{r['class_name']}::{r['function_name']}" if r['class_name'] else r['function_name']
+                print(f"  {r['distance']:.3f}  {name:<50} {r['filepath']} ({r['chunk_count']} chunks)")
+            return
+
+        counts = await refresh_pooled_embeddings(conn, full=args.full)
+        print(f"🧮 Pooled embeddings: {counts['functions']} functions, {counts['classes']} classes updated "
+              f"({counts['stale_functions']} stale functions)")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Function/class embeddings pooled from chunk embeddings")
+    parser.add_argument('--full', action='store_true', help="recompute all functions, not only stale ones")
+    parser.add_argument('--search', help="search functions by text (embeds the query once)")
+    parser.add_argument('--limit', type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
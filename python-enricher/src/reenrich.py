@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Selective re-enrichment of stale fields
+Re-runs only the fields whose prompt template or model version changed (see
+versioning.py): editing the tag prompt costs one tag prompt per chunk, not a
+full enrichment. Runs as a low-priority backlog after regular enrichment, or
+on demand from the command line.
+
+Usage: python src/reenrich.py --dry-run             # stale counts per field
+       python src/reenrich.py [--fields tags] [--limit 1000]
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+import asyncpg
+from typing import Dict, List, Optional, Sequence, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import EnricherConfig, PromptTemplates
+from versioning import FIELDS, FIXED_SOURCES, current_versions, enabled_fields, stale_fields
+
+logger = logging.getLogger(__name__)
+
+
+def _stale_conditions(fields: Sequence[str], first_param: int) -> Tuple[List[str], List[str]]:
+    """One SQL condition per field plus the version parameters it compares against"""
+    current = current_versions()
+    fixed = ', '.join(f"'{source}'" for source in FIXED_SOURCES)
+    conditions, params = [], []
+    for i, field in enumerate(fields):
+        condition = f"COALESCE(cc.enrichment_versions->>'{field}', '') NOT IN ({fixed}, ${first_param + i})"
+        if field == 'embedding':
+            # Missing embeddings are handled by reembed_missing
+            condition = f"(cc.embedding IS NOT NULL AND {condition})"
+        conditions.append(condition)
+        params.append(current[field])
+    return conditions, params
+
+
+async def baseline_unversioned(conn: asyncpg.Connection) -> int:
+    """Stamp chunks enriched before versioning existed with the current versions
+
+    Tags of those chunks were never stored, so they stay unversioned and are
+    picked up by the backlog.
+    """
+    current = current_versions()
+    result = await conn.execute("""
+    UPDATE code_chunks
+    SET enrichment_versions = CASE
+        WHEN enrichment_source = 'heuristic' THEN jsonb_build_object(
+            'summary', 'heuristic', 'complexity', 'heuristic', 'business_impact', 'heuristic', 'tags', 'heuristic',
+            'embedding', CASE WHEN embedding IS NULL THEN NULL ELSE $4::text END)
+        ELSE jsonb_build_object(
+            'summary', $1::text,
+            'complexity', CASE WHEN complexity_source = 'metric' THEN 'metric' ELSE $2::text END,
+            'business_impact', $3::text,
+            'tags', NULL,
+            'embedding', CASE WHEN embedding IS NULL THEN NULL ELSE $4::text END)
+    END
+    WHERE enriched_at IS NOT NULL
+    AND enrichment_versions IS NULL
+    """, current['summary'], current['complexity'], current['business_impact'], current['embedding'])
+    count = int(result.split()[-1])
+    if count:
+        logger.info(f"🏷️  Stamped {count} unversioned chunks with the current prompt/model versions")
+    return count
+
+
+async def count_stale(conn: asyncpg.Connection, fields: Sequence[str]) -> Dict[str, int]:
+    """Number of enriched chunks with a stale version, per field"""
+    conditions, params = _stale_conditions(fields, 1)
+    counts = ', '.join(f"COUNT(*) FILTER (WHERE {c}) as {f}" for f, c in zip(fields, conditions))
+    row = await conn.fetchrow(f"""
+    SELECT {counts}
+    FROM code_chunks cc
+    WHERE cc.enriched_at IS NOT NULL
+    AND cc.dead_lettered_at IS NULL
+    """, *params)
+    return dict(row)
+
+
+async def fetch_stale_chunks(enricher, conn: asyncpg.Connection, fields: Sequence[str], limit: int,
+                             after: Tuple[int, int]) -> List[Tuple]:
+    """Next batch of chunks with stale fields in (function_id, chunk_index) order"""
+    conditions, params = _stale_conditions(fields, 4)
+    rows = await conn.fetch(f"""
+    SELECT
+        cc.id, cc.function_id, cc.chunk_index, cc.chunk_type, cc.nesting_level, cc.code,
+        f.function_name, f.class_name, files.filepath,
+        COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 0) as chunk_length_lines,
+        f.cyclomatic_complexity,
+        NULL::real as complexity_score,
+        cc.summary,
+        cc.enrichment_versions
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    JOIN files ON f.file_id = files.id
+    WHERE cc.enriched_at IS NOT NULL
+    AND cc.dead_lettered_at IS NULL
+    AND (cc.function_id, cc.chunk_index) > ($2, $3)
+    AND ({' OR '.join(conditions)})
+    ORDER BY cc.function_id, cc.chunk_index
+    LIMIT $1
+    """, limit, after[0], after[1], *params)
+
+    items = []
+    for row in rows:
+        versions = json.loads(row['enrichment_versions']) if row['enrichment_versions'] else {}
+        items.append((enricher._row_to_chunk(row), row['summary'], stale_fields(versions, fields)))
+    return items
+
+
+async def reenrich_batch(enricher, conn: asyncpg.Connection, items: List[Tuple]) -> Dict[str, int]:
+    """Re-run stale fields prompt type by prompt type; failed fields stay stale"""
+    from enricher import parse_score, parse_tags
+
+    current = current_versions()
+    build = enricher.build_prompt
+    summaries: Dict[int, str] = {}
+    scores: Dict[str, Dict[int, float]] = {'complexity': {}, 'business_impact': {}}
+    tags: Dict[int, List[str]] = {}
+    done = {f: 0 for f in FIELDS}
+
+    for chunk, _, stale in items:
+        if 'summary' in stale:
+            summary = await enricher.call_llm(build(PromptTemplates.SUMMARY_TEMPLATE, chunk),
+                                              EnricherConfig.MAX_SUMMARY_LENGTH)
+            if summary:
+                summaries[chunk.id] = summary
+
+    for field, template in (('complexity', PromptTemplates.COMPLEXITY_TEMPLATE),
+                            ('business_impact', PromptTemplates.BUSINESS_IMPACT_TEMPLATE)):
+        for chunk, _, stale in items:
+            if field in stale:
+                score = parse_score(await enricher.call_llm(build(template, chunk), max_tokens=10))
+                if score is not None:
+                    scores[field][chunk.id] = score
+
+    for chunk, _, stale in items:
+        if 'tags' in stale:
+            parsed = parse_tags(await enricher.call_llm(build(PromptTemplates.TAG_DETECTION_TEMPLATE, chunk),
+                                                        max_tokens=100))
+            if parsed is not None:
+                tags[chunk.id] = parsed
+
+    to_embed = [(chunk, summaries.get(chunk.id, summary)) for chunk, summary, stale in items
+                if 'embedding' in stale and summary is not None]
+    embeddings = await enricher.generate_embeddings_batch(
+        [enricher.embedding_text(summary, chunk.code) for chunk, summary in to_embed])
+    new_embeddings = {chunk.id: e for (chunk, _), e in zip(to_embed, embeddings) if e is not None}
+
+    # Pooled vectors of these functions still mix in the replaced embeddings
+    reembedded = sorted({chunk.function_id for chunk, _, _ in items if chunk.id in new_embeddings})
+    async with conn.transaction():
+        for chunk, _, stale in items:
+            versions: Dict[str, Optional[str]] = {}
+            if chunk.id in summaries:
+                versions['summary'] = current['summary']
+                # An embedding of the old summary no longer matches
+                versions['embedding'] = None
+            for field in ('complexity', 'business_impact'):
+                if chunk.id in scores[field]:
+                    versions[field] = current[field]
+            if chunk.id in tags:
+                versions['tags'] = current['tags']
+                await enricher.store_chunk_tags(conn, chunk.id, tags[chunk.id])
+            if chunk.id in new_embeddings:
+                versions['embedding'] = current['embedding']
+            if not versions:
+                continue
+
+            await conn.execute("""
+            UPDATE code_chunks
+            SET summary = COALESCE($2, summary),
+                complexity_score = COALESCE($3, complexity_score),
+                complexity_source = CASE WHEN $3::real IS NULL THEN complexity_source ELSE 'llm' END,
+                business_impact_score = COALESCE($4, business_impact_score),
+                embedding = COALESCE($5::vector, embedding),
+                enrichment_versions = COALESCE(enrichment_versions, '{}'::jsonb) || $6::jsonb
+            WHERE id = $1
+            """, chunk.id, summaries.get(chunk.id), scores['complexity'].get(chunk.id),
+                scores['business_impact'].get(chunk.id), enricher.to_pgvector(new_embeddings.get(chunk.id)),
+                json.dumps(versions))
+
+            for field, version in versions.items():
+                if version is not None:
+                    done[field] += 1
+
+        if reembedded:
+            await conn.execute("DELETE FROM function_embeddings WHERE function_id = ANY($1::int[])", reembedded)
+
+    return done
+
+
+async def reenrich_stale(enricher, conn: asyncpg.Connection, fields: Optional[Sequence[str]] = None,
+                         limit: Optional[int] = None) -> Dict[str, int]:
+    """One pass over chunks with stale fields; returns fields re-run per type"""
+    fields = [f for f in (fields or FIELDS) if f in enabled_fields()]
+    if not fields:
+        return {}
+
+    await baseline_unversioned(conn)
+
+    totals = {f: 0 for f in FIELDS}
+    after = (0, -1)
+    processed = 0
+    while not limit or processed < limit:
+        batch_size = EnricherConfig.REENRICH_BATCH_SIZE
+        if limit:
+            batch_size = min(batch_size, limit - processed)
+        items = await fetch_stale_chunks(enricher, conn, fields, batch_size, after)
+        if not items:
+            break
+
+        done = await reenrich_batch(enricher, conn, items)
+        for field, count in done.items():
+            totals[field] += count
+        processed += len(items)
+        last = items[-1][0]
+        after = (last.function_id, last.chunk_index)
+        logger.info(f"🔁 Re-enriched stale fields of {processed} chunks: {dict((f, c) for f, c in totals.items() if c)}")
+
+        # Low priority - leave room for other work on the inference server
+        if EnricherConfig.CHUNK_DELAY > 0:
+            await asyncio.sleep(EnricherConfig.CHUNK_DELAY)
+
+    return totals
+
+
+async def main(args):
+    from enricher import LMStudioEnricher
+
+    fields = [f.strip() for f in args.fields.split(',') if f.strip()] if args.fields else list(FIELDS)
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        print(f"❌ Unknown fields: {', '.join(sorted(unknown))} (choose from {', '.join(FIELDS)})")
+        return
+
+    conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+    try:
+        if args.dry_run:
+            await baseline_unversioned(conn)
+            print("🏷️  Current versions:")
+            for field, version in current_versions().items():
+                print(f"   {field:<16} {version}")
+            print("📊 Stale chunks per field:")
+            for field, count in (await count_stale(conn, fields)).items():
+                print(f"   {field:<16} {count}")
+            return
+
+        enricher = LMStudioEnricher()
+        try:
+            totals = await reenrich_stale(enricher, conn, fields, args.limit)
+        finally:
+            await enricher.http_client.aclose()
+        print(f"✅ Re-enriched fields: {totals}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-enrich only fields with a stale prompt/model version")
+    parser.add_argument('--fields', help=f"comma separated subset of {','.join(FIELDS)}")
+    parser.add_argument('--limit', type=int, help="stop after this many chunks")
+    parser.add_argument('--dry-run', action='store_true', help="only show stale counts")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Metric-derived complexity scoring
+A linear model over parser metrics (cyclomatic complexity, nesting level, lines
+of code, parameter count) calibrated against existing LLM complexity scores.
+Scores are computed for all pending chunks in one NumPy pass; chunks where the
+model is uncertain keep the LLM prompt.
+
+Usage: python src/score_model.py            # calibration report against LLM scores
+"""
+
+import os
+import sys
+import asyncio
+import asyncpg
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import EnricherConfig
+
+FEATURE_NAMES = ['intercept', 'log_cyclomatic', 'nesting_level', 'log_chunk_lines',
+                 'log_function_lines', 'parameter_count']
+
+# Shared column list so training and prediction use identical features
+FEATURE_COLUMNS = """
+    COALESCE(f.cyclomatic_complexity, 1) as cyclomatic_complexity,
+    COALESCE(cc.nesting_level, 0) as nesting_level,
+    COALESCE(NULLIF(cc.chunk_length_lines, 0), cc.end_line - cc.start_line + 1, 1) as chunk_lines,
+    COALESCE(f.lines_of_code, 1) as function_lines,
+    COALESCE(f.parameter_count, 0) as parameter_count
+"""
+
+SCORE_BUCKETS = np.array([0.35, 0.65])  # low / medium / high
+
+
+def build_features(rows) -> np.ndarray:
+    """Feature matrix (n x len(FEATURE_NAMES)) from rows with FEATURE_COLUMNS"""
+    raw = np.array([
+        (r['cyclomatic_complexity'], r['nesting_level'], r['chunk_lines'],
+         r['function_lines'], r['parameter_count'])
+        for r in rows
+    ], dtype=np.float64).reshape(-1, 5)
+    raw = np.maximum(raw, 0.0)
+
+    return np.column_stack([
+        np.ones(len(raw)),
+        np.log1p(raw[:, 0]),
+        raw[:, 1],
+        np.log1p(raw[:, 2]),
+        np.log1p(raw[:, 3]),
+        raw[:, 4],
+    ])
+
+
+class MetricScoreModel:
+    """Least-squares model with a per-score-band prediction interval"""
+
+    def __init__(self, bins: int = 10):
+        self.bins = bins
+        self.coef: Optional[np.ndarray] = None
+        self.xtx_inv: Optional[np.ndarray] = None
+        self.bin_sigma: Optional[np.ndarray] = None
+        self.n_samples = 0
+
+    @property
+    def is_fitted(self) -> bool:
+        return self.coef is not None
+
+    def fit(self, X: np.ndarray, y: np.ndarray) -> 'MetricScoreModel':
+        self.coef, *_ = np.linalg.lstsq(X, y, rcond=None)
+        self.xtx_inv = np.linalg.pinv(X.T @ X)
+        self.n_samples = len(y)
+
+        # Residual spread per band of predicted score - trivial code is easier
+        # to score than mid-range code, so one global sigma would be misleading
+        predicted = np.clip(X @ self.coef, 0.1, 1.0)
+        residuals = y - predicted
+        band = self._band(predicted)
+        global_sigma = float(np.std(residuals)) if len(residuals) > 1 else 1.0
+        counts = np.bincount(band, minlength=self.bins)
+        sq_sums = np.bincount(band, weights=residuals ** 2, minlength=self.bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sigma = np.sqrt(sq_sums / counts)
+        # Thinly populated bands fall back to the global residual spread
+        self.bin_sigma = np.where(counts >= 10, sigma, global_sigma)
+        return self
+
+    def _band(self, scores: np.ndarray) -> np.ndarray:
+        return np.clip(((scores - 0.1) / 0.9 * self.bins).astype(int), 0, self.bins - 1)
+
+    def predict(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Predicted scores and prediction-interval half widths"""
+        scores = np.clip(X @ self.coef, 0.1, 1.0)
+        leverage = np.einsum('ij,jk,ik->i', X, self.xtx_inv, X)
+        half_width = EnricherConfig.METRIC_SCORE_Z * self.bin_sigma[self._band(scores)] * np.sqrt(1.0 + leverage)
+        return scores, half_width
+
+
+def agreement_metrics(predicted: np.ndarray, actual: np.ndarray) -> Dict:
+    """Agreement between metric-derived and LLM scores"""
+    if len(actual) == 0:
+        return {"samples": 0}
+    error = predicted - actual
+    correlation = float(np.corrcoef(predicted, actual)[0, 1]) if len(actual) > 1 and np.std(predicted) > 0 else 0.0
+    return {
+        "samples": int(len(actual)),
+        "mae": round(float(np.mean(np.abs(error))), 4),
+        "rmse": round(float(np.sqrt(np.mean(error ** 2))), 4),
+        "pearson_r": round(correlation, 4),
+        "within_0.1": round(float(np.mean(np.abs(error) <= 0.1)), 4),
+        "within_0.2": round(float(np.mean(np.abs(error) <= 0.2)), 4),
+        "bucket_agreement": round(float(np.mean(
+            np.digitize(predicted, SCORE_BUCKETS) == np.digitize(actual, SCORE_BUCKETS))), 4),
+    }
+
+
+def calibration_report(X: np.ndarray, y: np.ndarray, folds: int = 5, seed: int = 42) -> Dict:
+    """K-fold cross-validated agreement, overall and on the confident subset"""
+    order = np.random.default_rng(seed).permutation(len(y))
+    predicted = np.empty(len(y))
+    half_width = np.empty(len(y))
+
+    for fold in np.array_split(order, folds):
+        train = np.setdiff1d(order, fold)
+        model = MetricScoreModel().fit(X[train], y[train])
+        predicted[fold], half_width[fold] = model.predict(X[fold])
+
+    confident = half_width <= EnricherConfig.METRIC_SCORE_MAX_UNCERTAINTY
+    full_model = MetricScoreModel().fit(X, y)
+    return {
+        "folds": folds,
+        "coefficients": dict(zip(FEATURE_NAMES, np.round(full_model.coef, 4).tolist())),
+        "all": agreement_metrics(predicted, y),
+        "confident": agreement_metrics(predicted[confident], y[confident]),
+        "uncertain": agreement_metrics(predicted[~confident], y[~confident]),
+        "coverage": round(float(np.mean(confident)), 4),
+        "max_uncertainty": EnricherConfig.METRIC_SCORE_MAX_UNCERTAINTY,
+    }
+
+
+async def load_training_data(conn: asyncpg.Connection) -> Tuple[np.ndarray, np.ndarray]:
+    """Features and LLM complexity scores of already enriched chunks"""
+    rows = await conn.fetch(f"""
+    SELECT {FEATURE_COLUMNS}, cc.complexity_score
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    WHERE cc.enriched_at IS NOT NULL
+    AND cc.complexity_score IS NOT NULL
+    -- Leaves out metric predictions and 'fallback' placeholders of failed replies
+    AND COALESCE(cc.complexity_source, 'llm') = 'llm'
+    AND COALESCE(cc.enrichment_source, 'llm') <> 'heuristic'
+    """)
+    y = np.array([r['complexity_score'] for r in rows], dtype=np.float64)
+    return build_features(rows), y
+
+
+async def load_pending_features(conn: asyncpg.Connection) -> Tuple[List[int], np.ndarray]:
+    """Chunk ids and features of pending chunks without a complexity score"""
+    rows = await conn.fetch(f"""
+    SELECT cc.id, {FEATURE_COLUMNS}
+    FROM code_chunks cc
+    JOIN functions f ON cc.function_id = f.id
+    WHERE cc.enriched_at IS NULL
+    AND cc.complexity_score IS NULL
+    """)
+    return [r['id'] for r in rows], build_features(rows)
+
+
+async def fit_from_database(conn: asyncpg.Connection) -> Optional[MetricScoreModel]:
+    """Calibrate on existing LLM scores; None if there are too few samples"""
+    X, y = await load_training_data(conn)
+    if len(y) < EnricherConfig.METRIC_SCORE_MIN_SAMPLES:
+        return None
+    return MetricScoreModel().fit(X, y)
+
+
+def print_report(report: Dict):
+    print("📐 Metric-derived complexity score calibration")
+    print(f"   Coefficients: {report['coefficients']}")
+    print(f"   Confident coverage: {report['coverage']:.1%} (half width <= {report['max_uncertainty']})")
+    for name in ('all', 'confident', 'uncertain'):
+        m = report[name]
+        if not m.get('samples'):
+            print(f"   {name:<10} no samples")
+            continue
+        print(f"   {name:<10} n={m['samples']:<6} MAE={m['mae']:.3f} RMSE={m['rmse']:.3f} r={m['pearson_r']:.3f} "
+              f"±0.1={m['within_0.1']:.1%} ±0.2={m['within_0.2']:.1%} bucket={m['bucket_agreement']:.1%}")
+
+
+async def main():
+    conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+    try:
+        X, y = await load_training_data(conn)
+        if len(y) < EnricherConfig.METRIC_SCORE_MIN_SAMPLES:
+            print(f"❌ Only {len(y)} LLM-scored chunks, need {EnricherConfig.METRIC_SCORE_MIN_SAMPLES} to calibrate")
+            return
+        print_report(calibration_report(X, y))
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+ANN index maintenance for code_chunks.embedding
+Drops the ANN index for bulk loads and (re)builds it with CREATE INDEX
+CONCURRENTLY, reporting progress from pg_stat_progress_create_index. The
+index method and build parameters come from the config (VECTOR_INDEX_METHOD,
+HNSW_*, IVFFLAT_LISTS) and can be overridden on the command line to try other
+settings; bench_ann.py measures the resulting recall/latency trade-off.
+
+Usage: python src/vector_index.py --status
+       python src/vector_index.py --rebuild
+       python src/vector_index.py --rebuild --method ivfflat --lists 200
+       python src/vector_index.py --rebuild --method hnsw --m 32 --ef-construction 128
+"""
+
+import os
+import sys
+import math
+import time
+import asyncio
+import argparse
+import logging
+import asyncpg
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import EnricherConfig
+
+logger = logging.getLogger(__name__)
+
+INDEX_METHODS = ('hnsw', 'ivfflat')
+
+
+def index_name(method: str) -> str:
+    return f"idx_chunks_embedding_{method}"
+
+
+CHUNK_EMBEDDING_INDEX = index_name(EnricherConfig.VECTOR_INDEX_METHOD)
+
+
+def default_params(method: str, rows: int = 0) -> Dict[str, int]:
+    """Build parameters from the config; IVFFlat lists follow pgvector's rows/1000, sqrt(rows) above 1M"""
+    if method == 'hnsw':
+        return {'m': EnricherConfig.HNSW_M, 'ef_construction': EnricherConfig.HNSW_EF_CONSTRUCTION}
+    lists = EnricherConfig.IVFFLAT_LISTS
+    if lists <= 0:
+        lists = rows // 1000 if rows <= 1_000_000 else int(math.sqrt(rows))
+    return {'lists': max(1, lists)}
+
+
+def index_definition(name: str = CHUNK_EMBEDDING_INDEX, method: str = None,
+                     params: Optional[Dict[str, int]] = None) -> str:
+    method = method or EnricherConfig.VECTOR_INDEX_METHOD
+    params = params or default_params(method)
+    options = ', '.join(f"{key} = {int(value)}" for key, value in params.items())
+    return (f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON code_chunks "
+            f"USING {method} (embedding vector_cosine_ops) WITH ({options})")
+
+
+async def ann_indexes(conn: asyncpg.Connection) -> List[Dict]:
+    """All HNSW/IVFFlat indexes on code_chunks with validity, size and definition"""
+    rows = await conn.fetch("""
+    SELECT c.relname as name, am.amname as method, i.indisvalid as valid,
+           pg_size_pretty(pg_relation_size(c.oid)) as size,
+           pg_get_indexdef(c.oid) as definition
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_am am ON am.oid = c.relam
+    WHERE i.indrelid = 'code_chunks'::regclass
+    AND am.amname = ANY($1::text[])
+    ORDER BY c.relname
+    """, list(INDEX_METHODS))
+    return [dict(row) for row in rows]
+
+
+async def index_status(conn: asyncpg.Connection, name: str = CHUNK_EMBEDDING_INDEX) -> Optional[Dict]:
+    """Validity and size of an index; None if it does not exist"""
+    row = await conn.fetchrow("""
+    SELECT i.indisvalid as valid, pg_size_pretty(pg_relation_size(c.oid)) as size
+    FROM pg_class c
+    JOIN pg_index i ON i.indexrelid = c.oid
+    WHERE c.relname = $1
+    """, name)
+    return dict(row) if row else None
+
+
+async def drop_index(conn: asyncpg.Connection, name: Optional[str] = None) -> bool:
+    """Drop one index, or every ANN index on code_chunks, without blocking readers; True if any existed"""
+    names = [name] if name else [index['name'] for index in await ann_indexes(conn)]
+    dropped = False
+    for index in names:
+        if await index_status(conn, index) is None:
+            continue
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+        logger.info(f"🗑️  Dropped vector index {index}")
+        dropped = True
+    return dropped
+
+
+async def _report_progress(database_url: str, done: asyncio.Event):
+    """Log pg_stat_progress_create_index for code_chunks until the build finishes"""
+    conn = await asyncpg.connect(database_url)
+    started = time.time()
+    try:
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), timeout=EnricherConfig.INDEX_PROGRESS_INTERVAL)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            row = await conn.fetchrow("""
+            SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+            FROM pg_stat_progress_create_index
+            WHERE relid = 'code_chunks'::regclass
+            """)
+            if not row:
+                continue
+            if row['tuples_total']:
+                progress = f"{row['tuples_done']}/{row['tuples_total']} tuples ({row['tuples_done'] / row['tuples_total']:.0%})"
+            elif row['blocks_total']:
+                progress = f"{row['blocks_done']}/{row['blocks_total']} blocks ({row['blocks_done'] / row['blocks_total']:.0%})"
+            else:
+                progress = f"{row['tuples_done']} tuples"
+            logger.info(f"🏗️  Index build: {row['phase']}, {progress}, {time.time() - started:.0f}s elapsed")
+    finally:
+        await conn.close()
+
+
+async def build_index(conn: asyncpg.Connection, method: Optional[str] = None,
+                      params: Optional[Dict[str, int]] = None, replace: bool = False,
+                      database_url: str = None) -> float:
+    """Build an ANN index concurrently with progress reporting; returns seconds taken
+
+    Without replace nothing is built while any valid ANN index exists. With
+    replace the new index is built first and the other ANN indexes are dropped
+    afterwards, so searches keep an index during the build. When an index of
+    the same name exists, the new one is built under a temporary name and
+    renamed once the old one is gone. An invalid leftover from an interrupted
+    concurrent build is dropped first.
+    """
+    method = method or EnricherConfig.VECTOR_INDEX_METHOD
+    name = index_name(method)
+    build_name = name
+
+    existing = [index for index in await ann_indexes(conn) if index['valid']]
+    if existing and not replace:
+        logger.info(f"✅ Vector index {existing[0]['name']} already exists ({existing[0]['size']})")
+        return 0.0
+
+    status = await index_status(conn, name)
+    if status and not status['valid']:
+        logger.warning(f"⚠️  Dropping invalid vector index {name} left by an interrupted build")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    elif status:
+        build_name = f"{name}_new"
+        if await index_status(conn, build_name) is not None:
+            logger.warning(f"⚠️  Dropping vector index {build_name} left by an interrupted rebuild")
+            await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {build_name}")
+
+    rows = await conn.fetchval("SELECT COUNT(*) FROM code_chunks WHERE embedding IS NOT NULL")
+    params = params or default_params(method, rows)
+    if method == 'ivfflat' and rows < params['lists'] * 10:
+        # IVFFlat clusters are trained on the rows present at build time
+        logger.warning(f"⚠️  Only {rows} embeddings for {params['lists']} IVFFlat lists - rebuild after loading data")
+
+    await conn.execute(f"SET maintenance_work_mem = '{EnricherConfig.INDEX_MAINTENANCE_WORK_MEM}'")
+    await conn.execute(f"SET max_parallel_maintenance_workers = {EnricherConfig.INDEX_PARALLEL_WORKERS}")
+
+    logger.info(f"🏗️  Building vector index {build_name} {params} over {rows} embeddings (CONCURRENTLY)")
+
+    done = asyncio.Event()
+    reporter = asyncio.create_task(_report_progress(database_url or EnricherConfig.DATABASE_URL, done))
+    start = time.time()
+    try:
+        await conn.execute(index_definition(build_name, method, params))
+    finally:
+        done.set()
+        await reporter
+        await conn.execute("RESET maintenance_work_mem")
+        await conn.execute("RESET max_parallel_maintenance_workers")
+
+    elapsed = time.time() - start
+    status = await index_status(conn, build_name)
+    logger.info(f"✅ Vector index {build_name} built in {elapsed:.1f}s ({status['size'] if status else '?'})")
+
+    if replace:
+        for index in await ann_indexes(conn):
+            if index['name'] != build_name:
+                await drop_index(conn, index['name'])
+    if build_name != name:
+        await conn.execute(f"ALTER INDEX {build_name} RENAME TO {name}")
+        logger.info(f"🔁 Renamed vector index {build_name} to {name}")
+    return elapsed
+
+
+def cli_params(args) -> Optional[Dict[str, int]]:
+    """Build parameters given on the command line, completed from the config"""
+    method = args.method or EnricherConfig.VECTOR_INDEX_METHOD
+    if method == 'hnsw' and (args.m or args.ef_construction):
+        return {'m': args.m or EnricherConfig.HNSW_M,
+                'ef_construction': args.ef_construction or EnricherConfig.HNSW_EF_CONSTRUCTION}
+    if method == 'ivfflat' and args.lists:
+        return {'lists': args.lists}
+    return None
+
+
+async def main(args):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    conn = await asyncpg.connect(EnricherConfig.DATABASE_URL)
+    try:
+        if args.rebuild:
+            await build_index(conn, args.method, cli_params(args), replace=True)
+        elif args.build:
+            await build_index(conn, args.method, cli_params(args))
+        else:
+            indexes = await ann_indexes(conn)
+            staged = await conn.fetchval("SELECT COUNT(*) FROM chunk_embedding_staging")
+            if not indexes:
+                print(f"❌ No vector index on code_chunks.embedding (configured: {CHUNK_EMBEDDING_INDEX})")
+            for index in indexes:
+                print(f"{'✅' if index['valid'] else '⚠️ '} {index['name']}: valid={index['valid']}, size={index['size']}")
+                print(f"   {index['definition']}")
+            print(f"📦 Staged embeddings waiting for merge: {staged}")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector index maintenance for code_chunks.embedding")
+    parser.add_argument('--status', action='store_true', help="show index state (default)")
+    parser.add_argument('--build', action='store_true', help="build the index if no valid one exists")
+    parser.add_argument('--rebuild', action='store_true', help="build a new index and drop the others")
+    parser.add_argument('--method', choices=INDEX_METHODS, help="index method (default: VECTOR_INDEX_METHOD)")
+    parser.add_argument('--m', type=int, help="HNSW max connections per layer")
+    parser.add_argument('--ef-construction', type=int, help="HNSW candidate list size while building")
+    parser.add_argument('--lists', type=int, help="IVFFlat number of lists")
+    asyncio.run(main(parser.parse_args()))
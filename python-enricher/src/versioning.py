@@ -0,0 +1,65 @@
+"""
+Prompt/model versions of enriched fields
+Every enriched field records '<model>@<hash of the prompts producing it>' in
+code_chunks.enrichment_versions, so editing one template or switching a model
+only invalidates the fields it actually affects.
+"""
+
+import hashlib
+from typing import Dict, Iterable, Optional, Set
+
+from config import EnricherConfig, PromptTemplates
+
+FIELDS = ('summary', 'complexity', 'business_impact', 'tags', 'embedding')
+
+# Fields not produced by a prompt carry their source instead of a version
+# and are never considered stale
+FIXED_SOURCES = ('heuristic', 'metric')
+
+# The embedding is computed from the summary, so a new summary needs a new embedding
+DEPENDENT_FIELDS = {'summary': ('embedding',)}
+
+
+def template_hash(*templates: str) -> str:
+    """Short stable hash of the prompt texts behind a field"""
+    return hashlib.sha256('\x00'.join(templates).encode('utf-8')).hexdigest()[:12]
+
+
+def current_versions() -> Dict[str, str]:
+    """Version each field would get if it were enriched now"""
+    llm = EnricherConfig.LLM_MODEL
+    system = PromptTemplates.SYSTEM_PROMPT
+    return {
+        # Diff revisions produce summaries too, so both templates version the field
+        'summary': f"{llm}@{template_hash(system, PromptTemplates.SUMMARY_TEMPLATE, PromptTemplates.RESUMMARIZE_TEMPLATE)}",
+        'complexity': f"{llm}@{template_hash(system, PromptTemplates.COMPLEXITY_TEMPLATE)}",
+        'business_impact': f"{llm}@{template_hash(system, PromptTemplates.BUSINESS_IMPACT_TEMPLATE)}",
+        'tags': f"{llm}@{template_hash(system, PromptTemplates.TAG_DETECTION_TEMPLATE)}",
+        'embedding': f"{EnricherConfig.EMBEDDING_MODEL_NAME}@{template_hash(PromptTemplates.EMBEDDING_TEXT_TEMPLATE)}",
+    }
+
+
+def enabled_fields() -> Set[str]:
+    """Fields the current configuration actually produces"""
+    fields = {'summary', 'tags'}
+    if EnricherConfig.ENABLE_COMPLEXITY_SCORING:
+        fields.add('complexity')
+    if EnricherConfig.ENABLE_BUSINESS_IMPACT:
+        fields.add('business_impact')
+    if EnricherConfig.ENABLE_EMBEDDINGS:
+        fields.add('embedding')
+    return fields
+
+
+def is_stale(recorded: Optional[str], current: str) -> bool:
+    return recorded not in FIXED_SOURCES and recorded != current
+
+
+def stale_fields(versions: Optional[Dict[str, Optional[str]]], fields: Iterable[str] = FIELDS) -> Set[str]:
+    """Fields of one chunk that need re-running, including dependent fields"""
+    versions = versions or {}
+    current = current_versions()
+    stale = {f for f in fields if is_stale(versions.get(f), current[f])}
+    for field in list(stale):
+        stale.update(d for d in DEPENDENT_FIELDS.get(field, ()) if d in fields)
+    return stale
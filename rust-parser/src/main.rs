@@ -118,7 +118,13 @@ impl DatabaseWriter {
                     class_name = EXCLUDED.class_name,
                     visibility = EXCLUDED.visibility,
                     parameters = EXCLUDED.parameters,
+                    start_line = EXCLUDED.start_line,
+                    end_line = EXCLUDED.end_line,
+                    start_byte = EXCLUDED.start_byte,
+                    end_byte = EXCLUDED.end_byte,
                     cyclomatic_complexity = EXCLUDED.cyclomatic_complexity,
+                    parameter_count = EXCLUDED.parameter_count,
+                    lines_of_code = EXCLUDED.lines_of_code,
                     updated_at = NOW()
                  RETURNING id",
                 &[
@@ -17,14 +17,16 @@ fi
 # Get core statistics in one query
 docker-compose exec postgres psql -U analyzer -d codeanalysis -t -A -c "
 WITH stats AS (
+    -- Trigger-maintained rollup; only the last minute needs an (indexed) look at code_chunks
     SELECT 
-        (SELECT COUNT(*) FROM files) as total_files,
-        (SELECT COUNT(*) FROM functions) as total_functions,
-        (SELECT COUNT(*) FROM code_chunks) as total_chunks,
-        (SELECT COUNT(*) FROM code_chunks WHERE enriched_at IS NOT NULL) as enriched_chunks,
+        files as total_files,
+        functions as total_functions,
+        chunks as total_chunks,
+        enriched_chunks,
         (SELECT COUNT(*) FROM code_chunks WHERE enriched_at > NOW() - INTERVAL '1 minute') as chunks_last_minute,
-        (SELECT ROUND(AVG(complexity_score)::numeric, 2) FROM code_chunks WHERE complexity_score IS NOT NULL) as avg_complexity,
-        (SELECT ROUND(AVG(business_impact_score)::numeric, 2) FROM code_chunks WHERE business_impact_score IS NOT NULL) as avg_business_impact
+        ROUND((complexity_sum / NULLIF(complexity_count, 0))::numeric, 2) as avg_complexity,
+        ROUND((impact_sum / NULLIF(impact_count, 0))::numeric, 2) as avg_business_impact
+    FROM stats_current
 )
 SELECT 
     'Files: ' || total_files || 
@@ -76,7 +78,7 @@ WHERE parsed_at > NOW() - INTERVAL '5 minutes';
 # fi
 
 # Show estimated completion time if enrichment is running
-PENDING=$(docker-compose exec postgres psql -U analyzer -d codeanalysis -t -A -c "SELECT COUNT(*) FROM code_chunks WHERE enriched_at IS NULL;" 2>/dev/null | tr -d ' ')
+PENDING=$(docker-compose exec postgres psql -U analyzer -d codeanalysis -t -A -c "SELECT chunks - enriched_chunks FROM stats_current;" 2>/dev/null | tr -d ' ')
 RECENT_RATE=$(docker-compose exec postgres psql -U analyzer -d codeanalysis -t -A -c "SELECT COUNT(*) FROM code_chunks WHERE enriched_at > NOW() - INTERVAL '5 minutes';" 2>/dev/null | tr -d ' ')
 
 if [ "$PENDING" -gt 0 ] && [ "$RECENT_RATE" -gt 0 ]; then
@@ -2,6 +2,8 @@
 
 -- Enable required extensions FIRST
 CREATE EXTENSION IF NOT EXISTS vector;
+-- Scalar equality in GiST indexes (file/function id + line range)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
 
 -- Files table (new) - track individual files
 CREATE TABLE files (
@@ -39,6 +41,12 @@ CREATE TABLE functions (
     lines_of_code INTEGER,
     created_at TIMESTAMP DEFAULT NOW(),
     updated_at TIMESTAMP DEFAULT NOW(),
+    -- Names as written and split at camelCase boundaries, for full-text search
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple',
+            COALESCE(function_name, '') || ' ' || COALESCE(class_name, '') || ' ' ||
+            regexp_replace(COALESCE(function_name, '') || ' ' || COALESCE(class_name, ''), '([a-z0-9])([A-Z])', '\1 \2', 'g')), 'A')
+    ) STORED,
     CONSTRAINT unique_function UNIQUE(file_id, function_name)
 );
 
@@ -58,14 +66,112 @@ CREATE TABLE code_chunks (
     summary TEXT,
     embedding vector(384),
     complexity_score REAL,
+    complexity_source VARCHAR(20),
     business_impact_score REAL,
     grouped BOOLEAN DEFAULT FALSE,
     chunk_length_lines INTEGER DEFAULT 0,
+    enrichment_source VARCHAR(50),
+    heuristic_rule VARCHAR(50),
+    enrichment_versions JSONB,
+    enrich_attempts INTEGER DEFAULT 0,
+    embedding_attempts INTEGER DEFAULT 0,
+    next_attempt_at TIMESTAMP,
+    last_error TEXT,
+    dead_lettered_at TIMESTAMP,
     enriched_at TIMESTAMP,
     created_at TIMESTAMP DEFAULT NOW(),
+    -- Summary (stemmed and as written) ranks above identifiers from the code
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(summary, '')), 'A') ||
+        setweight(to_tsvector('simple', COALESCE(summary, '')), 'B') ||
+        setweight(to_tsvector('simple', code || ' ' || regexp_replace(code, '([a-z0-9])([A-Z])', '\1 \2', 'g')), 'C')
+    ) STORED,
     CONSTRAINT unique_chunk UNIQUE(function_id, chunk_index)
 );
 
+-- Last enriched version of each chunk position, kept when the parser replaces
+-- a function's chunks so edits can be re-summarized from a diff
+CREATE TABLE chunk_history (
+    function_id INTEGER NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    code TEXT NOT NULL,
+    code_hash VARCHAR(64),
+    summary TEXT,
+    embedding vector(384),
+    complexity_score REAL,
+    complexity_source VARCHAR(20),
+    business_impact_score REAL,
+    enrichment_source VARCHAR(50),
+    heuristic_rule VARCHAR(50),
+    enrichment_versions JSONB,
+    enriched_at TIMESTAMP,
+    archived_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY(function_id, chunk_index)
+);
+
+CREATE OR REPLACE FUNCTION archive_enriched_chunk() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO chunk_history
+        (function_id, chunk_index, code, code_hash, summary, embedding,
+         complexity_score, complexity_source, business_impact_score, enrichment_source, heuristic_rule,
+         enrichment_versions, enriched_at)
+    VALUES
+        (OLD.function_id, OLD.chunk_index, OLD.code, OLD.code_hash, OLD.summary, OLD.embedding,
+         OLD.complexity_score, OLD.complexity_source, OLD.business_impact_score, OLD.enrichment_source, OLD.heuristic_rule,
+         OLD.enrichment_versions, OLD.enriched_at)
+    ON CONFLICT (function_id, chunk_index) DO UPDATE SET
+        code = EXCLUDED.code,
+        code_hash = EXCLUDED.code_hash,
+        summary = EXCLUDED.summary,
+        embedding = EXCLUDED.embedding,
+        complexity_score = EXCLUDED.complexity_score,
+        complexity_source = EXCLUDED.complexity_source,
+        business_impact_score = EXCLUDED.business_impact_score,
+        enrichment_source = EXCLUDED.enrichment_source,
+        heuristic_rule = EXCLUDED.heuristic_rule,
+        enrichment_versions = EXCLUDED.enrichment_versions,
+        enriched_at = EXCLUDED.enriched_at,
+        archived_at = NOW();
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_archive_enriched_chunk
+    BEFORE DELETE ON code_chunks
+    FOR EACH ROW
+    WHEN (OLD.enriched_at IS NOT NULL AND OLD.summary IS NOT NULL)
+    EXECUTE FUNCTION archive_enriched_chunk();
+
+-- Embeddings written during bulk loads, merged into code_chunks in large batches
+-- (UNLOGGED and without indexes so that staging stays cheap)
+CREATE UNLOGGED TABLE chunk_embedding_staging (
+    chunk_id INTEGER NOT NULL,
+    embedding vector(384) NOT NULL,
+    staged_at TIMESTAMP DEFAULT clock_timestamp()
+);
+
+-- One vector per function: length-weighted mean of its chunk embeddings,
+-- maintained by the enricher (python-enricher/src/pooling.py)
+CREATE TABLE function_embeddings (
+    function_id INTEGER PRIMARY KEY REFERENCES functions(id) ON DELETE CASCADE,
+    embedding vector(384) NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    total_lines INTEGER NOT NULL,
+    source_enriched_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+-- One vector per class (per file), pooled from its function embeddings
+CREATE TABLE class_embeddings (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    class_name VARCHAR(255) NOT NULL,
+    embedding vector(384) NOT NULL,
+    function_count INTEGER NOT NULL,
+    total_lines INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY(file_id, class_name)
+);
+
 -- Business tags
 CREATE TABLE business_tags (
     id SERIAL PRIMARY KEY,
@@ -173,6 +279,33 @@ CREATE TABLE processing_status (
     CONSTRAINT unique_file_stage UNIQUE(file_id, stage)
 );
 
+-- Model bake-off runs (python-enricher/src/bench_models.py)
+CREATE TABLE benchmark_runs (
+    id SERIAL PRIMARY KEY,
+    label VARCHAR(100) NOT NULL,
+    model VARCHAR(200) NOT NULL,
+    endpoint TEXT,
+    embedding_model VARCHAR(200),
+    sample_size INTEGER,
+    sample_seed VARCHAR(100),
+    reference_run_id INTEGER REFERENCES benchmark_runs(id) ON DELETE SET NULL,
+    metrics JSONB,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+-- No foreign key on chunk_id: results outlive re-parsed chunks
+CREATE TABLE benchmark_results (
+    run_id INTEGER REFERENCES benchmark_runs(id) ON DELETE CASCADE,
+    chunk_id INTEGER NOT NULL,
+    summary TEXT,
+    complexity_score REAL,
+    business_impact_score REAL,
+    tags TEXT[],
+    latency_ms REAL,
+    parse_failures INTEGER DEFAULT 0,
+    PRIMARY KEY(run_id, chunk_id)
+);
+
 -- Indexes
 CREATE INDEX idx_files_hash ON files(file_hash);
 CREATE INDEX idx_files_parsed ON files(parsed_at);
@@ -180,11 +313,30 @@ CREATE INDEX idx_functions_file ON functions(file_id);
 CREATE INDEX idx_functions_class ON functions(class_name);
 CREATE INDEX idx_functions_complexity ON functions(cyclomatic_complexity);
 CREATE INDEX idx_functions_name ON functions(function_name);
+CREATE INDEX idx_functions_search ON functions USING gin (search_vector);
+CREATE INDEX idx_functions_updated ON functions(updated_at);
+-- Keyset pagination of /functions and /migration/assessment (same expressions as the API's sort keys)
+CREATE INDEX idx_functions_complexity_keyset ON functions ((COALESCE(cyclomatic_complexity, 0)), (COALESCE(lines_of_code, 0)), id);
+CREATE INDEX idx_functions_lines_keyset ON functions ((COALESCE(lines_of_code, 0)), id);
+CREATE INDEX idx_functions_name_keyset ON functions (function_name, id);
+-- Stacktrace line -> innermost function/chunk (routes/traces.py)
+CREATE INDEX idx_functions_line_range ON functions USING gist (file_id, int4range(start_line, end_line, '[]'))
+    WHERE start_line IS NOT NULL AND end_line IS NOT NULL;
+CREATE INDEX idx_chunks_line_range ON code_chunks USING gist (function_id, int4range(start_line, end_line, '[]'))
+    WHERE start_line IS NOT NULL AND end_line IS NOT NULL;
 CREATE INDEX idx_chunks_function ON code_chunks(function_id);
 CREATE INDEX idx_chunks_type ON code_chunks(chunk_type);
 CREATE INDEX idx_chunks_nesting ON code_chunks(nesting_level);
 CREATE INDEX idx_chunks_complexity ON code_chunks(complexity_score);
 CREATE INDEX idx_chunks_enriched ON code_chunks(enriched_at) WHERE enriched_at IS NOT NULL;
+CREATE INDEX idx_chunks_pending ON code_chunks(function_id, chunk_index) WHERE enriched_at IS NULL AND dead_lettered_at IS NULL;
+CREATE INDEX idx_chunks_dead_letter ON code_chunks(dead_lettered_at) WHERE dead_lettered_at IS NOT NULL;
+CREATE INDEX idx_chunks_missing_embedding ON code_chunks(id) WHERE enriched_at IS NOT NULL AND embedding IS NULL;
+CREATE INDEX idx_chunks_heuristic ON code_chunks(enrichment_source) WHERE enrichment_source = 'heuristic';
+CREATE INDEX idx_chunks_search ON code_chunks USING gin (search_vector);
+CREATE INDEX idx_chunks_embedding_hnsw ON code_chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX idx_function_embeddings_hnsw ON function_embeddings USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX idx_class_embeddings_hnsw ON class_embeddings USING hnsw (embedding vector_cosine_ops);
 CREATE INDEX idx_chunk_tags_chunk ON chunk_business_tags(chunk_id);
 CREATE INDEX idx_chunk_tags_tag ON chunk_business_tags(tag_id);
 CREATE INDEX idx_chunk_tags_confidence ON chunk_business_tags(confidence);
@@ -196,3 +348,521 @@ CREATE INDEX idx_patterns_chunk ON pattern_occurrences(chunk_id);
 CREATE INDEX idx_queries_category ON chunk_example_queries(category);
 CREATE INDEX idx_migration_priority ON migration_assessments(migration_priority);
 CREATE INDEX idx_status_stage ON processing_status(stage);
+
+-- API response cache invalidation: one notification per writing statement,
+-- delivered on commit (api/src/routes/cache.py listens on this channel)
+CREATE OR REPLACE FUNCTION notify_cache_invalidate() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('cache_invalidate', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_cache_invalidate_files
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON files
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidate();
+
+CREATE TRIGGER trg_cache_invalidate_functions
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON functions
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidate();
+
+CREATE TRIGGER trg_cache_invalidate_chunks
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON code_chunks
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidate();
+
+CREATE TRIGGER trg_cache_invalidate_tags
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON business_tags
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidate();
+
+-- Statistics rollups: writers append signed deltas (statement-level triggers
+-- below), compact_stats_rollup() folds them into the base rows and
+-- reconcile_stats_rollup() recomputes everything from the source tables.
+-- Appending instead of updating one shared row keeps parser transactions and
+-- enricher updates from queueing (or deadlocking) on the rollup.
+CREATE TABLE stats_rollup (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    files BIGINT NOT NULL DEFAULT 0,
+    functions BIGINT NOT NULL DEFAULT 0,
+    chunks BIGINT NOT NULL DEFAULT 0,
+    enriched_chunks BIGINT NOT NULL DEFAULT 0,
+    dead_lettered_chunks BIGINT NOT NULL DEFAULT 0,
+    complexity_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    complexity_count BIGINT NOT NULL DEFAULT 0,
+    impact_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    impact_count BIGINT NOT NULL DEFAULT 0,
+    function_complexity_sum BIGINT NOT NULL DEFAULT 0,
+    function_complexity_count BIGINT NOT NULL DEFAULT 0,
+    business_tags BIGINT NOT NULL DEFAULT 0,
+    reconciled_at TIMESTAMP
+);
+INSERT INTO stats_rollup DEFAULT VALUES;
+
+CREATE TABLE stats_rollup_deltas (
+    files BIGINT NOT NULL DEFAULT 0,
+    functions BIGINT NOT NULL DEFAULT 0,
+    chunks BIGINT NOT NULL DEFAULT 0,
+    enriched_chunks BIGINT NOT NULL DEFAULT 0,
+    dead_lettered_chunks BIGINT NOT NULL DEFAULT 0,
+    complexity_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    complexity_count BIGINT NOT NULL DEFAULT 0,
+    impact_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    impact_count BIGINT NOT NULL DEFAULT 0,
+    function_complexity_sum BIGINT NOT NULL DEFAULT 0,
+    function_complexity_count BIGINT NOT NULL DEFAULT 0,
+    business_tags BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE stats_nesting (
+    nesting_level INTEGER PRIMARY KEY,
+    chunks BIGINT NOT NULL
+);
+
+CREATE TABLE stats_nesting_deltas (
+    nesting_level INTEGER NOT NULL,
+    chunks BIGINT NOT NULL
+);
+
+-- Chunks with complexity_score > 0.7 per function; a function counts
+-- towards high_complexity_functions while it has at least one
+CREATE TABLE stats_high_complexity (
+    function_id INTEGER PRIMARY KEY,
+    chunks BIGINT NOT NULL
+);
+
+CREATE TABLE stats_high_complexity_deltas (
+    function_id INTEGER NOT NULL,
+    chunks BIGINT NOT NULL
+);
+
+-- Enriched chunks per hour of enriched_at
+CREATE TABLE stats_enrichment_hourly (
+    hour TIMESTAMP PRIMARY KEY,
+    chunks BIGINT NOT NULL
+);
+
+CREATE TABLE stats_enrichment_hourly_deltas (
+    hour TIMESTAMP NOT NULL,
+    chunks BIGINT NOT NULL
+);
+
+CREATE VIEW stats_high_complexity_current AS
+SELECT function_id, SUM(chunks)::bigint as chunks
+FROM (
+    SELECT function_id, chunks FROM stats_high_complexity
+    UNION ALL
+    SELECT function_id, chunks FROM stats_high_complexity_deltas
+) h
+GROUP BY function_id
+HAVING SUM(chunks) > 0;
+
+CREATE VIEW stats_current AS
+SELECT
+    r.files + COALESCE(d.files, 0) as files,
+    r.functions + COALESCE(d.functions, 0) as functions,
+    r.chunks + COALESCE(d.chunks, 0) as chunks,
+    r.enriched_chunks + COALESCE(d.enriched_chunks, 0) as enriched_chunks,
+    r.dead_lettered_chunks + COALESCE(d.dead_lettered_chunks, 0) as dead_lettered_chunks,
+    r.complexity_sum + COALESCE(d.complexity_sum, 0) as complexity_sum,
+    r.complexity_count + COALESCE(d.complexity_count, 0) as complexity_count,
+    r.impact_sum + COALESCE(d.impact_sum, 0) as impact_sum,
+    r.impact_count + COALESCE(d.impact_count, 0) as impact_count,
+    r.function_complexity_sum + COALESCE(d.function_complexity_sum, 0) as function_complexity_sum,
+    r.function_complexity_count + COALESCE(d.function_complexity_count, 0) as function_complexity_count,
+    r.business_tags + COALESCE(d.business_tags, 0) as business_tags,
+    (SELECT COUNT(*) FROM stats_high_complexity_current) as high_complexity_functions,
+    r.reconciled_at
+FROM stats_rollup r
+CROSS JOIN (
+    SELECT SUM(files)::bigint as files, SUM(functions)::bigint as functions, SUM(chunks)::bigint as chunks,
+           SUM(enriched_chunks)::bigint as enriched_chunks, SUM(dead_lettered_chunks)::bigint as dead_lettered_chunks,
+           SUM(complexity_sum) as complexity_sum, SUM(complexity_count)::bigint as complexity_count,
+           SUM(impact_sum) as impact_sum, SUM(impact_count)::bigint as impact_count,
+           SUM(function_complexity_sum)::bigint as function_complexity_sum,
+           SUM(function_complexity_count)::bigint as function_complexity_count,
+           SUM(business_tags)::bigint as business_tags
+    FROM stats_rollup_deltas
+) d;
+
+CREATE VIEW stats_nesting_current AS
+SELECT nesting_level, SUM(chunks)::bigint as chunks
+FROM (
+    SELECT nesting_level, chunks FROM stats_nesting
+    UNION ALL
+    SELECT nesting_level, chunks FROM stats_nesting_deltas
+) n
+GROUP BY nesting_level
+HAVING SUM(chunks) <> 0;
+
+CREATE VIEW stats_enrichment_hourly_current AS
+SELECT hour, SUM(chunks)::bigint as chunks
+FROM (
+    SELECT hour, chunks FROM stats_enrichment_hourly
+    UNION ALL
+    SELECT hour, chunks FROM stats_enrichment_hourly_deltas
+) h
+GROUP BY hour
+HAVING SUM(chunks) <> 0;
+
+-- Signed rows of the statement: +1 for new_rows, -1 for old_rows
+CREATE OR REPLACE FUNCTION stats_transition_source(op TEXT, columns TEXT) RETURNS TEXT AS $$
+BEGIN
+    RETURN CASE op
+        WHEN 'INSERT' THEN format('SELECT 1 as sign, %s FROM new_rows', columns)
+        WHEN 'DELETE' THEN format('SELECT -1 as sign, %s FROM old_rows', columns)
+        ELSE format('SELECT 1 as sign, %1$s FROM new_rows UNION ALL SELECT -1, %1$s FROM old_rows', columns)
+    END;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION stats_rollup_chunks() RETURNS TRIGGER AS $$
+DECLARE
+    source TEXT := stats_transition_source(TG_OP,
+        'function_id, nesting_level, enriched_at, dead_lettered_at, complexity_score, business_impact_score');
+BEGIN
+    EXECUTE format($q$
+        INSERT INTO stats_rollup_deltas (chunks, enriched_chunks, dead_lettered_chunks,
+                                         complexity_sum, complexity_count, impact_sum, impact_count)
+        SELECT * FROM (
+            SELECT COALESCE(SUM(sign), 0) as chunks,
+                   COALESCE(SUM(sign) FILTER (WHERE enriched_at IS NOT NULL), 0) as enriched_chunks,
+                   COALESCE(SUM(sign) FILTER (WHERE dead_lettered_at IS NOT NULL), 0) as dead_lettered_chunks,
+                   COALESCE(SUM(sign * complexity_score), 0) as complexity_sum,
+                   COALESCE(SUM(sign) FILTER (WHERE complexity_score IS NOT NULL), 0) as complexity_count,
+                   COALESCE(SUM(sign * business_impact_score), 0) as impact_sum,
+                   COALESCE(SUM(sign) FILTER (WHERE business_impact_score IS NOT NULL), 0) as impact_count
+            FROM (%s) c
+        ) d
+        WHERE chunks <> 0 OR enriched_chunks <> 0 OR dead_lettered_chunks <> 0
+           OR complexity_sum <> 0 OR complexity_count <> 0 OR impact_sum <> 0 OR impact_count <> 0
+    $q$, source);
+
+    EXECUTE format($q$
+        INSERT INTO stats_nesting_deltas (nesting_level, chunks)
+        SELECT COALESCE(nesting_level, 0), SUM(sign) FROM (%s) c
+        GROUP BY 1 HAVING SUM(sign) <> 0
+    $q$, source);
+
+    EXECUTE format($q$
+        INSERT INTO stats_high_complexity_deltas (function_id, chunks)
+        SELECT function_id, SUM(sign) FROM (%s) c
+        WHERE complexity_score > 0.7
+        GROUP BY 1 HAVING SUM(sign) <> 0
+    $q$, source);
+
+    EXECUTE format($q$
+        INSERT INTO stats_enrichment_hourly_deltas (hour, chunks)
+        SELECT date_trunc('hour', enriched_at), SUM(sign) FROM (%s) c
+        WHERE enriched_at IS NOT NULL
+        GROUP BY 1 HAVING SUM(sign) <> 0
+    $q$, source);
+
+    -- Wakes the API's progress broadcaster; identical payloads collapse per transaction
+    PERFORM pg_notify('enrichment_progress', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_rollup_functions() RETURNS TRIGGER AS $$
+BEGIN
+    EXECUTE format($q$
+        INSERT INTO stats_rollup_deltas (functions, function_complexity_sum, function_complexity_count)
+        SELECT * FROM (
+            SELECT COALESCE(SUM(sign), 0) as functions,
+                   COALESCE(SUM(sign * cyclomatic_complexity) FILTER (WHERE cyclomatic_complexity > 0), 0) as complexity_sum,
+                   COALESCE(SUM(sign) FILTER (WHERE cyclomatic_complexity > 0), 0) as complexity_count
+            FROM (%s) c
+        ) d
+        WHERE functions <> 0 OR complexity_sum <> 0 OR complexity_count <> 0
+    $q$, stats_transition_source(TG_OP, 'cyclomatic_complexity'));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Files and tags only change in number
+CREATE OR REPLACE FUNCTION stats_rollup_count() RETURNS TRIGGER AS $$
+BEGIN
+    EXECUTE format($q$
+        INSERT INTO stats_rollup_deltas (%I)
+        SELECT SUM(sign) FROM (%s) c HAVING SUM(sign) <> 0
+    $q$, TG_ARGV[0], stats_transition_source(TG_OP, '1 as one'));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_stats_chunks_insert AFTER INSERT ON code_chunks
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_chunks();
+CREATE TRIGGER trg_stats_chunks_update AFTER UPDATE ON code_chunks
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_chunks();
+CREATE TRIGGER trg_stats_chunks_delete AFTER DELETE ON code_chunks
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_chunks();
+
+CREATE TRIGGER trg_stats_functions_insert AFTER INSERT ON functions
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_functions();
+CREATE TRIGGER trg_stats_functions_update AFTER UPDATE ON functions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_functions();
+CREATE TRIGGER trg_stats_functions_delete AFTER DELETE ON functions
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_functions();
+
+CREATE TRIGGER trg_stats_files_insert AFTER INSERT ON files
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_count('files');
+CREATE TRIGGER trg_stats_files_delete AFTER DELETE ON files
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_count('files');
+
+CREATE TRIGGER trg_stats_tags_insert AFTER INSERT ON business_tags
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_count('business_tags');
+CREATE TRIGGER trg_stats_tags_delete AFTER DELETE ON business_tags
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_rollup_count('business_tags');
+
+-- Fold deltas into the base rows; each statement only removes the deltas it added
+CREATE OR REPLACE FUNCTION compact_stats_rollup() RETURNS BIGINT AS $$
+DECLARE
+    folded BIGINT;
+BEGIN
+    WITH d AS (DELETE FROM stats_rollup_deltas RETURNING *),
+    s AS (
+        SELECT COUNT(*) as n,
+               COALESCE(SUM(files), 0) as files, COALESCE(SUM(functions), 0) as functions,
+               COALESCE(SUM(chunks), 0) as chunks, COALESCE(SUM(enriched_chunks), 0) as enriched_chunks,
+               COALESCE(SUM(dead_lettered_chunks), 0) as dead_lettered_chunks,
+               COALESCE(SUM(complexity_sum), 0) as complexity_sum, COALESCE(SUM(complexity_count), 0) as complexity_count,
+               COALESCE(SUM(impact_sum), 0) as impact_sum, COALESCE(SUM(impact_count), 0) as impact_count,
+               COALESCE(SUM(function_complexity_sum), 0) as function_complexity_sum,
+               COALESCE(SUM(function_complexity_count), 0) as function_complexity_count,
+               COALESCE(SUM(business_tags), 0) as business_tags
+        FROM d
+    )
+    UPDATE stats_rollup r SET
+        files = r.files + s.files,
+        functions = r.functions + s.functions,
+        chunks = r.chunks + s.chunks,
+        enriched_chunks = r.enriched_chunks + s.enriched_chunks,
+        dead_lettered_chunks = r.dead_lettered_chunks + s.dead_lettered_chunks,
+        complexity_sum = r.complexity_sum + s.complexity_sum,
+        complexity_count = r.complexity_count + s.complexity_count,
+        impact_sum = r.impact_sum + s.impact_sum,
+        impact_count = r.impact_count + s.impact_count,
+        function_complexity_sum = r.function_complexity_sum + s.function_complexity_sum,
+        function_complexity_count = r.function_complexity_count + s.function_complexity_count,
+        business_tags = r.business_tags + s.business_tags
+    FROM s
+    WHERE s.n > 0
+    RETURNING s.n INTO folded;
+
+    WITH d AS (DELETE FROM stats_nesting_deltas RETURNING *)
+    INSERT INTO stats_nesting (nesting_level, chunks)
+    SELECT nesting_level, SUM(chunks) FROM d GROUP BY nesting_level
+    ON CONFLICT (nesting_level) DO UPDATE SET chunks = stats_nesting.chunks + EXCLUDED.chunks;
+    DELETE FROM stats_nesting WHERE chunks = 0;
+
+    WITH d AS (DELETE FROM stats_high_complexity_deltas RETURNING *)
+    INSERT INTO stats_high_complexity (function_id, chunks)
+    SELECT function_id, SUM(chunks) FROM d GROUP BY function_id
+    ON CONFLICT (function_id) DO UPDATE SET chunks = stats_high_complexity.chunks + EXCLUDED.chunks;
+    DELETE FROM stats_high_complexity WHERE chunks = 0;
+
+    WITH d AS (DELETE FROM stats_enrichment_hourly_deltas RETURNING *)
+    INSERT INTO stats_enrichment_hourly (hour, chunks)
+    SELECT hour, SUM(chunks) FROM d GROUP BY hour
+    ON CONFLICT (hour) DO UPDATE SET chunks = stats_enrichment_hourly.chunks + EXCLUDED.chunks;
+    DELETE FROM stats_enrichment_hourly WHERE chunks = 0;
+
+    RETURN COALESCE(folded, 0);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recompute the totals from the source tables and return the drift that was
+-- corrected. Truth and cleared deltas come from one statement snapshot, so
+-- deltas of transactions committing later still apply on top.
+CREATE OR REPLACE FUNCTION reconcile_stats_rollup() RETURNS JSONB AS $$
+DECLARE
+    drift JSONB;
+BEGIN
+    WITH cleared AS (DELETE FROM stats_rollup_deltas RETURNING *),
+    pending AS (
+        SELECT COALESCE(SUM(files), 0) as files, COALESCE(SUM(functions), 0) as functions,
+               COALESCE(SUM(chunks), 0) as chunks, COALESCE(SUM(enriched_chunks), 0) as enriched_chunks,
+               COALESCE(SUM(dead_lettered_chunks), 0) as dead_lettered_chunks,
+               COALESCE(SUM(business_tags), 0) as business_tags
+        FROM cleared
+    ),
+    truth AS (
+        SELECT
+            (SELECT COUNT(*) FROM files) as files,
+            (SELECT COUNT(*) FROM functions) as functions,
+            (SELECT COUNT(*) FROM business_tags) as business_tags,
+            f.function_complexity_sum, f.function_complexity_count, c.*
+        FROM (
+            SELECT COALESCE(SUM(cyclomatic_complexity) FILTER (WHERE cyclomatic_complexity > 0), 0) as function_complexity_sum,
+                   COUNT(*) FILTER (WHERE cyclomatic_complexity > 0) as function_complexity_count
+            FROM functions
+        ) f,
+        (
+            SELECT COUNT(*) as chunks, COUNT(enriched_at) as enriched_chunks,
+                   COUNT(dead_lettered_at) as dead_lettered_chunks,
+                   COALESCE(SUM(complexity_score), 0) as complexity_sum, COUNT(complexity_score) as complexity_count,
+                   COALESCE(SUM(business_impact_score), 0) as impact_sum, COUNT(business_impact_score) as impact_count
+            FROM code_chunks
+        ) c
+    ),
+    before AS (
+        SELECT r.files + p.files as files, r.functions + p.functions as functions,
+               r.chunks + p.chunks as chunks, r.enriched_chunks + p.enriched_chunks as enriched_chunks,
+               r.dead_lettered_chunks + p.dead_lettered_chunks as dead_lettered_chunks,
+               r.business_tags + p.business_tags as business_tags
+        FROM stats_rollup r, pending p
+    )
+    UPDATE stats_rollup SET
+        files = t.files,
+        functions = t.functions,
+        chunks = t.chunks,
+        enriched_chunks = t.enriched_chunks,
+        dead_lettered_chunks = t.dead_lettered_chunks,
+        complexity_sum = t.complexity_sum,
+        complexity_count = t.complexity_count,
+        impact_sum = t.impact_sum,
+        impact_count = t.impact_count,
+        function_complexity_sum = t.function_complexity_sum,
+        function_complexity_count = t.function_complexity_count,
+        business_tags = t.business_tags,
+        reconciled_at = NOW()
+    FROM truth t, before b
+    RETURNING jsonb_build_object(
+        'files', t.files - b.files,
+        'functions', t.functions - b.functions,
+        'chunks', t.chunks - b.chunks,
+        'enriched_chunks', t.enriched_chunks - b.enriched_chunks,
+        'dead_lettered_chunks', t.dead_lettered_chunks - b.dead_lettered_chunks,
+        'business_tags', t.business_tags - b.business_tags
+    ) INTO drift;
+
+    WITH cleared AS (DELETE FROM stats_nesting_deltas RETURNING 1),
+    truth AS (
+        SELECT COALESCE(nesting_level, 0) as nesting_level, COUNT(*) as chunks FROM code_chunks GROUP BY 1
+    ),
+    stale AS (DELETE FROM stats_nesting WHERE nesting_level NOT IN (SELECT nesting_level FROM truth) RETURNING 1)
+    INSERT INTO stats_nesting (nesting_level, chunks)
+    SELECT nesting_level, chunks FROM truth
+    ON CONFLICT (nesting_level) DO UPDATE SET chunks = EXCLUDED.chunks;
+
+    WITH cleared AS (DELETE FROM stats_high_complexity_deltas RETURNING 1),
+    truth AS (
+        SELECT function_id, COUNT(*) as chunks FROM code_chunks WHERE complexity_score > 0.7 GROUP BY 1
+    ),
+    stale AS (DELETE FROM stats_high_complexity WHERE function_id NOT IN (SELECT function_id FROM truth) RETURNING 1)
+    INSERT INTO stats_high_complexity (function_id, chunks)
+    SELECT function_id, chunks FROM truth
+    ON CONFLICT (function_id) DO UPDATE SET chunks = EXCLUDED.chunks;
+
+    WITH cleared AS (DELETE FROM stats_enrichment_hourly_deltas RETURNING 1),
+    truth AS (
+        SELECT date_trunc('hour', enriched_at) as hour, COUNT(*) as chunks
+        FROM code_chunks WHERE enriched_at IS NOT NULL GROUP BY 1
+    ),
+    stale AS (DELETE FROM stats_enrichment_hourly WHERE hour NOT IN (SELECT hour FROM truth) RETURNING 1)
+    INSERT INTO stats_enrichment_hourly (hour, chunks)
+    SELECT hour, chunks FROM truth
+    ON CONFLICT (hour) DO UPDATE SET chunks = EXCLUDED.chunks;
+
+    RETURN drift;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recurring traces, keyed by fingerprint (frames without lines or arguments,
+-- see routes/traces.py). hits counts every occurrence; hits - computations
+-- were served from the cache or came from bulk ingestion.
+CREATE TABLE trace_fingerprints (
+    fingerprint CHAR(40) PRIMARY KEY,
+    normalized TEXT NOT NULL,
+    hits BIGINT NOT NULL DEFAULT 1,
+    computations BIGINT NOT NULL DEFAULT 0,
+    first_seen TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_seen TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Cached /analyze results. They depend on the frame lines (innermost function
+-- and chunk, "line N" in summaries), so they are keyed by the trace including
+-- its lines; one fingerprint can have several.
+CREATE TABLE trace_results (
+    result_key CHAR(40) PRIMARY KEY,
+    fingerprint CHAR(40) NOT NULL REFERENCES trace_fingerprints(fingerprint) ON DELETE CASCADE,
+    result JSONB,
+    function_ids INTEGER[] NOT NULL DEFAULT '{}',
+    -- Some frame did not resolve; any newly parsed function may change the result
+    unresolved BOOLEAN NOT NULL DEFAULT FALSE,
+    -- Bumped by invalidation, so results computed across it are not stored
+    version INTEGER NOT NULL DEFAULT 0,
+    computed_at TIMESTAMP
+);
+
+CREATE INDEX idx_trace_results_fingerprint ON trace_results(fingerprint);
+CREATE INDEX idx_trace_results_functions ON trace_results USING gin (function_ids);
+CREATE INDEX idx_trace_results_unresolved ON trace_results(result_key) WHERE unresolved;
+
+-- Re-parsed or re-enriched functions drop the cached results that reference them
+CREATE OR REPLACE FUNCTION invalidate_trace_results() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'functions' AND TG_OP = 'INSERT' THEN
+        UPDATE trace_results SET result = NULL, version = version + 1
+        WHERE unresolved;
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format($q$
+        UPDATE trace_results SET result = NULL, version = version + 1
+        WHERE function_ids && ARRAY(SELECT DISTINCT %I FROM %I)
+    $q$,
+        CASE TG_TABLE_NAME WHEN 'functions' THEN 'id' ELSE 'function_id' END,
+        CASE TG_OP WHEN 'DELETE' THEN 'old_rows' ELSE 'new_rows' END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_trace_results_functions_insert AFTER INSERT ON functions
+    FOR EACH STATEMENT EXECUTE FUNCTION invalidate_trace_results();
+CREATE TRIGGER trg_trace_results_functions_update AFTER UPDATE ON functions
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION invalidate_trace_results();
+CREATE TRIGGER trg_trace_results_functions_delete AFTER DELETE ON functions
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION invalidate_trace_results();
+CREATE TRIGGER trg_trace_results_chunks_insert AFTER INSERT ON code_chunks
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION invalidate_trace_results();
+CREATE TRIGGER trg_trace_results_chunks_update AFTER UPDATE ON code_chunks
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION invalidate_trace_results();
+CREATE TRIGGER trg_trace_results_chunks_delete AFTER DELETE ON code_chunks
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION invalidate_trace_results();
+
+-- Frame hit counts from bulk trace ingestion (POST /traces/ingest). Keyed by
+-- chunk_index rather than chunk id, which changes when a function is re-parsed;
+-- -1 counts frames whose line lies outside every chunk of the function.
+CREATE TABLE trace_frame_hits (
+    function_id INTEGER NOT NULL REFERENCES functions(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    hits BIGINT NOT NULL DEFAULT 0,
+    -- Frames that were the innermost resolved frame of their trace
+    innermost_hits BIGINT NOT NULL DEFAULT 0,
+    first_seen TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_seen TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (function_id, chunk_index)
+);
+
+-- Near-duplicate chunk clusters for refactoring reports, rebuilt as a whole by
+-- python-enricher/src/duplicates.py. Cluster ids are ranks: 1 is the cluster
+-- with the most duplicated lines.
+CREATE TABLE duplicate_clusters (
+    id INTEGER PRIMARY KEY,
+    size INTEGER NOT NULL,
+    function_count INTEGER NOT NULL,
+    total_lines INTEGER NOT NULL,
+    avg_similarity REAL NOT NULL,
+    threshold REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE duplicate_cluster_members (
+    cluster_id INTEGER NOT NULL REFERENCES duplicate_clusters(id) ON DELETE CASCADE,
+    chunk_id INTEGER NOT NULL REFERENCES code_chunks(id) ON DELETE CASCADE,
+    -- Cosine similarity to the closest chunk of another function in the cluster
+    best_similarity REAL NOT NULL,
+    PRIMARY KEY (cluster_id, chunk_id)
+);
+
+CREATE INDEX idx_duplicate_members_chunk ON duplicate_cluster_members(chunk_id);